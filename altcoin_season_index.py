@@ -1,11 +1,18 @@
 import os
+import math
 import requests
 import logging
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from logger import logger
+from http_cache import cached_get
 
 class AltcoinSeasonIndex:
+    # CoinGecko /coins/markets returns at most 250 coins per page
+    MAX_PER_PAGE = 250
+
     def __init__(self):
         """
         Initialization of Altcoin Season Index module
@@ -21,9 +28,12 @@ class AltcoinSeasonIndex:
         # Import configuration from config.py
         try:
             from config import ASI_VS_CURRENCY, ASI_TOP_N, ASI_PERIOD, ASI_THRESHOLD_STRONG, ASI_THRESHOLD_MODERATE, ASI_THRESHOLD_WEAK
+            from config import ASI_PERIODS, ASI_SNAPSHOT_TTL
             self.vs_currency = ASI_VS_CURRENCY
             self.top_n = ASI_TOP_N
             self.period = ASI_PERIOD
+            self.periods = ASI_PERIODS
+            self.snapshot_ttl = ASI_SNAPSHOT_TTL
             self.thresholds = {
                 'strong': ASI_THRESHOLD_STRONG,
                 'moderate': ASI_THRESHOLD_MODERATE,
@@ -34,46 +44,92 @@ class AltcoinSeasonIndex:
             self.vs_currency = os.getenv('ASI_VS_CURRENCY', 'usd')
             self.top_n = int(os.getenv('ASI_TOP_N', '50'))
             self.period = os.getenv('ASI_PERIOD', '30d')
+            self.periods = tuple(p.strip() for p in os.getenv('ASI_PERIODS', '7d,30d,1y').split(',') if p.strip())
+            self.snapshot_ttl = int(os.getenv('ASI_SNAPSHOT_TTL', '300'))
             self.thresholds = {
                 'strong': float(os.getenv('ASI_THRESHOLD_STRONG', '0.75')),
                 'moderate': float(os.getenv('ASI_THRESHOLD_MODERATE', '0.50')),
                 'weak': float(os.getenv('ASI_THRESHOLD_WEAK', '0.25')),
             }
         
+        # The configured period is always part of the multi-period request
+        if self.period not in self.periods:
+            self.periods = tuple(self.periods) + (self.period,)
+        
+        # Market snapshot shared by all periods: (fetched_at, data)
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+        
         self.logger.info(f"Initialized Altcoin Season Index module with top {self.top_n} coins, {self.period} period")
         self.logger.info(f"Thresholds: Strong={self.thresholds['strong']}, Moderate={self.thresholds['moderate']}, Weak={self.thresholds['weak']}")
 
-    def fetch_market_data(self):
+    def _fetch_page(self, page, per_page):
         """
-        Fetches market data for top N coins from CoinGecko API
+        Fetches one page of /coins/markets with price changes for all periods
         
         Returns:
-            list: List of coin data dictionaries or None if error
+            list: Coin data dictionaries of the page
+            
+        Raises:
+            requests.RequestException: on HTTP errors
         """
         url = 'https://api.coingecko.com/api/v3/coins/markets'
         params = {
             'vs_currency': self.vs_currency,
             'order': 'market_cap_desc',
-            'per_page': self.top_n,
-            'page': 1,
-            'price_change_percentage': '30d'  # Hardcoded 30d to match expected API format
+            'per_page': per_page,
+            'page': page,
+            'price_change_percentage': ','.join(self.periods)
         }
+        response = cached_get(url, params=params, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_market_data(self, force_refresh=False):
+        """
+        Fetches market data for top N coins from CoinGecko API
         
-        try:
-            self.logger.info(f"Fetching market data for top {self.top_n} coins from CoinGecko")
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            self.logger.error(f"Error fetching market data from CoinGecko: {str(e)}")
-            return None
+        One request returns price changes for every period in ASI_PERIODS.
+        When ASI_TOP_N exceeds one page (250 coins), the pages are fetched
+        concurrently. The snapshot is reused for ASI_SNAPSHOT_TTL seconds, so
+        the index for every period comes from the same fetch.
+        
+        Args:
+            force_refresh (bool): Ignore the cached snapshot
+        
+        Returns:
+            list: List of coin data dictionaries or None if error
+        """
+        with self._snapshot_lock:
+            if (not force_refresh and self._snapshot
+                    and time.time() - self._snapshot[0] < self.snapshot_ttl):
+                return self._snapshot[1]
+            
+            per_page = min(self.top_n, self.MAX_PER_PAGE)
+            pages = math.ceil(self.top_n / per_page)
+            try:
+                self.logger.info(f"Fetching market data for top {self.top_n} coins from CoinGecko "
+                                 f"({pages} page(s), periods {','.join(self.periods)})")
+                if pages == 1:
+                    results = [self._fetch_page(1, per_page)]
+                else:
+                    with ThreadPoolExecutor(max_workers=min(pages, 4)) as executor:
+                        results = list(executor.map(lambda page: self._fetch_page(page, per_page), range(1, pages + 1)))
+            except requests.RequestException as e:
+                self.logger.error(f"Error fetching market data from CoinGecko: {str(e)}")
+                return None
+            
+            data = [coin for page_data in results for coin in page_data][:self.top_n]
+            self._snapshot = (time.time(), data)
+            return data
 
-    def calculate_altseason_index(self, data):
+    def calculate_altseason_index(self, data, period=None):
         """
         Calculates the Altcoin Season Index based on market data
         
         Args:
             data (list): List of coin data dictionaries from CoinGecko API
+            period (str, optional): Period such as '7d', '30d', '1y' (ASI_PERIOD by default)
             
         Returns:
             tuple: (index_value, btc_performance) or (None, None) if error
@@ -88,7 +144,7 @@ class AltcoinSeasonIndex:
             return None, None
         
         # Get BTC performance for the period
-        period_key = 'price_change_percentage_30d_in_currency'  # Hardcoded to match API response
+        period_key = f'price_change_percentage_{period or self.period}_in_currency'
         btc_perf = btc.get(period_key, 0)
         if btc_perf is None:
             btc_perf = 0
@@ -114,25 +170,110 @@ class AltcoinSeasonIndex:
         self.logger.info(f"Altcoin Season Index: {index:.2f}, BTC performance: {btc_perf:.2f}%")
         return index, btc_perf
 
-    def get_altseason_index(self):
+    def calculate_period_indices(self, data):
+        """
+        Calculates the index for every configured period from one market snapshot
+        
+        Args:
+            data (list): List of coin data dictionaries from CoinGecko API
+            
+        Returns:
+            dict: {period: {'index', 'btc_performance'}} for periods with data
+        """
+        indices = {}
+        for period in self.periods:
+            index, btc_perf = self.calculate_altseason_index(data, period)
+            if index is not None:
+                indices[period] = {
+                    'index': round(float(index), 2),
+                    'btc_performance': round(float(btc_perf), 2),
+                }
+        return indices
+
+    def _period_days(self):
+        """
+        Converts the configured period ('7d', '30d', '1y') to days
+        
+        Returns:
+            int: Number of days
+        """
+        period = str(self.period).strip().lower()
+        if period.endswith('y'):
+            return int(period[:-1] or 1) * 365
+        return int(period.rstrip('d') or 30)
+
+    def calculate_from_price_matrix(self, prices, period_days=None):
+        """
+        Calculates the Altcoin Season Index from a daily close-price matrix
+        
+        N-day returns of all coins are computed at once from the matrix
+        (rows - days, columns - coin symbols, BTC included); the index is the
+        share of coins with a return above BTC, as in calculate_altseason_index.
+        
+        Args:
+            prices (pandas.DataFrame): Daily close prices
+            period_days (int, optional): Return period in days (ASI_PERIOD by default)
+            
+        Returns:
+            tuple: (index_value, btc_performance, coins_analyzed) or (None, None, 0) if error
+        """
+        if prices is None or prices.empty or 'BTC' not in prices.columns:
+            self.logger.error("BTC not found in price matrix")
+            return None, None, 0
+        period_days = period_days or self._period_days()
+        if len(prices) <= period_days:
+            self.logger.error(f"Price matrix is shorter than the {period_days}-day period")
+            return None, None, 0
+        
+        # Доходность за период по всем монетам одной операцией над последней строкой
+        returns = (prices.iloc[-1] / prices.iloc[-1 - period_days] - 1) * 100
+        returns = returns.dropna()
+        if 'BTC' not in returns.index:
+            self.logger.error("No BTC return for the period")
+            return None, None, 0
+        btc_perf = float(returns['BTC'])
+        index = float((returns > btc_perf).mean())
+        
+        self.logger.info(f"Altcoin Season Index (price matrix, {len(returns)} coins, {period_days}d): "
+                         f"{index:.2f}, BTC performance: {btc_perf:.2f}%")
+        return index, btc_perf, len(returns)
+
+    def get_altseason_index(self, prices=None):
         """
         Gets the current Altcoin Season Index
         
+        Args:
+            prices (pandas.DataFrame, optional): Daily close-price matrix already loaded
+                                                 for Market Breadth; if given, the index is
+                                                 calculated locally without a CoinGecko request
+        
         Returns:
             dict: Dictionary with index data or None in case of error
         """
         try:
-            # Fetch market data
-            market_data = self.fetch_market_data()
-            if not market_data:
-                self.logger.error("Failed to fetch market data")
-                return None
+            if prices is not None:
+                index, btc_perf, coins_analyzed = self.calculate_from_price_matrix(prices)
+                source = 'price_matrix'
+            else:
+                index, btc_perf, coins_analyzed = None, None, 0
+            periods = None
             
-            # Calculate the index
-            index, btc_perf = self.calculate_altseason_index(market_data)
             if index is None:
-                self.logger.error("Failed to calculate Altcoin Season Index")
-                return None
+                # Fetch market data
+                market_data = self.fetch_market_data()
+                if not market_data:
+                    self.logger.error("Failed to fetch market data")
+                    return None
+                
+                # Calculate the index
+                index, btc_perf = self.calculate_altseason_index(market_data)
+                if index is None:
+                    self.logger.error("Failed to calculate Altcoin Season Index")
+                    return None
+                coins_analyzed = len(market_data)
+                source = 'coingecko'
+                # Every configured period from the same snapshot, without extra requests
+                periods = self.calculate_period_indices(market_data)
             
             # Determine market signal based on the index
             signal, status, description = self._determine_market_signal(index)
@@ -147,8 +288,11 @@ class AltcoinSeasonIndex:
                 'timestamp': int(time.time()),
                 'date': datetime.now().strftime('%Y-%m-%d'),
                 'period': self.period,
-                'coins_analyzed': self.top_n
+                'coins_analyzed': coins_analyzed,
+                'source': source
             }
+            if periods:
+                result['periods'] = periods
             
             return result
             
@@ -0,0 +1,196 @@
+import os
+import json
+import bisect
+import threading
+from logger import logger
+from history_storage import atomic_write
+
+
+def compute_altseason_series(prices, windows, min_coins=10):
+    """
+    Altcoin Season Index за каждый день матрицы цен для нескольких окон
+
+    Доходности всех монет за N дней считаются сразу для всей матрицы
+    (prices / prices.shift(N)), затем по каждой дате - доля монет с доходностью
+    выше BTC. Дни, где BTC нет данных или монет меньше min_coins, пропускаются.
+
+    Args:
+        prices (pandas.DataFrame): Дневные цены закрытия (строки - даты, столбцы - символы, включая BTC)
+        windows (iterable): Окна в днях, например (7, 30, 90)
+        min_coins (int): Минимальное число монет с доходностью за день
+
+    Returns:
+        dict: {'dates': [...], 'windows': {'30': {'index': [...], 'btc_performance': [...]}}}
+              (значения None для пропущенных дней)
+    """
+    if prices is None or prices.empty or 'BTC' not in prices.columns:
+        return {'dates': [], 'windows': {}}
+
+    result = {'dates': [date.strftime('%Y-%m-%d') for date in prices.index], 'windows': {}}
+    for window in windows:
+        returns = prices / prices.shift(window) - 1
+        btc = returns['BTC']
+        counts = returns.notna().sum(axis=1)
+        # Сравнение с NaN дает False, поэтому монеты без данных не учитываются
+        ahead = returns.gt(btc, axis=0).sum(axis=1)
+        index = (ahead / counts).where(btc.notna() & (counts >= min_coins))
+        btc_performance = (btc * 100).where(index.notna())
+        result['windows'][str(window)] = {
+            'index': [None if value != value else round(float(value), 4) for value in index],
+            'btc_performance': [None if value != value else round(float(value), 2) for value in btc_performance],
+        }
+    return result
+
+
+class AltseasonSeries:
+    """
+    Сохраненный дневной ряд Altcoin Season Index по нескольким окнам
+
+    Хранится по столбцам в JSON-файле и перечитывается только при изменении
+    файла. Новые расчеты объединяются с сохраненными по дате, поэтому ряд
+    продолжает расти, даже если матрица цен покрывает не всю историю.
+    """
+
+    def __init__(self, file_path):
+        """
+        Args:
+            file_path (str): Путь к файлу ряда
+        """
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._data = {'dates': [], 'windows': {}}
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.file_path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        with self._lock:
+            if signature == self._signature:
+                return
+            data = {'dates': [], 'windows': {}}
+            if signature is not None:
+                try:
+                    with open(self.file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception as e:
+                    logger.error(f"Error reading altseason series {self.file_path}: {str(e)}")
+                    return
+            self._data = data
+            self._signature = signature
+
+    def windows(self):
+        """
+        Returns:
+            list: Окна ряда в днях
+        """
+        self._refresh()
+        with self._lock:
+            return sorted(int(window) for window in self._data['windows'])
+
+    def update(self, prices, windows, min_coins=10):
+        """
+        Пересчитывает ряд по матрице цен и объединяет его с сохраненным по дате
+
+        Returns:
+            int: Количество дат в ряду после обновления
+        """
+        computed = compute_altseason_series(prices, windows, min_coins=min_coins)
+        if not computed['dates']:
+            return 0
+        self._refresh()
+        with self._lock:
+            stored = self._data
+            merged = {}
+            for source in (stored, computed):
+                for window, columns in source['windows'].items():
+                    points = merged.setdefault(window, {})
+                    for date, index, btc in zip(source['dates'], columns['index'], columns['btc_performance']):
+                        if index is not None:
+                            points[date] = (index, btc)
+            dates = sorted({date for points in merged.values() for date in points})
+            data = {
+                'dates': dates,
+                'windows': {
+                    window: {
+                        'index': [points.get(date, (None, None))[0] for date in dates],
+                        'btc_performance': [points.get(date, (None, None))[1] for date in dates],
+                    }
+                    for window, points in merged.items()
+                },
+            }
+            atomic_write(self.file_path, json.dumps(data))
+            self._signature = None
+        logger.info(f"Altseason series updated: {len(dates)} days, windows {sorted(merged, key=int)}")
+        return len(dates)
+
+    def get(self, window, start=None, end=None):
+        """
+        Точки ряда для окна за период включительно, старые даты сначала
+
+        Args:
+            window (int): Окно в днях
+            start (str, optional): Начальная дата YYYY-MM-DD
+            end (str, optional): Конечная дата YYYY-MM-DD
+
+        Returns:
+            list: Точки {'date', 'index', 'btc_performance'} (дни без значения пропускаются)
+        """
+        self._refresh()
+        with self._lock:
+            columns = self._data['windows'].get(str(window))
+            if not columns:
+                return []
+            dates = self._data['dates']
+            lo = bisect.bisect_left(dates, start) if start else 0
+            hi = bisect.bisect_right(dates, end) if end else len(dates)
+            return [
+                {'date': dates[i], 'index': columns['index'][i], 'btc_performance': columns['btc_performance'][i]}
+                for i in range(lo, hi) if columns['index'][i] is not None
+            ]
+
+    def latest(self, window):
+        """
+        Returns:
+            dict или None: Последняя точка ряда для окна
+        """
+        self._refresh()
+        with self._lock:
+            columns = self._data['windows'].get(str(window))
+            if not columns:
+                return None
+            for i in range(len(self._data['dates']) - 1, -1, -1):
+                if columns['index'][i] is not None:
+                    return {'date': self._data['dates'][i], 'index': columns['index'][i],
+                            'btc_performance': columns['btc_performance'][i]}
+            return None
+
+
+_altseason_series = None
+_altseason_series_lock = threading.Lock()
+
+
+def get_altseason_series():
+    """
+    Returns:
+        AltseasonSeries: Общий для процесса ряд с настройками из config.py
+    """
+    global _altseason_series
+    with _altseason_series_lock:
+        if _altseason_series is None:
+            from config import ASI_SERIES_FILE
+            _altseason_series = AltseasonSeries(ASI_SERIES_FILE)
+        return _altseason_series
+
+
+if __name__ == "__main__":
+    # Ручное построение ряда: загрузка матрицы цен как в ежедневном задании
+    from config import ASI_SERIES_WINDOWS
+    from crypto_analyzer_cryptocompare import CryptoAnalyzer
+    analyzer = CryptoAnalyzer(cache=None)
+    coins = [coin for coin in analyzer.get_top_coins(50) if coin['symbol'] not in ('USDT', 'USDC', 'DAI')]
+    prices = CryptoAnalyzer.build_price_matrix(analyzer.load_historical_data(coins, 1400))
+    days = get_altseason_series().update(prices, ASI_SERIES_WINDOWS)
+    print(f"Altseason series: {days} days")
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from logger import logger
+from history_storage import atomic_write, file_lock, _datetime_serializer
+
+
+class AltseasonSnapshotService:
+    """
+    Снимок Altcoin Season Index с фоновым обновлением, общий для всех процессов
+
+    Страница и API читают последний снимок из файла и не ждут CoinGecko.
+    Фоновое обновление раз в refresh_interval секунд выполняет только процесс,
+    для которого should_run() истинно (лидер планировщика), остальные воркеры
+    читают сохраненный им снимок. Явное обновление (кнопка на странице)
+    разрешено не чаще min_refresh_interval для всех процессов вместе.
+    До первого успешного обновления отдается последняя запись истории.
+    """
+
+    def __init__(self, altcoin_season_index, snapshot_file, refresh_interval=900, min_refresh_interval=60, history_api=None):
+        """
+        Args:
+            altcoin_season_index (AltcoinSeasonIndex): Источник данных индекса
+            snapshot_file (str): Файл снимка, общий для процессов
+            refresh_interval (int): Интервал фонового обновления в секундах
+            min_refresh_interval (int): Минимальный интервал между обновлениями по запросу
+            history_api (HistoryAPI, optional): История для начального снимка
+        """
+        self.index = altcoin_season_index
+        self.snapshot_file = snapshot_file
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.history_api = history_api
+        self._signature = None
+        self._state = {}
+        self._seed = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _read_state(self):
+        """Состояние снимка из файла (перечитывается только при изменении файла)"""
+        try:
+            st = os.stat(self.snapshot_file)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        with self._lock:
+            if signature == self._signature:
+                return self._state
+        state = {}
+        if signature is not None:
+            try:
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to read altseason snapshot {self.snapshot_file}: {str(e)}")
+        with self._lock:
+            self._state = state
+            self._signature = signature
+        return state
+
+    def _seed_from_history(self):
+        """Начальный снимок из последней записи истории (без запроса к API)"""
+        if self._seed is not None or self.history_api is None:
+            return self._seed
+        try:
+            history = self.history_api.get_altseason_index_history(limit=1)
+        except Exception as e:
+            logger.warning(f"Failed to read altseason history for the initial snapshot: {str(e)}")
+            return None
+        if history:
+            record = dict(history[0])
+            timestamp = record.get('timestamp')
+            if isinstance(timestamp, str):
+                try:
+                    timestamp = datetime.fromisoformat(timestamp)
+                except ValueError:
+                    timestamp = None
+            if isinstance(timestamp, datetime) and timestamp.tzinfo is None:
+                # Время в истории хранится в UTC без часового пояса
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            self._seed = {
+                'data': record,
+                'refreshed_at': timestamp.timestamp() if isinstance(timestamp, datetime) else None,
+            }
+        return self._seed
+
+    def refresh(self):
+        """
+        Обновляет снимок (один запрос одновременно во всех процессах)
+
+        Returns:
+            dict: Новые данные индекса или None при ошибке
+        """
+        with self._refresh_lock, file_lock(self.snapshot_file):
+            return self._refresh_locked(self._read_state())
+
+    def _refresh_locked(self, state):
+        state = dict(state, last_attempt=time.time())
+        try:
+            data = self.index.get_altseason_index()
+            error = None if data is not None else "Failed to retrieve Altcoin Season Index data"
+        except Exception as e:
+            data, error = None, str(e)
+        state['last_error'] = error
+        if data is not None:
+            state['data'] = data
+            state['refreshed_at'] = time.time()
+        try:
+            atomic_write(self.snapshot_file, json.dumps(state, default=_datetime_serializer))
+        except Exception as e:
+            logger.error(f"Failed to save altseason snapshot {self.snapshot_file}: {str(e)}")
+        if error:
+            logger.warning(f"Altseason snapshot refresh failed: {error}")
+        return data
+
+    def request_refresh(self):
+        """
+        Обновление по запросу пользователя с ограничением частоты
+
+        Returns:
+            tuple: (data, retry_after) - retry_after > 0 если обновление отклонено
+        """
+        with self._refresh_lock, file_lock(self.snapshot_file):
+            state = self._read_state()
+            wait = self.min_refresh_interval - (time.time() - state.get('last_attempt', 0))
+            if wait > 0:
+                return None, int(wait) + 1
+            return self._refresh_locked(state), 0
+
+    def get(self):
+        """
+        Returns:
+            dict: {'data', 'refreshed_at', 'age_seconds', 'stale', 'last_error'}
+        """
+        state = self._read_state()
+        if state.get('data') is None:
+            state = dict(state, **(self._seed_from_history() or {}))
+        refreshed_at = state.get('refreshed_at')
+        age = time.time() - refreshed_at if refreshed_at else None
+        return {
+            'data': state.get('data'),
+            'refreshed_at': int(refreshed_at) if refreshed_at else None,
+            'age_seconds': int(age) if age is not None else None,
+            # Снимок считается устаревшим, если пропущено больше одного фонового обновления
+            'stale': age is None or age > 2 * self.refresh_interval,
+            'last_error': state.get('last_error'),
+        }
+
+    def _loop(self, should_run):
+        # Проверка раз в минуту: после смены лидера обновление продолжается по времени последней попытки
+        poll = min(self.refresh_interval, 60)
+        while not self._stop_event.is_set():
+            try:
+                if should_run is None or should_run():
+                    if time.time() - self._read_state().get('last_attempt', 0) >= self.refresh_interval:
+                        self.refresh()
+            except Exception as e:
+                logger.error(f"Altseason snapshot loop error: {str(e)}")
+            self._stop_event.wait(poll)
+
+    def start(self, should_run=None):
+        """
+        Запускает фоновое обновление (повторный вызов ничего не делает)
+
+        Args:
+            should_run (callable, optional): Проверка перед каждым обновлением (например, лидерство процесса)
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, args=(should_run,), name="altseason-snapshot")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+
+_altseason_snapshot = None
+_altseason_snapshot_lock = threading.Lock()
+
+
+def get_altseason_snapshot(altcoin_season_index=None, history_api=None):
+    """
+    Returns:
+        AltseasonSnapshotService: Общий для процесса сервис снимка с настройками из config.py
+    """
+    global _altseason_snapshot
+    with _altseason_snapshot_lock:
+        if _altseason_snapshot is None:
+            from config import ASI_SNAPSHOT_FILE, ASI_REFRESH_INTERVAL, ASI_MIN_REFRESH_INTERVAL
+            if altcoin_season_index is None:
+                from altcoin_season_index import AltcoinSeasonIndex
+                altcoin_season_index = AltcoinSeasonIndex()
+            if history_api is None:
+                from history_api import HistoryAPI
+                history_api = HistoryAPI()
+            _altseason_snapshot = AltseasonSnapshotService(
+                altcoin_season_index,
+                ASI_SNAPSHOT_FILE,
+                refresh_interval=ASI_REFRESH_INTERVAL,
+                min_refresh_interval=ASI_MIN_REFRESH_INTERVAL,
+                history_api=history_api,
+            )
+        return _altseason_snapshot
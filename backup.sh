@@ -24,6 +24,18 @@ if [ -f "rank_history.txt" ]; then cp "rank_history.txt" "$TEMP_DIR/files/"; fi
 if [ -f "rank_history.json" ]; then cp "rank_history.json" "$TEMP_DIR/files/"; fi
 if [ -f "fear_greed_history.json" ]; then cp "fear_greed_history.json" "$TEMP_DIR/files/"; fi
 if [ -f "trends_history.json" ]; then cp "trends_history.json" "$TEMP_DIR/files/"; fi
+# История в формате HISTORY_BACKEND=jsonl, агрегаты и архивы уплотнения
+for f in *_history.jsonl *_rollups.json *_archive.jsonl.gz; do
+  if [ -f "$f" ]; then cp "$f" "$TEMP_DIR/files/"; fi
+done
+# База HISTORY_BACKEND=sqlite работает в режиме WAL: копия через .backup согласована
+if [ -f "history.db" ]; then
+  if command -v sqlite3 >/dev/null 2>&1; then
+    sqlite3 "history.db" ".backup '$TEMP_DIR/files/history.db'"
+  else
+    cp history.db* "$TEMP_DIR/files/"
+  fi
+fi
 if [ -f "sensortower_bot.log" ]; then cp "sensortower_bot.log" "$TEMP_DIR/files/"; fi
 if [ -f "google_trends_debug.log" ]; then cp "google_trends_debug.log" "$TEMP_DIR/files/"; fi
 if [ -f "requirements.txt" ]; then cp "requirements.txt" "$TEMP_DIR/files/"; fi
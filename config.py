@@ -12,6 +12,17 @@ end_date = today.strftime("%Y-%m-%d")
 # Новый URL для анализа категорий и рейтингов
 SENSORTOWER_URL = f"https://app.sensortower.com/app-analysis/category-rankings?os=ios&edit=1&granularity=daily&start_date={start_date}&end_date={end_date}&duration=P90D&country=US&breakdown_attribute=category&metricType=absolute&measure=revenue&rolling_days=0&selected_tab=0&session_count=sessionCount&time_spent=timeSpent&chart_plotting_type=line&sia={APP_ID}&ssia={APP_ID}&chart_type=free&chart_type=paid&chart_type=grossing&device=iphone&device=ipad&category=0&category=36&category=6015&time_period=day"
 
+# Корзина приложений для индекса розничного интереса (app_id:название через запятую).
+# Все приложения корзины запрашиваются пакетами по RANK_BATCH_SIZE в одном запросе category_history
+RANK_BASKET_APPS = dict(
+    item.split(':', 1) for item in os.getenv(
+        'RANK_BASKET_APPS',
+        '886427730:Coinbase,1436799971:Binance,1481947260:Kraken,938003185:Robinhood,1262148500:Crypto.com'
+    ).split(',') if ':' in item
+)
+RANK_BATCH_SIZE = int(os.getenv('RANK_BATCH_SIZE', '10'))
+RANK_MAX_BACKFILL_DAYS = int(os.getenv('RANK_MAX_BACKFILL_DAYS', '90'))  # Предел догоняющего окна в инкрементальном режиме
+
 # Telegram Configuration
 # Используем переменные окружения для хранения чувствительных данных
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
@@ -48,6 +59,88 @@ LOG_FILE = "sensortower_bot.log"
 ASI_VS_CURRENCY = os.getenv('ASI_VS_CURRENCY', 'usd')
 ASI_TOP_N = int(os.getenv('ASI_TOP_N', '50'))
 ASI_PERIOD = os.getenv('ASI_PERIOD', '30d')
+# Периоды, запрашиваемые у CoinGecko одним запросом (ASI_PERIOD добавляется автоматически)
+ASI_PERIODS = tuple(period.strip() for period in os.getenv('ASI_PERIODS', '7d,30d,1y').split(',') if period.strip())
+ASI_SNAPSHOT_TTL = int(os.getenv('ASI_SNAPSHOT_TTL', '300'))  # Время жизни снимка рынка CoinGecko (сек)
+ASI_REFRESH_INTERVAL = int(os.getenv('ASI_REFRESH_INTERVAL', '900'))  # Фоновое обновление снимка для страницы и API (сек)
+ASI_MIN_REFRESH_INTERVAL = int(os.getenv('ASI_MIN_REFRESH_INTERVAL', '60'))  # Минимальный интервал обновления по запросу (сек)
+ASI_SNAPSHOT_FILE = os.getenv('ASI_SNAPSHOT_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'altseason_snapshot.json'))
 ASI_THRESHOLD_STRONG = float(os.getenv('ASI_THRESHOLD_STRONG', '0.75'))
 ASI_THRESHOLD_MODERATE = float(os.getenv('ASI_THRESHOLD_MODERATE', '0.50'))
 ASI_THRESHOLD_WEAK = float(os.getenv('ASI_THRESHOLD_WEAK', '0.25'))
+# Исторический ряд индекса по матрице цен Market Breadth (окна в днях)
+ASI_SERIES_WINDOWS = tuple(int(window) for window in os.getenv('ASI_SERIES_WINDOWS', '7,30,90').split(',') if window.strip())
+ASI_SERIES_FILE = os.getenv('ASI_SERIES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'altseason_series.json'))
+
+# Leader Election Configuration
+# Только процесс, удерживающий аренду, выполняет задания планировщика
+LEADER_LEASE_DB = os.getenv('LEADER_LEASE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scheduler_lease.db'))
+LEADER_LEASE_TTL = int(os.getenv('LEADER_LEASE_TTL', '60'))  # seconds
+
+# Job State Configuration
+# Запуски заданий и результаты их этапов сохраняются для продолжения после перезапуска
+JOB_STATE_DB = os.getenv('JOB_STATE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_runs.db'))
+JOB_CATCHUP_WINDOW_HOURS = int(os.getenv('JOB_CATCHUP_WINDOW_HOURS', '12'))  # Пропущенный запуск догоняется в течение этого окна
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RUNS_RETENTION_DAYS = int(os.getenv('JOB_RUNS_RETENTION_DAYS', '30'))  # Завершенные запуски старше удаляются (результаты этапов - после окна догона)
+
+# History Storage Configuration
+# jsonl - журнальные файлы (*.jsonl), запись O(1); json - прежний формат JSON-массива;
+# sqlite - база SQLite с индексом по времени (см. migrate_history.py)
+HISTORY_BACKEND = os.getenv('HISTORY_BACKEND', 'jsonl')
+HISTORY_COMPACT_EVERY = int(os.getenv('HISTORY_COMPACT_EVERY', '500'))  # Уплотнение журнала каждые N добавлений
+HISTORY_DB = os.getenv('HISTORY_DB', 'history.db')  # Файл базы для HISTORY_BACKEND=sqlite (относительно директории истории)
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '0'))  # Более старые записи переносятся в архив (0 - хранить все)
+HISTORY_COMPACTION_HOUR = int(os.getenv('HISTORY_COMPACTION_HOUR', '3'))  # Час ежедневного уплотнения истории
+HISTORY_WRITE_BEHIND = os.getenv('HISTORY_WRITE_BEHIND', 'true').lower() == 'true'  # Запись истории в фоновом потоке
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '0.5'))  # Ожидание накопления пакета записей (сек)
+
+# Google Trends Sampler Configuration
+TRENDS_CACHE_FILE = os.getenv('TRENDS_CACHE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trends_cache.json'))
+TRENDS_DAILY_BUDGET = int(os.getenv('TRENDS_DAILY_BUDGET', '24'))  # Максимум запросов к Google Trends в сутки
+TRENDS_TERM_TTL_HOURS = float(os.getenv('TRENDS_TERM_TTL_HOURS', '12'))  # Время актуальности значения ключевого слова
+TRENDS_BREAKER_COOLDOWN = int(os.getenv('TRENDS_BREAKER_COOLDOWN', '1800'))  # Пауза после 429 (сек), удваивается при повторах
+# Регионы Google Trends и их веса в глобальном пульсе (формат "GEO:вес,...")
+TRENDS_REGIONS = {
+    geo.strip(): float(weight)
+    for geo, weight in (item.split(':') for item in os.getenv('TRENDS_REGIONS', 'US:0.35,KR:0.2,TR:0.15,NG:0.15,BR:0.15').split(',') if item.strip())
+}
+TRENDS_REGIONS_HISTORY_FILE = os.getenv('TRENDS_REGIONS_HISTORY_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trends_regions_history.json'))
+TRENDS_REGION_TIMEOUT = float(os.getenv('TRENDS_REGION_TIMEOUT', '30'))  # Ожидание выборки по регионам (сек)
+
+# Fear & Greed Configuration
+FEAR_GREED_SERIES_FILE = os.getenv('FEAR_GREED_SERIES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fear_greed_series.json'))
+
+# HTTP Cache Configuration
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'true').lower() == 'true'  # Общий кеш ответов внешних API
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.http_cache'))
+HTTP_CACHE_DEFAULT_TTL = int(os.getenv('HTTP_CACHE_DEFAULT_TTL', '300'))  # TTL по умолчанию (сек)
+HTTP_CACHE_MAX_AGE_DAYS = int(os.getenv('HTTP_CACHE_MAX_AGE_DAYS', '7'))  # Удаление неиспользуемых записей при запуске
+# TTL по эндпоинтам (формат "хост/путь=сек,..."; выбирается самый длинный совпавший префикс)
+HTTP_CACHE_TTLS = {
+    prefix.strip(): int(seconds)
+    for prefix, seconds in (item.split('=') for item in os.getenv(
+        'HTTP_CACHE_TTLS',
+        'api.alternative.me/fng=900,api.coingecko.com=600,min-api.cryptocompare.com=900,'
+        'app.sensortower.com=1800,t.me=300'
+    ).split(',') if item.strip())
+}
+
+# Order Book Imbalance Configuration
+GBI_EXCHANGE = os.getenv('GBI_EXCHANGE', 'binance')
+GBI_MARKETS = os.getenv('GBI_MARKETS', 'BTC/USDT,ETH/USDT,SOL/USDT,ADA/USDT,BNB/USDT')
+GBI_LIMIT = int(os.getenv('GBI_LIMIT', '100'))  # Глубина стакана (уровней)
+GBI_THRESHOLD_STRONG_BULL = float(os.getenv('GBI_THRESHOLD_STRONG_BULL', '0.50'))
+GBI_THRESHOLD_WEAK_BULL = float(os.getenv('GBI_THRESHOLD_WEAK_BULL', '0.20'))
+GBI_THRESHOLD_WEAK_BEAR = float(os.getenv('GBI_THRESHOLD_WEAK_BEAR', '-0.20'))
+GBI_THRESHOLD_STRONG_BEAR = float(os.getenv('GBI_THRESHOLD_STRONG_BEAR', '-0.50'))
+GBI_MARKETS_TTL_HOURS = float(os.getenv('GBI_MARKETS_TTL_HOURS', '24'))  # Перезагрузка списка рынков биржи
+# Биржи для агрегированного дисбаланса (GBI_EXCHANGE добавляется автоматически)
+GBI_EXCHANGES = tuple(e.strip() for e in os.getenv('GBI_EXCHANGES', 'binance,okx,bybit,coinbase,kraken').split(',') if e.strip())
+GBI_EXCHANGE_TIMEOUT = float(os.getenv('GBI_EXCHANGE_TIMEOUT', '10'))  # Ожидание одной биржи (сек)
+GBI_MARKETS_TIMEOUT = float(os.getenv('GBI_MARKETS_TIMEOUT', '30'))  # Ожидание загрузки рынков биржи при холодном старте (сек)
+# Котируемые валюты, пробуемые по порядку, если пары нет на бирже (например, BTC/USD вместо BTC/USDT)
+GBI_QUOTE_FALLBACKS = tuple(q.strip() for q in os.getenv('GBI_QUOTE_FALLBACKS', 'USDT,USD,USDC').split(',') if q.strip())
+# Полосы дисбаланса вокруг середины спреда (% от mid) и масштаб затухания весов уровней (%)
+GBI_BANDS = tuple(float(b) for b in os.getenv('GBI_BANDS', '0.5,1,2').split(',') if b.strip())
+GBI_DECAY_SCALE = float(os.getenv('GBI_DECAY_SCALE', '1.0'))
@@ -8,6 +8,7 @@ from typing import List, Dict, Optional, Callable
 import concurrent.futures
 import threading
 import os
+from http_cache import cached_get
 
 class CryptoAnalyzer:
     """
@@ -48,7 +49,9 @@ class CryptoAnalyzer:
                 params['api_key'] = self.api_key
                 self.logger.info(f"Использую API ключ для запроса к {url}")
             
-            response = requests.get(url, params=params, timeout=15)
+            # Ошибки API (Response=Error) приходят с кодом 200 и не кешируются
+            response = cached_get(url, params=params, timeout=15,
+                                  cacheable=lambda r: b'"Response":"Error"' not in r.content)
             
             if response.status_code == 429:
                 self.logger.warning("Превышен лимит запросов, ожидание 30 секунд...")
@@ -209,6 +212,24 @@ class CryptoAnalyzer:
         self.logger.info(f"Пачечная загрузка завершена: {successful_loads} успешно, {failed_loads} неудачно из {total_coins} монет")
         return historical_data
     
+    @staticmethod
+    def build_price_matrix(historical_data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+        Матрица цен закрытия: строки - даты (по дням), столбцы - символы монет
+        
+        Общая для Market Breadth и Altcoin Season Index, чтобы оба индикатора
+        считались по одному набору монет без повторной загрузки.
+        """
+        if not historical_data:
+            return pd.DataFrame()
+        columns = {
+            symbol: df.set_index(pd.to_datetime(df['date']))['price']
+            for symbol, df in historical_data.items()
+        }
+        matrix = pd.DataFrame(columns).sort_index()
+        # Пропущенные дни остаются NaN: доходность по ним не считается
+        return matrix.asfreq('D')
+    
     def calculate_moving_average(self, prices: pd.Series, window: int) -> pd.Series:
         """
         Расчет скользящей средней
@@ -1,67 +1,287 @@
+import os
+import json
+import bisect
 import requests
 import logging
+import threading
 import time
 from datetime import datetime
+from history_storage import atomic_write
+from http_cache import cached_get
 
 # Set up logging
 logger = logging.getLogger('sensortower_bot')
 
+
+class FearGreedSeries:
+    """
+    Local daily Fear & Greed series, indexed by date
+
+    Stored column-wise in a JSON file (dates, values, classifications,
+    timestamps) and kept in memory; the file is re-read only when its mtime
+    or size changes. Lookups by date and ranges use bisect over sorted dates.
+    """
+
+    def __init__(self, file_path):
+        """
+        Args:
+            file_path (str): Path to the series file
+        """
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._dates = []
+        self._values = []
+        self._classifications = []
+        self._timestamps = []
+
+    def _refresh(self):
+        """Reloads the series if the file changed since the last load"""
+        try:
+            st = os.stat(self.file_path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+
+        with self._lock:
+            if signature == self._signature:
+                return
+            data = {}
+            if signature is not None:
+                try:
+                    with open(self.file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception as e:
+                    logger.error(f"Error reading Fear & Greed series {self.file_path}: {str(e)}")
+                    return
+            self._dates = data.get('dates', [])
+            self._values = data.get('values', [])
+            self._classifications = data.get('classifications', [])
+            self._timestamps = data.get('timestamps', [])
+            self._signature = signature
+
+    def __len__(self):
+        self._refresh()
+        return len(self._dates)
+
+    def _point(self, position):
+        return {
+            "value": self._values[position],
+            "classification": self._classifications[position],
+            "date": self._dates[position],
+            "timestamp": self._timestamps[position],
+        }
+
+    def last_date(self):
+        """
+        Returns:
+            str or None: Last stored date (YYYY-MM-DD)
+        """
+        self._refresh()
+        with self._lock:
+            return self._dates[-1] if self._dates else None
+
+    def latest(self):
+        """
+        Returns:
+            dict or None: Latest point {'value', 'classification', 'date', 'timestamp'}
+        """
+        self._refresh()
+        with self._lock:
+            return self._point(len(self._dates) - 1) if self._dates else None
+
+    def get(self, date):
+        """
+        Returns:
+            dict or None: Point for the date YYYY-MM-DD
+        """
+        self._refresh()
+        with self._lock:
+            position = bisect.bisect_left(self._dates, date)
+            if position < len(self._dates) and self._dates[position] == date:
+                return self._point(position)
+            return None
+
+    def get_range(self, start=None, end=None):
+        """
+        Returns the points between two dates inclusive, oldest first
+
+        Args:
+            start (str, optional): Start date YYYY-MM-DD
+            end (str, optional): End date YYYY-MM-DD
+
+        Returns:
+            list: Points {'value', 'classification', 'date', 'timestamp'}
+        """
+        self._refresh()
+        with self._lock:
+            lo = bisect.bisect_left(self._dates, start) if start else 0
+            hi = bisect.bisect_right(self._dates, end) if end else len(self._dates)
+            return [self._point(position) for position in range(lo, hi)]
+
+    def percentile(self, value, start=None, end=None):
+        """
+        Share of days in the period with a value below or equal to the given one
+
+        Returns:
+            float or None: Percentile 0-100, None if the period has no data
+        """
+        self._refresh()
+        with self._lock:
+            lo = bisect.bisect_left(self._dates, start) if start else 0
+            hi = bisect.bisect_right(self._dates, end) if end else len(self._dates)
+            window = self._values[lo:hi]
+        if not window:
+            return None
+        return round(sum(1 for v in window if v <= value) / len(window) * 100, 1)
+
+    def upsert(self, points):
+        """
+        Inserts or replaces points by date and rewrites the file atomically
+
+        Args:
+            points (list): Points {'value', 'classification', 'date', 'timestamp'}
+
+        Returns:
+            int: Number of dates that were added
+        """
+        if not points:
+            return 0
+        self._refresh()
+        with self._lock:
+            by_date = {
+                date: (value, classification, timestamp)
+                for date, value, classification, timestamp
+                in zip(self._dates, self._values, self._classifications, self._timestamps)
+            }
+            before = len(by_date)
+            for point in points:
+                by_date[point['date']] = (point['value'], point['classification'], point['timestamp'])
+            dates = sorted(by_date)
+            content = json.dumps({
+                "dates": dates,
+                "values": [by_date[date][0] for date in dates],
+                "classifications": [by_date[date][1] for date in dates],
+                "timestamps": [by_date[date][2] for date in dates],
+            })
+            atomic_write(self.file_path, content)
+            # Force a reload from the file on the next read
+            self._signature = None
+            return len(dates) - before
+
+
 class FearGreedIndexTracker:
-    def __init__(self):
+    def __init__(self, series_file=None):
         """
         Initializes the Fear & Greed Index tracker for cryptocurrencies
+
+        Args:
+            series_file (str, optional): Local daily series file
+                                         (FEAR_GREED_SERIES_FILE from config.py by default)
         """
         self.api_url = "https://api.alternative.me/fng/"
         self.last_data = None
-        
+        if series_file is None:
+            from config import FEAR_GREED_SERIES_FILE
+            series_file = FEAR_GREED_SERIES_FILE
+        self.series = get_fear_greed_series(series_file)
+
+    def _fetch_points(self, limit):
+        """
+        Requests the last `limit` days from alternative.me (limit=0 - the full history)
+
+        Returns:
+            list: Points {'value', 'classification', 'date', 'timestamp'}
+
+        Raises:
+            requests.exceptions.RequestException, ValueError: on HTTP or format errors
+        """
+        response = cached_get(self.api_url, params={"limit": limit}, timeout=30 if limit == 0 else 10)
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        data = response.json()
+        if "data" not in data or not data["data"]:
+            raise ValueError("Invalid response format from Fear & Greed API")
+
+        points = []
+        for item in data["data"]:
+            timestamp = int(item.get("timestamp", "0"))
+            points.append({
+                "value": int(item.get("value", "0")),
+                "classification": item.get("value_classification", "Unknown"),
+                # alternative.me timestamps are UTC midnights
+                "date": datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d"),
+                "timestamp": timestamp,
+            })
+        return points
+
+    def sync(self, full=False):
+        """
+        Brings the local series up to date
+
+        An empty series (or full=True) is backfilled with the whole history
+        (limit=0); otherwise only the days after the last stored date are requested.
+
+        Args:
+            full (bool): Re-download the full history
+
+        Returns:
+            int: Number of new dates
+        """
+        last_date = None if full else self.series.last_date()
+        if last_date is None:
+            limit = 0
+            logger.info("Backfilling the full Fear & Greed history")
+        else:
+            missing_days = (datetime.utcnow().date() - datetime.strptime(last_date, "%Y-%m-%d").date()).days
+            if missing_days <= 0:
+                return 0
+            # The last stored day is requested again: its value may have been updated
+            limit = missing_days + 1
+
+        points = self._fetch_points(limit)
+        added = self.series.upsert(points)
+        logger.info(f"Fear & Greed series synced: {len(points)} days received, {added} new, {len(self.series)} stored")
+        return added
+
+    def get_local_index(self):
+        """
+        Latest Fear & Greed value from the local series, without network requests
+
+        Returns:
+            dict: Index data (with the 'stale' flag) or None if the series is empty
+        """
+        return mark_staleness(self.series.latest())
+
     def get_fear_greed_index(self):
         """
         Gets the current value of the Fear & Greed Index and its interpretation
-        
+
+        The local series is synced first (only missing days are requested);
+        the value itself is read from the series.
+
+        If the API is unavailable, the last stored value is returned with
+        'stale': True; its 'date' is the day the value belongs to.
+
         Returns:
             dict: Dictionary with index data or None in case of error
         """
         try:
             logger.info("Fetching Fear & Greed Index data")
-            response = requests.get(self.api_url, params={"limit": 1}, timeout=10)
-            
-            if response.status_code != 200:
-                logger.error(f"Failed to fetch Fear & Greed Index: HTTP {response.status_code}")
-                return self._create_fallback_data()
-                
-            data = response.json()
-            
-            if "data" not in data or not data["data"]:
-                logger.error("Invalid response format from Fear & Greed API")
-                return self._create_fallback_data()
-                
-            index_data = data["data"][0]
-            
-            # Convert values
-            value = int(index_data.get("value", "0"))
-            value_classification = index_data.get("value_classification", "Unknown")
-            timestamp = int(index_data.get("timestamp", "0"))
-            
-            # Convert timestamp to date
-            date = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
-            
-            result = {
-                "value": value,
-                "classification": value_classification,
-                "date": date,
-                "timestamp": timestamp
-            }
-            
-            logger.info(f"Successfully fetched Fear & Greed Index: {value} ({value_classification})")
-            self.last_data = result
-            return result
-            
+            self.sync()
         except requests.exceptions.RequestException as e:
             logger.error(f"Request to Fear & Greed API failed: {str(e)}")
-            return self._create_fallback_data()
         except Exception as e:
             logger.error(f"Error fetching Fear & Greed Index: {str(e)}")
+
+        result = self.get_local_index()
+        if result is None:
             return self._create_fallback_data()
+        if result['stale']:
+            logger.warning(f"Fear & Greed Index is stale: last stored value is for {result['date']}")
+        logger.info(f"Fear & Greed Index: {result['value']} ({result['classification']}) for {result['date']}")
+        self.last_data = result
+        return result
             
     def _create_fallback_data(self):
         """
@@ -70,7 +290,7 @@ class FearGreedIndexTracker:
         # If we have previous data, use it
         if self.last_data:
             logger.info("Using last known Fear & Greed data")
-            return self.last_data
+            return mark_staleness(self.last_data)
             
         # Create fallback data
         logger.info("Using fallback Fear & Greed data")
@@ -78,7 +298,8 @@ class FearGreedIndexTracker:
             "value": 45,
             "classification": "Fear",
             "date": datetime.now().strftime("%Y-%m-%d"),
-            "timestamp": int(time.time())
+            "timestamp": int(time.time()),
+            "stale": True
         }
         
     def format_fear_greed_message(self, fear_greed_data):
@@ -123,8 +344,11 @@ class FearGreedIndexTracker:
         # Generate progress bar
         progress = self._generate_progress_bar(value, 100, 10, filled_char)
         
+        # A stale value is reported with the day it belongs to
+        as_of = f" (as of {fear_greed_data.get('date')})" if fear_greed_data.get("stale") else ""
+        
         # Format the message with "Fear & Greed" prefix and progress bar on the next line
-        message = f"Fear & Greed: {emoji} {classification}: {value}/100\n{progress}"
+        message = f"Fear & Greed: {emoji} {classification}: {value}/100{as_of}\n{progress}"
         
         return message
         
@@ -144,4 +368,48 @@ class FearGreedIndexTracker:
         """
         filled_length = int(length * value / max_value)
         bar = filled_char * filled_length + empty_char * (length - filled_length)
-        return bar
\ No newline at end of file
+        return bar
+
+
+def mark_staleness(point):
+    """
+    Adds the 'stale' flag to a Fear & Greed point
+
+    alternative.me publishes one value per UTC day, so a point dated before
+    the current UTC day is stale.
+
+    Returns:
+        dict or None: Copy of the point with 'stale', or None for None
+    """
+    if point is None:
+        return None
+    return dict(point, stale=point.get("date", "") < datetime.utcnow().strftime("%Y-%m-%d"))
+
+
+_fear_greed_series = {}
+_fear_greed_series_lock = threading.Lock()
+
+
+def get_fear_greed_series(file_path=None):
+    """
+    Returns:
+        FearGreedSeries: Process-wide series for the file (FEAR_GREED_SERIES_FILE by default)
+    """
+    if file_path is None:
+        from config import FEAR_GREED_SERIES_FILE
+        file_path = FEAR_GREED_SERIES_FILE
+    with _fear_greed_series_lock:
+        if file_path not in _fear_greed_series:
+            _fear_greed_series[file_path] = FearGreedSeries(file_path)
+        return _fear_greed_series[file_path]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sync the local Fear & Greed series")
+    parser.add_argument('--full', action='store_true', help="Re-download the full history (limit=0)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    tracker = FearGreedIndexTracker()
+    tracker.sync(full=args.full)
+    print(tracker.get_local_index())
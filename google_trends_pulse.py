@@ -2,15 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import time
-import json
 import random
 import requests
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from pytrends.request import TrendReq
 from pytrends.exceptions import TooManyRequestsError
 import logging
 from logger import logger
+from trends_fetcher import TrendsFetcher
+from trends_sampler import get_trends_sampler
+from trends_regions import get_regional_trends
 
 # Создаем отдельный логгер для Google Trends для более детального отслеживания
 trends_logger = logging.getLogger('google_trends')
@@ -41,7 +43,7 @@ trends_stream_handler.setFormatter(trends_formatter)
 trends_logger.addHandler(trends_stream_handler)
 
 class GoogleTrendsPulse:
-    def __init__(self):
+    def __init__(self, history_api=None):
         """
         Инициализация модуля для анализа Google Trends
         
@@ -52,7 +54,13 @@ class GoogleTrendsPulse:
         - ⚪ Белый сигнал: нейтральный интерес без сильных эмоциональных перекосов
         - 🟢 Зелёный сигнал: высокий FOMO-фактор - возможный пик рынка
         - 🔵 Синий сигнал: рынок в спячке - очень низкий общий интерес
+        
+        Args:
+            history_api (HistoryAPI, optional): Хранилище истории (по умолчанию создается новое)
         """
+        # Пакетные запросы к Google Trends через одну сессию
+        self.fetcher = TrendsFetcher()
+        
         # Кешированные данные и время последней проверки
         self.last_check_time = None
         self.last_data = None
@@ -65,6 +73,14 @@ class GoogleTrendsPulse:
         self.general_keywords = ["bitcoin", "crypto", "blockchain"]  # "bitcoin" используется как основной
         self.fomo_keywords = ["buy crypto", "invest bitcoin", "crypto profit"]  # "buy crypto" используется как основной
         self.fear_keywords = ["crypto crash", "bitcoin crash", "sell bitcoin"]  # "crypto crash" используется как основной
+
+        # Фоновая выборка Google Trends в пределах суточного бюджета запросов;
+        # термины FOMO и страха близкой популярности запрашиваются вместе одним запросом
+        # ("buy crypto" - опорный), но без "bitcoin": рядом с ним их значения округляются до 0-1
+        self.sampler = get_trends_sampler()
+        self.sampler.track([self.fomo_keywords[0], self.fear_keywords[0]])
+        # FOMO/страх по регионам (US, KR, TR, NG, BR) и взвешенный глобальный пульс
+        self.regional = get_regional_trends(self.fomo_keywords[0], self.fear_keywords[0])
         
         # Определение маркетных сигналов
         self.market_signals = [
@@ -75,40 +91,72 @@ class GoogleTrendsPulse:
             {"signal": "🟢", "description": "High FOMO factor - possible market peak", "weight": 1}
         ]
         
-        # Загружаем сохраненные данные, если они есть
-        try:
-            with open("trends_history.json", "r") as f:
-                self.history_data = json.load(f)
-                logger.info(f"Loaded Google Trends history: {len(self.history_data)} records")
-                
-                # Используем последнюю запись в истории как текущие данные
-                if self.history_data:
-                    most_recent = max(self.history_data, key=lambda x: x.get("timestamp", ""))
-                    self.last_data = {
-                        "signal": most_recent.get("signal", "⚪"),
-                        "description": most_recent.get("description", "Neutral interest in cryptocurrencies"),
-                        "fomo_score": most_recent.get("fomo_score", 50),
-                        "fear_score": most_recent.get("fear_score", 50),
-                        "general_score": most_recent.get("general_score", 50),
-                        "fomo_to_fear_ratio": most_recent.get("fomo_to_fear_ratio", 1.0),
-                        "timestamp": most_recent.get("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                    }
-                    
-                    # Пытаемся распарсить время последней проверки из timestamp
-                    try:
-                        self.last_check_time = datetime.strptime(
-                            self.last_data["timestamp"], 
-                            "%Y-%m-%d %H:%M:%S"
-                        )
-                        logger.info(f"Last Google Trends check time: {self.last_check_time}")
-                    except:
-                        self.last_check_time = datetime.now() - timedelta(days=1)
-                        logger.warning("Could not parse last check time, using yesterday")
-                    
-                    logger.info(f"Using most recent Google Trends data from history: {self.last_data['signal']} - {self.last_data['description']}")
-        except (FileNotFoundError, json.JSONDecodeError):
-            logger.info("No Google Trends history found or invalid format, will create new")
-            self.history_data = []
+        # История хранится в общем хранилище HistoryAPI (вид 'trends'): оттуда же
+        # ее читают /history, выгрузки, уплотнение и агрегаты
+        if history_api is None:
+            from history_api import HistoryAPI
+            history_api = HistoryAPI()
+        self.history_api = history_api
+        
+        # Используем последнюю запись в истории как текущие данные
+        most_recent = self._get_latest_history_record()
+        if most_recent:
+            self.last_data = {
+                "signal": most_recent.get("signal", "⚪"),
+                "description": most_recent.get("description", "Neutral interest in cryptocurrencies"),
+                "fomo_score": most_recent.get("fomo_score", 50),
+                "fear_score": most_recent.get("fear_score", 50),
+                "general_score": most_recent.get("general_score", 50),
+                "fomo_to_fear_ratio": most_recent.get("fomo_to_fear_ratio", 1.0),
+                "timestamp": most_recent["timestamp"]
+            }
+            self.last_check_time = datetime.strptime(most_recent["timestamp"], "%Y-%m-%d %H:%M:%S")
+            logger.info(f"Last Google Trends check time: {self.last_check_time}")
+            logger.info(f"Using most recent Google Trends data from history: {self.last_data['signal']} - {self.last_data['description']}")
+        else:
+            logger.info("No Google Trends history found, will create new")
+    
+    def _get_latest_history_record(self):
+        """
+        Последняя запись истории Google Trends
+        
+        Returns:
+            dict: Запись с timestamp в местном времени ("%Y-%m-%d %H:%M:%S") или None
+        """
+        history = self.get_history(limit=1)
+        return history[0] if history else None
+    
+    def get_history(self, limit=500):
+        """
+        История Google Trends из HistoryAPI (новые сначала)
+        
+        Returns:
+            list: Записи с timestamp в местном времени ("%Y-%m-%d %H:%M:%S"), как в результатах get_trends_data
+        """
+        history = self.history_api.get_google_trends_history(limit=limit)
+        for record in history:
+            timestamp = record.get("timestamp")
+            if isinstance(timestamp, datetime):
+                # HistoryAPI хранит время в UTC
+                if timestamp.tzinfo is None:
+                    timestamp = timestamp.replace(tzinfo=timezone.utc)
+                record["timestamp"] = timestamp.astimezone().strftime("%Y-%m-%d %H:%M:%S")
+        return history
+    
+    def start_sampling(self, should_run=None):
+        """
+        Запускает фоновую выборку Google Trends (весь мир и регионы)
+        
+        Args:
+            should_run (callable, optional): Проверка перед каждой выборкой (например, лидерство процесса)
+        """
+        self.sampler.start(should_run=should_run)
+        self.regional.start(should_run=should_run)
+    
+    def stop_sampling(self):
+        """Останавливает фоновую выборку Google Trends"""
+        self.sampler.stop()
+        self.regional.stop()
     
     def safe_interest_over_time(self, pytrends, retries=5, initial_delay=10):
         """
@@ -154,35 +202,9 @@ class GoogleTrendsPulse:
         trends_logger.info(f"Получение данных для термина: {term}")
         
         try:
-            # Диапазон за последние 30 дней в формате "YYYY-MM-DD YYYY-MM-DD"
-            today = datetime.utcnow().date()
-            start = today - timedelta(days=30)
-            timeframe = f"{start} {today}"  # "YYYY-MM-DD YYYY-MM-DD"
-            
-            trends_logger.info(f"Сформирован диапазон дат: {timeframe}")
-            
-            # Создаём клиента с указанной локалью 'en-US' и часовым поясом UTC
-            pytrends = TrendReq(hl=locale, tz=0)
-            
-            # Формируем запрос с указанным термином
-            pytrends.build_payload([term], cat=0, timeframe=timeframe)
-            
-            # Делаем запрос с надежным механизмом повторов
-            data = self.safe_interest_over_time(pytrends)
-            
-            # Проверяем результат
-            if data is None or data.empty:
-                trends_logger.warning(f"Пустой результат из Google Trends для '{term}'")
-                return 50  # нейтральное значение при ошибке
-            
-            # Отфильтровываем строку за текущий (неполный) день
-            if 'isPartial' in data.columns:
-                data = data[~data['isPartial']]
-            
-            # Вычисляем среднее значение интереса
-            avg_interest = data[term].mean()
+            fetcher = self.fetcher if locale == self.fetcher.locale else TrendsFetcher(locale=locale)
+            avg_interest = fetcher.fetch([term])[term]['relative']
             trends_logger.info(f"Средний интерес для '{term}': {avg_interest}")
-            
             return avg_interest
             
         except Exception as e:
@@ -247,41 +269,23 @@ class GoogleTrendsPulse:
             trends_logger.info("Получение реальных данных из Google Trends API...")
             
             try:
-                # Делаем 2 запроса - напрямую для FOMO и для страха
-                # Это даст более точную картину настроений чем общий запрос + FOMO
-                
-                # 1. Делаем запрос для измерения FOMO (желания покупать)
+                # Основные термины FOMO и страха берутся из кеша фонового сэмплера
+                # (последние успешные значения), без ожидания Google Trends.
+                # Если какого-то термина в кеше еще нет, оба термина запрашиваются одним
+                # общим запросом (без "bitcoin") без повторов, с учетом суточного бюджета
+                # и выключателя после 429
                 fomo_term = self.fomo_keywords[0]  # "buy crypto"
-                trends_logger.info(f"Получение данных для FOMO-термина: {fomo_term}")
-                fomo_score = self.get_term_interest(fomo_term)
-                
-                # Если получили нейтральное значение (50), значит произошла ошибка
-                if fomo_score == 50:
-                    trends_logger.warning(f"Не удалось получить данные для '{fomo_term}'")
-                    # Данные недоступны - не используем резервные методы, как просил пользователь
-                    trends_logger.warning("Не удалось получить данные Google Trends. Резервные методы не используются.")
-                    
-                    # Если у нас есть предыдущие реальные данные (не фейковые), возвращаем их
-                    if self.last_data and self.last_data.get("api_available", False):
-                        trends_logger.info(f"Возвращаем предыдущие достоверные данные Google Trends из-за ошибки API")
-                        return self.last_data
-                    
-                    # Если предыдущих данных нет или они тоже фейковые, возвращаем None
-                    trends_logger.warning("Нет доступных данных Google Trends. Часть сообщения будет пропущена.")
-                    return None
-                
-                # Увеличиваем паузы между запросами, чтобы снизить вероятность ошибки 429
-                time.sleep(random.uniform(5.0, 10.0))
-                
-                # 2. Делаем запрос для явного измерения страха
                 fear_term = self.fear_keywords[0]  # "crypto crash"
-                trends_logger.info(f"Получение данных для FEAR-термина: {fear_term}")
-                fear_score = self.get_term_interest(fear_term)
-                
-                # Если получили нейтральное значение (50), значит произошла ошибка
-                if fear_score == 50:
-                    trends_logger.warning(f"Не удалось получить данные для '{fear_term}'")
-                    # Данные недоступны - не используем резервные методы, как просил пользователь
+                terms = [fomo_term, fear_term]
+                scores = self.sampler.get_cached(terms)
+                missing = [term for term in terms if term not in scores]
+                if missing:
+                    trends_logger.info(f"Нет кешированных значений Google Trends, запрос: {', '.join(missing)}")
+                    scores.update(self.sampler.fetch_now(terms) or {})
+                stale_terms = [term for term, score in scores.items() if score.get('stale')]
+                if stale_terms:
+                    trends_logger.warning(f"Значения Google Trends устарели (TTL истек): {', '.join(stale_terms)}")
+                if any(term not in scores for term in terms):
                     trends_logger.warning("Не удалось получить данные Google Trends. Резервные методы не используются.")
                     
                     # Если у нас есть предыдущие реальные данные (не фейковые), возвращаем их
@@ -293,7 +297,13 @@ class GoogleTrendsPulse:
                     trends_logger.warning("Нет доступных данных Google Trends. Часть сообщения будет пропущена.")
                     return None
                 
-                # Оба запроса успешно выполнены, вычисляем общий интерес как среднее (для совместимости с кодом)
+                # Оценки относительно собственного пика термина (отдельные запросы),
+                # на которых настроены пороги сигналов
+                fomo_score = scores[fomo_term]['relative']
+                fear_score = scores[fear_term]['relative']
+                trends_logger.info(f"FOMO '{fomo_term}': {fomo_score:.1f}, страх '{fear_term}': {fear_score:.1f}")
+                
+                # Запрос успешно выполнен, вычисляем общий интерес как среднее (для совместимости с кодом)
                 general_score = (fomo_score + fear_score) / 2
                 trends_logger.info(f"Рассчитываем общий интерес как среднее между FOMO и Fear: {general_score}")
                 
@@ -333,6 +343,8 @@ class GoogleTrendsPulse:
                     "fear_score": fear_score,
                     "general_score": general_score,
                     "fomo_to_fear_ratio": fomo_to_fear_ratio,
+                    # Взвешенный пульс по регионам из кеша (None, пока регионы не опрошены)
+                    "global_pulse": self.regional.get_pulse(),
                     "timestamp": current_time.strftime("%Y-%m-%d %H:%M:%S"),
                     "api_available": True
                 }
@@ -341,23 +353,11 @@ class GoogleTrendsPulse:
                 self.last_data = result
                 self.last_check_time = current_time
                 
-                # Добавляем запись в историю
-                self.history_data.append(result)
-                
-                # Сохраняем историю, ограничиваясь 500 записями
-                if len(self.history_data) > 500:
-                    self.history_data = sorted(
-                        self.history_data,
-                        key=lambda x: x.get("timestamp", ""),
-                        reverse=True
-                    )[:500]
-                
-                try:
-                    with open("trends_history.json", "w") as f:
-                        json.dump(self.history_data, f, indent=2)
-                    logger.info(f"Saved Google Trends history: {len(self.history_data)} records")
-                except Exception as e:
-                    logger.error(f"Error saving Google Trends history: {e}")
+                # Добавляем запись в историю (размер ограничивают уплотнение и срок хранения HistoryAPI)
+                self.history_api.save_google_trends_history(
+                    signal, description, fomo_score=fomo_score, fear_score=fear_score,
+                    general_score=general_score, fomo_to_fear_ratio=fomo_to_fear_ratio
+                )
                 
                 return result
                 
@@ -471,15 +471,8 @@ class GoogleTrendsPulse:
             return self.last_data
             
         # Если есть данные в истории
-        if self.history_data:
-            # Сортируем записи по timestamp
-            sorted_history = sorted(
-                self.history_data,
-                key=lambda x: x.get("timestamp", ""),
-                reverse=True
-            )
-            # Берем самую последнюю запись
-            latest_record = sorted_history[0]
+        latest_record = self._get_latest_history_record()
+        if latest_record:
             # Помечаем данные как исторические, чтобы они отображались в сообщении
             latest_record['from_history'] = True
             latest_record['api_available'] = True  # Для совместимости с другими проверками
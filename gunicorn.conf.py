@@ -0,0 +1,7 @@
+# Конфигурация gunicorn (загружается автоматически из рабочего каталога: gunicorn main:app)
+
+
+def post_worker_init(worker):
+    """Запускает планировщик в каждом воркере после импорта приложения"""
+    from main import init_app
+    init_app()
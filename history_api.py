@@ -1,90 +1,283 @@
 import os
 import json
 import time
+import bisect
+import threading
 from datetime import datetime
 from logger import logger
+from history_storage import create_history_store, normalize_timestamp, encode_cursor, decode_cursor, file_lock
+from history_writer import get_history_writer
+from history_rollups import HistoryRollups, ROLLUP_RESOLUTIONS
+
+# Кеш разобранной и отсортированной истории на уровне процесса, общий для всех
+# экземпляров HistoryAPI: путь к файлу -> (сигнатура файла, отсортированные записи)
+_history_cache = {}
+_history_cache_lock = threading.Lock()
+
 
 class HistoryAPI:
     """
     API для управления историей данных, используя JSON-файлы вместо базы данных
+    
+    Формат хранения задается HISTORY_BACKEND: по умолчанию журнальные файлы
+    JSON Lines (*.jsonl), в которые каждое сохранение дописывает одну строку.
     """
-    def __init__(self, data_dir=None):
+    # Вид истории -> базовое имя файла
+    HISTORY_KINDS = {
+        'rank': 'rank_history',
+        'fear_greed': 'fear_greed_history',
+        'trends': 'trends_history',
+        'altseason': 'altseason_history',
+    }
+    # Вид истории -> поля записи (столбцы CSV-выгрузки)
+    HISTORY_FIELDS = {
+        'rank': ('timestamp', 'rank', 'category', 'change_direction', 'change_value'),
+        'fear_greed': ('timestamp', 'value', 'classification'),
+        'trends': ('timestamp', 'signal', 'description', 'fomo_score', 'fear_score',
+                   'general_score', 'fomo_to_fear_ratio'),
+        'altseason': ('timestamp', 'date', 'signal', 'status', 'description', 'index', 'btc_performance'),
+    }
+    
+    def __init__(self, data_dir=None, backend=None, write_behind=None):
         """
         Инициализирует API истории данных
         
         Args:
             data_dir (str, optional): Директория для хранения файлов истории.
                                      Если не указана, используется директория скрипта.
+            backend (str, optional): Формат хранения ('jsonl' или 'json').
+                                     Если не указан, используется HISTORY_BACKEND из config.py.
+            write_behind (bool, optional): Записывать историю в фоновом потоке.
+                                     Если не указан, используется HISTORY_WRITE_BEHIND из config.py.
         """
         if data_dir is None:
             self.data_dir = os.path.dirname(os.path.abspath(__file__))
         else:
             self.data_dir = data_dir
+        
+        from config import HISTORY_BACKEND, HISTORY_COMPACT_EVERY, HISTORY_WRITE_BEHIND
+        self.backend = backend or HISTORY_BACKEND
+        
+        # Общий для процесса фоновый писатель: сохранение только ставит запись в очередь
+        if write_behind is None:
+            write_behind = HISTORY_WRITE_BEHIND
+        self.writer = get_history_writer() if write_behind else None
+        
+        # Хранилища истории по видам данных
+        self.stores = {
+            kind: create_history_store(self.backend, self.data_dir, name, compact_every=HISTORY_COMPACT_EVERY)
+            for kind, name in self.HISTORY_KINDS.items()
+        }
             
         # Пути к файлам истории
-        self.rank_history_file = os.path.join(self.data_dir, "rank_history.json")
-        self.fear_greed_history_file = os.path.join(self.data_dir, "fear_greed_history.json")
-        self.trends_history_file = os.path.join(self.data_dir, "trends_history.json")
-        self.altseason_history_file = os.path.join(self.data_dir, "altseason_history.json")
+        self.rank_history_file = self.stores['rank'].file_path
+        self.fear_greed_history_file = self.stores['fear_greed'].file_path
+        self.trends_history_file = self.stores['trends'].file_path
+        self.altseason_history_file = self.stores['altseason'].file_path
+        
+        # Дневные и недельные агрегаты (rank, fear_greed, altseason)
+        self.rollups = HistoryRollups(self.data_dir, self.HISTORY_KINDS)
+        
+        # Обработчики завершенной записи по видам истории (один объект на вид,
+        # чтобы фоновый писатель передавал каждому только его записи)
+        self._on_written = {kind: self._make_written_handler(kind) for kind in self.stores}
         
         # Создаем файлы истории, если они не существуют
         self._ensure_history_files_exist()
     
     def _ensure_history_files_exist(self):
         """Создает файлы истории, если они не существуют"""
-        for file_path in [self.rank_history_file, self.fear_greed_history_file, self.trends_history_file, self.altseason_history_file]:
-            if not os.path.exists(file_path):
-                try:
-                    with open(file_path, 'w') as f:
-                        json.dump([], f)
-                    logger.info(f"Created empty history file: {file_path}")
-                except Exception as e:
-                    logger.error(f"Failed to create history file {file_path}: {str(e)}")
+        for store in self.stores.values():
+            store.ensure_exists()
     
-    def _load_history(self, file_path):
+    def _load_history(self, kind):
         """
-        Загружает данные истории из JSON-файла
+        Загружает данные истории
         
         Args:
-            file_path (str): Путь к файлу истории
+            kind (str): Вид истории ('rank', 'fear_greed', 'trends', 'altseason')
             
         Returns:
             list: Данные истории или пустой список, если произошла ошибка
         """
-        try:
-            if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-                with open(file_path, 'r') as f:
-                    return json.load(f)
-            else:
-                return []
-        except Exception as e:
-            logger.error(f"Failed to load history from {file_path}: {str(e)}")
-            return []
+        return self.stores[kind].read_all()
     
-    def _save_history(self, file_path, data):
+    def _append_history(self, kind, entry):
         """
-        Сохраняет данные истории в JSON-файл
+        Добавляет запись в историю
+        
+        При включенной фоновой записи запись ставится в очередь HistoryWriter,
+        и метод возвращается сразу.
         
         Args:
-            file_path (str): Путь к файлу истории
-            data (list): Данные истории для сохранения
+            kind (str): Вид истории
+            entry (dict): Запись истории
             
         Returns:
-            bool: True если сохранение прошло успешно, False в противном случае
+            bool: True если запись сохранена (или поставлена в очередь), False в противном случае
         """
-        try:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=2, default=self._datetime_serializer)
+        store = self.stores[kind]
+        if self.writer is not None:
+            self.writer.submit(store, entry, on_written=self._on_written[kind])
             return True
-        except Exception as e:
-            logger.error(f"Failed to save history to {file_path}: {str(e)}")
-            return False
+        
+        try:
+            with file_lock(store.file_path):
+                saved = store.append(entry)
+        finally:
+            self._invalidate_cache(kind)
+        if saved:
+            self._on_written[kind]([entry])
+        return saved
+    
+    def _make_written_handler(self, kind):
+        def on_written(entries):
+            self._invalidate_cache(kind)
+            self.rollups.update(kind, entries, lambda: self._load_history(kind))
+        return on_written
+    
+    def flush(self, timeout=None):
+        """Дожидается записи всех записей истории, поставленных в очередь"""
+        if self.writer is not None:
+            return self.writer.flush(timeout)
+        return True
     
-    def _datetime_serializer(self, obj):
-        """Сериализатор для объектов datetime в JSON"""
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        raise TypeError(f"Type {type(obj)} not serializable")
+    def _invalidate_cache(self, kind):
+        """Сбрасывает кеш истории после записи в этом процессе"""
+        with _history_cache_lock:
+            _history_cache.pop(self.stores[kind].file_path, None)
+    
+    def _get_cached_history(self, kind):
+        """
+        Возвращает историю, разобранную и отсортированную по ключу (timestamp, порядковый номер)
+        
+        Результат кешируется на уровне процесса и перечитывается только при изменении
+        mtime или размера файла либо после записи в этом процессе.
+        
+        Returns:
+            tuple: (ключи по возрастанию, записи в том же порядке)
+        """
+        store = self.stores[kind]
+        signature = store.signature()
+        with _history_cache_lock:
+            cached = _history_cache.get(store.file_path)
+        if cached is not None and signature is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        
+        keyed = sorted(
+            ((normalize_timestamp(entry.get('timestamp')), position), entry)
+            for position, entry in enumerate(self._load_history(kind))
+        )
+        keys = [key for key, _ in keyed]
+        records = self._parse_timestamps([entry for _, entry in keyed])
+        
+        with _history_cache_lock:
+            _history_cache[store.file_path] = (signature, keys, records)
+        return keys, records
+    
+    def _parse_timestamps(self, history):
+        """Парсит timestamp записей в datetime"""
+        for entry in history:
+            if 'timestamp' in entry and isinstance(entry['timestamp'], str):
+                try:
+                    entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
+                except (ValueError, TypeError):
+                    entry['timestamp'] = datetime.utcnow()
+        return history
+    
+    def _get_sorted_history(self, kind, limit, offset):
+        """
+        Возвращает страницу истории, отсортированной по времени (новые сначала)
+        """
+        store = self.stores[kind]
+        if hasattr(store, 'latest'):
+            # SQLite: сортировка и пагинация выполняются по индексу
+            return self._parse_timestamps(store.latest(limit, offset))
+        
+        # Файловые хранилища: записи уже разобраны и отсортированы в кеше процесса
+        _, records = self._get_cached_history(kind)
+        
+        # Применяем пагинацию (новые сначала); копии записей, чтобы вызывающий код не менял кеш
+        end = max(len(records) - offset, 0)
+        start = max(end - limit, 0)
+        return [dict(entry) for entry in reversed(records[start:end])]
+    
+    def get_history_page(self, kind, limit=100, cursor=None):
+        """
+        Keyset-пагинация истории: новые записи сначала, следующая страница по курсору
+        
+        Args:
+            kind (str): Вид истории ('rank', 'fear_greed', 'trends', 'altseason')
+            limit (int): Размер страницы
+            cursor (str, optional): Курсор next_cursor из предыдущей страницы
+            
+        Returns:
+            tuple: (список записей, курсор следующей страницы или None)
+            
+        Raises:
+            ValueError: если курсор имеет неверный формат
+        """
+        store = self.stores[kind]
+        if hasattr(store, 'page'):
+            records, next_cursor = store.page(limit, cursor)
+            return self._parse_timestamps(records), next_cursor
+        
+        # Файловые хранилища: ключ записи - (timestamp, порядковый номер в файле)
+        keys, records = self._get_cached_history(kind)
+        end = bisect.bisect_left(keys, decode_cursor(cursor)) if cursor else len(keys)
+        start = max(end - limit, 0)
+        page = [dict(entry) for entry in reversed(records[start:end])]
+        next_cursor = encode_cursor(*keys[start]) if start > 0 and page else None
+        return page, next_cursor
+    
+    def iter_history(self, kind, start=None, end=None):
+        """
+        Последовательно возвращает записи за период, старые сначала
+        
+        Журнал JSON Lines читается построчно, SQLite - пакетами по индексу
+        (timestamp, id), поэтому память не зависит от размера истории. Для JSON-массива
+        прежнего формата границы находятся бинарным поиском по кешу отсортированных ключей.
+        
+        Args:
+            kind (str): Вид истории ('rank', 'fear_greed', 'trends', 'altseason')
+            start (str, optional): Начало периода (включительно), дата или timestamp ISO 8601
+            end (str, optional): Конец периода (не включительно), дата или timestamp ISO 8601
+            
+        Yields:
+            dict: Запись истории с timestamp в виде datetime
+        """
+        start = normalize_timestamp(start) if start else None
+        end = normalize_timestamp(end) if end else None
+        store = self.stores[kind]
+        if hasattr(store, 'iter_range'):
+            for entry in store.iter_range(start, end):
+                yield self._parse_timestamps([entry])[0]
+            return
+        
+        keys, records = self._get_cached_history(kind)
+        lo = bisect.bisect_left(keys, (start,)) if start else 0
+        hi = bisect.bisect_left(keys, (end,)) if end else len(keys)
+        for position in range(lo, hi):
+            yield dict(records[position])
+    
+    def get_rollup_history(self, kind, resolution, limit=100):
+        """
+        Возвращает дневные или недельные агрегаты истории (новые сначала)
+        
+        Args:
+            kind (str): Вид истории ('rank', 'fear_greed', 'altseason')
+            resolution (str): 'day' или 'week'
+            limit (int): Максимальное количество периодов
+            
+        Returns:
+            list: Агрегаты за периоды
+            
+        Raises:
+            ValueError: если для вида истории или разрешения нет агрегатов
+        """
+        if resolution not in ROLLUP_RESOLUTIONS or not self.rollups.supports(kind):
+            raise ValueError(f"Resolution '{resolution}' is not available for {kind} history")
+        return self.rollups.get(kind, resolution, lambda: self._load_history(kind), limit=limit)
     
     def save_rank_history(self, rank, category="Finance", previous_rank=None):
         """
@@ -123,14 +316,8 @@ class HistoryAPI:
                 "timestamp": datetime.utcnow()
             }
             
-            # Загружаем существующую историю
-            history = self._load_history(self.rank_history_file)
-            
-            # Добавляем новую запись
-            history.append(history_entry)
-            
-            # Сохраняем обновленную историю
-            if self._save_history(self.rank_history_file, history):
+            # Дописываем новую запись в историю
+            if self._append_history('rank', history_entry):
                 logger.info(f"Saved new rank history entry: {rank} (change: {change_direction} {change_value})")
                 return history_entry
             else:
@@ -159,14 +346,8 @@ class HistoryAPI:
                 "timestamp": datetime.utcnow()
             }
             
-            # Загружаем существующую историю
-            history = self._load_history(self.fear_greed_history_file)
-            
-            # Добавляем новую запись
-            history.append(history_entry)
-            
-            # Сохраняем обновленную историю
-            if self._save_history(self.fear_greed_history_file, history):
+            # Дописываем новую запись в историю
+            if self._append_history('fear_greed', history_entry):
                 logger.info(f"Saved new Fear & Greed Index history entry: {value} ({classification})")
                 return history_entry
             else:
@@ -204,14 +385,8 @@ class HistoryAPI:
                 "timestamp": datetime.utcnow()
             }
             
-            # Загружаем существующую историю
-            history = self._load_history(self.trends_history_file)
-            
-            # Добавляем новую запись
-            history.append(history_entry)
-            
-            # Сохраняем обновленную историю
-            if self._save_history(self.trends_history_file, history):
+            # Дописываем новую запись в историю
+            if self._append_history('trends', history_entry):
                 logger.info(f"Saved new Google Trends history entry: {signal} - {description}")
                 return history_entry
             else:
@@ -247,14 +422,8 @@ class HistoryAPI:
                 'btc_performance': btc_performance
             }
             
-            # Загружаем существующую историю
-            history = self._load_history(self.altseason_history_file)
-            
-            # Добавляем новую запись
-            history.append(entry)
-            
-            # Сохраняем обновленную историю
-            if self._save_history(self.altseason_history_file, history):
+            # Дописываем новую запись в историю
+            if self._append_history('altseason', entry):
                 logger.info(f"Saved new Altcoin Season Index history entry: {signal} - {status} ({index})")
                 return entry
             else:
@@ -276,21 +445,7 @@ class HistoryAPI:
             list: Список записей истории рейтинга
         """
         try:
-            history = self._load_history(self.rank_history_file)
-            
-            # Парсим timestamp в datetime для правильной сортировки
-            for entry in history:
-                if 'timestamp' in entry and isinstance(entry['timestamp'], str):
-                    try:
-                        entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
-                    except (ValueError, TypeError):
-                        entry['timestamp'] = datetime.utcnow()
-            
-            # Сортируем по времени (новые сначала)
-            history.sort(key=lambda x: x.get('timestamp', datetime.min), reverse=True)
-            
-            # Применяем пагинацию
-            return history[offset:offset + limit]
+            return self._get_sorted_history('rank', limit, offset)
         except Exception as e:
             logger.error(f"Failed to get rank history: {str(e)}")
             return []
@@ -307,21 +462,7 @@ class HistoryAPI:
             list: Список записей истории индекса
         """
         try:
-            history = self._load_history(self.fear_greed_history_file)
-            
-            # Парсим timestamp в datetime для правильной сортировки
-            for entry in history:
-                if 'timestamp' in entry and isinstance(entry['timestamp'], str):
-                    try:
-                        entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
-                    except (ValueError, TypeError):
-                        entry['timestamp'] = datetime.utcnow()
-            
-            # Сортируем по времени (новые сначала)
-            history.sort(key=lambda x: x.get('timestamp', datetime.min), reverse=True)
-            
-            # Применяем пагинацию
-            return history[offset:offset + limit]
+            return self._get_sorted_history('fear_greed', limit, offset)
         except Exception as e:
             logger.error(f"Failed to get Fear & Greed Index history: {str(e)}")
             return []
@@ -338,21 +479,7 @@ class HistoryAPI:
             list: Список записей истории данных Google Trends
         """
         try:
-            history = self._load_history(self.trends_history_file)
-            
-            # Парсим timestamp в datetime для правильной сортировки
-            for entry in history:
-                if 'timestamp' in entry and isinstance(entry['timestamp'], str):
-                    try:
-                        entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
-                    except (ValueError, TypeError):
-                        entry['timestamp'] = datetime.utcnow()
-            
-            # Сортируем по времени (новые сначала)
-            history.sort(key=lambda x: x.get('timestamp', datetime.min), reverse=True)
-            
-            # Применяем пагинацию
-            return history[offset:offset + limit]
+            return self._get_sorted_history('trends', limit, offset)
         except Exception as e:
             logger.error(f"Failed to get Google Trends history: {str(e)}")
             return []
@@ -369,21 +496,7 @@ class HistoryAPI:
             list: Список записей истории данных Altcoin Season Index
         """
         try:
-            history = self._load_history(self.altseason_history_file)
-            
-            # Парсим timestamp в datetime для правильной сортировки
-            for entry in history:
-                if 'timestamp' in entry and isinstance(entry['timestamp'], str):
-                    try:
-                        entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
-                    except (ValueError, TypeError):
-                        entry['timestamp'] = datetime.utcnow()
-            
-            # Сортируем по времени (новые сначала)
-            history.sort(key=lambda x: x.get('timestamp', datetime.min), reverse=True)
-            
-            # Применяем пагинацию
-            return history[offset:offset + limit]
+            return self._get_sorted_history('altseason', limit, offset)
         except Exception as e:
             logger.error(f"Failed to get Altcoin Season Index history: {str(e)}")
             return []
\ No newline at end of file
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Уплотнение истории
+
+Для каждого вида истории:
+- подряд идущие записи одного дня с одинаковыми значениями сворачиваются
+  в первую из них (повтор значения в другой день - реальная точка ряда);
+- если задано окно хранения (HISTORY_RETENTION_DAYS > 0), исходные записи
+  старше него переносятся в сжатый архив <name>_archive.jsonl.gz, а в графиках
+  их заменяют дневные и недельные агрегаты (history_rollups). По умолчанию
+  окно хранения выключено;
+- хранилище перезаписывается атомарно.
+
+Запускается ежедневно лидером планировщика, вручную:
+    python history_compaction.py [--data-dir DIR] [--retention-days N]
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+from logger import logger
+from history_storage import normalize_timestamp, file_lock, _datetime_serializer
+
+# Поля, по которым соседние записи считаются дубликатами
+# (timestamp и вычисляемые поля изменения не сравниваются)
+DEDUPE_FIELDS = {
+    'rank': ('rank', 'category'),
+    'fear_greed': ('value', 'classification'),
+    'trends': ('signal', 'description', 'fomo_score', 'fear_score', 'general_score', 'fomo_to_fear_ratio'),
+    'altseason': ('signal', 'status', 'index', 'btc_performance'),
+}
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def dedupe_consecutive(kind, records):
+    """
+    Сворачивает подряд идущие записи одного дня с одинаковыми значениями в первую из них
+
+    Записи разных дней не сворачиваются, даже если значения совпадают
+    (например, неизменный рейтинг или индекс страха и жадности).
+
+    Args:
+        kind (str): Вид истории
+        records (list): Записи в хронологическом порядке
+
+    Returns:
+        list: Записи без повторов
+    """
+    fields = DEDUPE_FIELDS[kind]
+    result = []
+    previous = None
+    for record in records:
+        day = normalize_timestamp(record.get('timestamp'))[:10]
+        values = (day,) + tuple(record.get(field) for field in fields)
+        if values != previous:
+            result.append(record)
+        previous = values
+    return result
+
+
+def archive_records(archive_path, records):
+    """
+    Дописывает записи в сжатый архив JSON Lines (новым gzip-блоком)
+
+    Args:
+        archive_path (str): Путь к архиву .jsonl.gz
+        records (list): Записи для архивации
+    """
+    content = "".join(json.dumps(record, default=_datetime_serializer) + "\n" for record in records)
+    with open(archive_path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+            f.write(content.encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def compact_history(history_api=None, retention_days=None):
+    """
+    Уплотняет все хранилища истории
+
+    Args:
+        history_api (HistoryAPI, optional): API истории (по умолчанию создается новый)
+        retention_days (int, optional): Окно хранения исходных записей в днях
+                                        (по умолчанию HISTORY_RETENTION_DAYS из config.py, 0 - без ограничения)
+
+    Returns:
+        dict: Отчет: число записей по видам истории, сэкономленные байты и время выполнения
+    """
+    from history_api import HistoryAPI
+    if history_api is None:
+        history_api = HistoryAPI()
+    if retention_days is None:
+        from config import HISTORY_RETENTION_DAYS
+        retention_days = HISTORY_RETENTION_DAYS
+
+    started = time.monotonic()
+    # Записи из очереди фонового писателя должны попасть в файлы до уплотнения
+    history_api.flush()
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat() if retention_days else None
+
+    # Несколько видов истории могут храниться в одном файле (SQLite)
+    paths = {store.file_path for store in history_api.stores.values()}
+    bytes_before = sum(_file_size(path) for path in paths)
+
+    kinds = {}
+    for kind, store in history_api.stores.items():
+        with file_lock(store.file_path):
+            kinds[kind] = _compact_store(history_api, kind, store, cutoff)
+
+    for store in history_api.stores.values():
+        if hasattr(store, 'vacuum'):
+            store.vacuum()
+            break
+
+    bytes_after = sum(_file_size(path) for path in paths)
+    report = {
+        'kinds': kinds,
+        'retention_days': retention_days,
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'bytes_saved': bytes_before - bytes_after,
+        'runtime_seconds': round(time.monotonic() - started, 3),
+    }
+    logger.info(f"History compaction finished in {report['runtime_seconds']}s, "
+                f"saved {report['bytes_saved']} bytes: {kinds}")
+    return report
+
+
+def _compact_store(history_api, kind, store, cutoff):
+    """
+    Уплотняет одно хранилище (вызывается под блокировкой его файла)
+
+    Returns:
+        dict: Количество записей до и после, удаленных дубликатов и архивированных записей
+    """
+    records = store.read_all()
+    ordered = [record for _, _, record in sorted(
+        (normalize_timestamp(record.get('timestamp')), position, record)
+        for position, record in enumerate(records)
+    )]
+    kept = dedupe_consecutive(kind, ordered)
+    duplicates = len(ordered) - len(kept)
+
+    archived = []
+    if cutoff:
+        # Перед удалением старых записей агрегаты должны быть построены по полной истории
+        if history_api.rollups.supports(kind):
+            history_api.rollups.ensure_built(kind, lambda: ordered)
+        archived = [record for record in kept if normalize_timestamp(record.get('timestamp')) < cutoff]
+        kept = kept[len(archived):]
+
+    if duplicates or archived:
+        if archived:
+            archive_path = os.path.join(history_api.data_dir, f"{history_api.HISTORY_KINDS[kind]}_archive.jsonl.gz")
+            archive_records(archive_path, archived)
+        if not store.rewrite(kept):
+            raise RuntimeError(f"Failed to rewrite {kind} history during compaction")
+        history_api._invalidate_cache(kind)
+
+    return {
+        'records_before': len(records),
+        'records_after': len(kept),
+        'duplicates_removed': duplicates,
+        'archived': len(archived),
+    }
+
+
+def main():
+    default_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compact history stores")
+    parser.add_argument('--data-dir', default=default_dir, help="Directory with history files")
+    parser.add_argument('--retention-days', type=int, default=None,
+                        help="Archive raw records older than N days (default: HISTORY_RETENTION_DAYS from config.py)")
+    args = parser.parse_args()
+
+    from history_api import HistoryAPI
+    report = compact_history(HistoryAPI(args.data_dir), retention_days=args.retention_days)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
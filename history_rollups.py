@@ -0,0 +1,219 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from logger import logger
+from history_storage import atomic_write, normalize_timestamp, file_lock
+
+# Поддерживаемые разрешения агрегатов
+ROLLUP_RESOLUTIONS = ('day', 'week')
+
+
+def bucket_start(timestamp, resolution):
+    """
+    Возвращает начало периода агрегата для записи
+
+    Args:
+        timestamp (str): Timestamp записи в формате ISO 8601
+        resolution (str): 'day' или 'week' (неделя начинается с понедельника)
+
+    Returns:
+        str: Дата начала периода в формате YYYY-MM-DD
+    """
+    day = datetime.fromisoformat(timestamp).date()
+    if resolution == 'week':
+        day -= timedelta(days=day.weekday())
+    return day.isoformat()
+
+
+def _merge_rank(bucket, entry, timestamp):
+    """Рейтинг: open/high/low/close за период"""
+    rank = entry.get('rank')
+    if rank is None:
+        return
+    if 'open' not in bucket:
+        bucket.update(open=rank, high=rank, low=rank, close=rank, open_at=timestamp, close_at=timestamp)
+    if timestamp < bucket['open_at']:
+        bucket.update(open=rank, open_at=timestamp)
+    if timestamp >= bucket['close_at']:
+        bucket.update(close=rank, close_at=timestamp)
+    bucket['high'] = max(bucket['high'], rank)
+    bucket['low'] = min(bucket['low'], rank)
+    bucket['count'] = bucket.get('count', 0) + 1
+
+
+def _merge_fear_greed(bucket, entry, timestamp):
+    """Fear & Greed: среднее значение за период и последняя классификация"""
+    value = entry.get('value')
+    if value is None:
+        return
+    bucket['sum'] = bucket.get('sum', 0) + value
+    bucket['count'] = bucket.get('count', 0) + 1
+    bucket['value'] = round(bucket['sum'] / bucket['count'], 2)
+    if timestamp >= bucket.get('close_at', ''):
+        bucket.update(classification=entry.get('classification'), close_at=timestamp)
+
+
+def _merge_altseason(bucket, entry, timestamp):
+    """Altseason: последнее значение индекса за период"""
+    if entry.get('index') is None:
+        return
+    bucket['count'] = bucket.get('count', 0) + 1
+    if timestamp >= bucket.get('close_at', ''):
+        bucket.update(index=entry.get('index'), signal=entry.get('signal'), status=entry.get('status'),
+                      btc_performance=entry.get('btc_performance'), close_at=timestamp)
+
+
+# Вид истории -> функция добавления записи в агрегат
+ROLLUP_MERGERS = {
+    'rank': _merge_rank,
+    'fear_greed': _merge_fear_greed,
+    'altseason': _merge_altseason,
+}
+
+
+class HistoryRollups:
+    """
+    Дневные и недельные агрегаты истории
+
+    Агрегаты хранятся в небольшом JSON-файле на каждый вид истории
+    ({name}_rollups.json) и обновляются инкрементально при каждом сохранении,
+    поэтому графики за несколько лет читают сотни точек вместо всех исходных записей.
+    Файл строится из исходной истории только один раз, если его еще нет.
+    Чтение, слияние и запись файла выполняются под межпроцессной блокировкой
+    (file_lock), так как агрегаты обновляют все процессы приложения.
+    """
+
+    def __init__(self, data_dir, kinds):
+        """
+        Args:
+            data_dir (str): Директория файлов истории
+            kinds (dict): Вид истории -> базовое имя файла (HistoryAPI.HISTORY_KINDS)
+        """
+        self.paths = {
+            kind: os.path.join(data_dir, f"{name}_rollups.json")
+            for kind, name in kinds.items() if kind in ROLLUP_MERGERS
+        }
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def supports(self, kind):
+        return kind in self.paths
+
+    def _load(self, kind):
+        """
+        Returns:
+            dict: {resolution: {начало периода: агрегат}} или None, если файла нет
+        """
+        path = self.paths[kind]
+        try:
+            st = os.stat(path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+        cached = self._cache.get(kind)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            with open(path, 'r') as f:
+                rollups = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load rollups {path}, they will be rebuilt: {str(e)}")
+            return None
+        for resolution in ROLLUP_RESOLUTIONS:
+            rollups.setdefault(resolution, {})
+        self._cache[kind] = (signature, rollups)
+        return rollups
+
+    def _save(self, kind, rollups):
+        path = self.paths[kind]
+        atomic_write(path, json.dumps(rollups, ensure_ascii=False, sort_keys=True))
+        st = os.stat(path)
+        self._cache[kind] = ((st.st_mtime_ns, st.st_size), rollups)
+
+    def _merge(self, kind, rollups, entries):
+        merge = ROLLUP_MERGERS[kind]
+        for entry in entries:
+            timestamp = normalize_timestamp(entry.get('timestamp'))
+            try:
+                for resolution in ROLLUP_RESOLUTIONS:
+                    start = bucket_start(timestamp, resolution)
+                    merge(rollups[resolution].setdefault(start, {}), entry, timestamp)
+            except ValueError:
+                logger.warning(f"Skipping {kind} history entry with invalid timestamp in rollups: {timestamp}")
+
+    def _rebuild_locked(self, kind, entries):
+        rollups = {resolution: {} for resolution in ROLLUP_RESOLUTIONS}
+        self._merge(kind, rollups, entries)
+        self._save(kind, rollups)
+        logger.info(f"Rebuilt {kind} rollups from {len(entries)} history entries")
+        return rollups
+
+    def _load_or_build_locked(self, kind, load_history):
+        rollups = self._load(kind)
+        if rollups is None:
+            rollups = self._rebuild_locked(kind, load_history())
+        return rollups
+
+    def rebuild(self, kind, entries):
+        """Полностью пересчитывает агрегаты по исходной истории"""
+        with self._lock, file_lock(self.paths[kind]):
+            return self._rebuild_locked(kind, entries)
+
+    def ensure_built(self, kind, load_history):
+        """Строит агрегаты по исходной истории, если их файла еще нет"""
+        with self._lock, file_lock(self.paths[kind]):
+            self._load_or_build_locked(kind, load_history)
+
+    def update(self, kind, entries, load_history):
+        """
+        Добавляет новые записи в агрегаты
+
+        Args:
+            kind (str): Вид истории
+            entries (list): Новые записи
+            load_history (callable): Загрузка всей исходной истории, если агрегатов еще нет
+                                     (новые записи в ней уже должны присутствовать)
+        """
+        if not self.supports(kind):
+            return
+        try:
+            with self._lock, file_lock(self.paths[kind]):
+                # Файл перечитывается под блокировкой: его могли обновить другие процессы
+                rollups = self._load(kind)
+                if rollups is None:
+                    self._rebuild_locked(kind, load_history())
+                    return
+                self._merge(kind, rollups, entries)
+                self._save(kind, rollups)
+        except Exception as e:
+            # Кешированные агрегаты могли быть частично изменены слиянием
+            self._cache.pop(kind, None)
+            logger.error(f"Failed to update {kind} rollups: {str(e)}")
+
+    def get(self, kind, resolution, load_history, limit=100):
+        """
+        Возвращает агрегаты, отсортированные по началу периода (новые сначала)
+
+        Args:
+            kind (str): Вид истории
+            resolution (str): 'day' или 'week'
+            load_history (callable): Загрузка исходной истории, если агрегатов еще нет
+            limit (int): Максимальное количество периодов
+
+        Returns:
+            list: Агрегаты; timestamp каждого равен началу периода
+        """
+        with self._lock:
+            rollups = self._load(kind)
+        if rollups is None:
+            with self._lock, file_lock(self.paths[kind]):
+                rollups = self._load_or_build_locked(kind, load_history)
+
+        buckets = rollups[resolution]
+        result = []
+        for start in sorted(buckets, reverse=True)[:limit]:
+            bucket = {key: value for key, value in buckets[start].items() if key != 'sum'}
+            bucket.update(period=resolution, timestamp=datetime.fromisoformat(start))
+            result.append(bucket)
+        return result
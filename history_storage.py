@@ -0,0 +1,660 @@
+import os
+import json
+import fcntl
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from logger import logger
+
+
+def _datetime_serializer(obj):
+    """Сериализатор для объектов datetime в JSON"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def atomic_write(file_path, content):
+    """
+    Атомарно заменяет содержимое файла: запись во временный файл, fsync и rename
+
+    У каждого вызова свой временный файл в той же директории, поэтому
+    одновременные писатели (потоки и процессы без file_lock) не смешивают
+    содержимое: файл целиком заменяется одной из версий.
+
+    Args:
+        file_path (str): Путь к файлу
+        content (str): Новое содержимое
+    """
+    directory, name = os.path.split(file_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp создает файл с правами 0600
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def file_lock(file_path):
+    """
+    Межпроцессная блокировка файла истории (flock на соседнем файле .lock)
+
+    Защищает запись и перезапись хранилища от одновременных изменений
+    из разных процессов (планировщик, воркеры веб-сервера, уплотнение).
+    """
+    with open(f"{file_path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class JsonArrayStore:
+    """
+    Хранилище истории в виде одного JSON-массива (исходный формат)
+
+    Каждое добавление перечитывает и перезаписывает весь файл, поэтому
+    используется только для совместимости (HISTORY_BACKEND=json).
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def ensure_exists(self):
+        """Создает пустой файл истории, если он не существует"""
+        if not os.path.exists(self.file_path):
+            try:
+                atomic_write(self.file_path, "[]")
+                logger.info(f"Created empty history file: {self.file_path}")
+            except Exception as e:
+                logger.error(f"Failed to create history file {self.file_path}: {str(e)}")
+
+    def read_all(self):
+        """
+        Returns:
+            list: Все записи в порядке добавления или пустой список при ошибке
+        """
+        try:
+            if os.path.exists(self.file_path) and os.path.getsize(self.file_path) > 0:
+                with open(self.file_path, 'r') as f:
+                    return json.load(f)
+            return []
+        except Exception as e:
+            logger.error(f"Failed to load history from {self.file_path}: {str(e)}")
+            return []
+
+    def append_many(self, records):
+        """
+        Добавляет записи в конец истории
+
+        Returns:
+            bool: True если сохранение прошло успешно
+        """
+        history = self.read_all()
+        history.extend(records)
+        return self.rewrite(history)
+
+    def append(self, record):
+        return self.append_many([record])
+
+    def signature(self):
+        """
+        Returns:
+            tuple: (mtime_ns, size) файла для проверки актуальности кеша или None, если файла нет
+        """
+        try:
+            st = os.stat(self.file_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def rewrite(self, records):
+        """
+        Атомарно заменяет всю историю
+
+        Returns:
+            bool: True если сохранение прошло успешно
+        """
+        try:
+            atomic_write(self.file_path, json.dumps(records, indent=2, default=_datetime_serializer))
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save history to {self.file_path}: {str(e)}")
+            return False
+
+
+class JsonlAppendStore:
+    """
+    Журнальное (append-only) хранилище истории в формате JSON Lines
+
+    Каждая запись - одна строка. Сохранение дописывает строку в конец файла,
+    поэтому стоимость записи O(1) независимо от длины истории. Строка,
+    оборванная сбоем во время записи, пропускается при чтении и удаляется
+    при следующем уплотнении (compaction), которое переписывает файл
+    атомарно через временный файл и rename.
+    """
+
+    def __init__(self, file_path, legacy_path=None, compact_every=500):
+        """
+        Args:
+            file_path (str): Путь к файлу .jsonl
+            legacy_path (str, optional): Путь к JSON-массиву прежнего формата для однократного импорта
+            compact_every (int): Количество добавлений между плановыми уплотнениями
+        """
+        self.file_path = file_path
+        self.legacy_path = legacy_path
+        self.compact_every = compact_every
+        # Счетчик добавлений хранится рядом с журналом: HistoryAPI создается заново
+        # в каждом задании и процессе, и счетчик в памяти почти никогда не доходил бы до порога
+        self.counter_path = f"{file_path}.appends"
+        self._needs_compaction = False
+
+    def ensure_exists(self):
+        """
+        Создает файл журнала; при наличии истории в старом формате импортирует ее один раз
+        """
+        if os.path.exists(self.file_path):
+            return
+        try:
+            records = []
+            if self.legacy_path and os.path.exists(self.legacy_path) and os.path.getsize(self.legacy_path) > 0:
+                with open(self.legacy_path, 'r') as f:
+                    records = json.load(f)
+                logger.info(f"Importing {len(records)} records from {self.legacy_path} into {self.file_path}")
+            self.rewrite(records)
+            if not records:
+                logger.info(f"Created empty history file: {self.file_path}")
+        except Exception as e:
+            logger.error(f"Failed to create history file {self.file_path}: {str(e)}")
+
+    def _serialize(self, records):
+        return "".join(json.dumps(record, default=_datetime_serializer) + "\n" for record in records)
+
+    def read_all(self):
+        """
+        Returns:
+            list: Все записи в порядке добавления; поврежденные строки пропускаются
+        """
+        records = []
+        try:
+            if not os.path.exists(self.file_path):
+                return records
+            with open(self.file_path, 'r') as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        self._needs_compaction = True
+                        logger.warning(f"Skipping corrupted line {line_number} in {self.file_path}")
+        except Exception as e:
+            logger.error(f"Failed to load history from {self.file_path}: {str(e)}")
+        return records
+
+    def iter_range(self, start=None, end=None):
+        """
+        Построчно читает журнал и возвращает записи за период, не загружая файл целиком
+
+        Записи идут в порядке добавления (он же хронологический: журнал
+        дописывается по времени, уплотнение сохраняет сортировку), поэтому
+        начало периода находится двоичным поиском по смещениям в файле,
+        а чтение останавливается на первой записи после конца периода.
+
+        Args:
+            start (str, optional): Начало периода (включительно), timestamp ISO 8601
+            end (str, optional): Конец периода (не включительно), timestamp ISO 8601
+
+        Yields:
+            dict: Запись истории
+        """
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'rb') as f:
+            if start:
+                f.seek(self._find_offset(f, start))
+            for line in f:
+                record = self._parse_line(line)
+                if record is None:
+                    continue
+                timestamp = normalize_timestamp(record.get('timestamp'))
+                if start and timestamp < start:
+                    continue
+                if end and timestamp >= end:
+                    break
+                yield record
+
+    @staticmethod
+    def _parse_line(line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def _find_offset(self, f, start):
+        """
+        Двоичный поиск смещения первой строки с timestamp >= start
+
+        Returns:
+            int: Смещение начала строки (размер файла, если таких записей нет)
+        """
+        def first_timestamp_after(offset):
+            # Первая целая корректная строка, начинающаяся не раньше offset
+            if offset > 0:
+                f.seek(offset - 1)
+                f.readline()
+            else:
+                f.seek(0)
+            for line in iter(f.readline, b''):
+                record = self._parse_line(line)
+                if record is not None:
+                    return normalize_timestamp(record.get('timestamp'))
+            return None
+
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            timestamp = first_timestamp_after(mid)
+            if timestamp is None or timestamp >= start:
+                hi = mid
+            else:
+                lo = mid + 1
+        # Выравниваем найденное смещение на начало строки
+        if lo > 0:
+            f.seek(lo - 1)
+            f.readline()
+            return f.tell()
+        return 0
+
+    def append_many(self, records):
+        """
+        Дописывает записи в конец журнала одной операцией записи
+
+        Returns:
+            bool: True если сохранение прошло успешно
+        """
+        if not records:
+            return True
+        try:
+            payload = self._serialize(records).encode('utf-8')
+            fd = os.open(self.file_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # Если предыдущая запись оборвалась без перевода строки,
+                # начинаем с новой строки, чтобы не склеить записи
+                end = os.lseek(fd, 0, os.SEEK_END)
+                if end > 0:
+                    os.lseek(fd, end - 1, os.SEEK_SET)
+                    if os.read(fd, 1) != b"\n":
+                        payload = b"\n" + payload
+                        self._needs_compaction = True
+                os.write(fd, payload)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except Exception as e:
+            logger.error(f"Failed to append history to {self.file_path}: {str(e)}")
+            return False
+
+        appends = self._count_appends(len(records))
+        if self._needs_compaction or appends >= self.compact_every:
+            self.compact()
+        return True
+
+    def _count_appends(self, count):
+        """
+        Увеличивает сохраненный счетчик добавлений с последнего уплотнения
+
+        Вызывается под той же блокировкой, что и запись в журнал (file_lock у вызывающих).
+
+        Returns:
+            int: Количество добавленных записей с последнего уплотнения
+        """
+        total = count
+        try:
+            with open(self.counter_path, 'r') as f:
+                total += int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            pass
+        try:
+            atomic_write(self.counter_path, str(total))
+        except Exception as e:
+            logger.warning(f"Failed to save append counter {self.counter_path}: {str(e)}")
+        return total
+
+    def append(self, record):
+        return self.append_many([record])
+
+    def signature(self):
+        """
+        Returns:
+            tuple: (mtime_ns, size) файла для проверки актуальности кеша или None, если файла нет
+        """
+        try:
+            st = os.stat(self.file_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def rewrite(self, records):
+        """
+        Атомарно заменяет весь журнал
+
+        Returns:
+            bool: True если сохранение прошло успешно
+        """
+        try:
+            atomic_write(self.file_path, self._serialize(records))
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save history to {self.file_path}: {str(e)}")
+            return False
+
+    def compact(self):
+        """
+        Переписывает журнал без поврежденных строк (атомарно)
+
+        Returns:
+            bool: True если уплотнение прошло успешно
+        """
+        self._needs_compaction = False
+        records = self.read_all()
+        if self.rewrite(records):
+            try:
+                atomic_write(self.counter_path, "0")
+            except Exception as e:
+                logger.warning(f"Failed to reset append counter {self.counter_path}: {str(e)}")
+            logger.info(f"Compacted history file {self.file_path}: {len(records)} records")
+            return True
+        return False
+
+
+def normalize_timestamp(value):
+    """
+    Приводит timestamp записи к строке ISO 8601, которая сортируется лексикографически
+
+    Args:
+        value: datetime, строка ISO / 'YYYY-MM-DD HH:MM:SS' или unix-время
+
+    Returns:
+        str: Timestamp в формате ISO 8601
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value).isoformat()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).isoformat()
+        except ValueError:
+            return value
+    return datetime.utcnow().isoformat()
+
+
+class SqliteHistoryStore:
+    """
+    Хранилище истории в SQLite: одна таблица на вид истории
+
+    Записи хранятся как JSON вместе с отдельным столбцом timestamp,
+    по которому построен индекс (timestamp, id). Постраничное чтение
+    использует keyset-пагинацию: курсор указывает на последнюю выданную
+    запись, и следующая страница читается по индексу без OFFSET.
+    """
+
+    def __init__(self, db_path, table):
+        """
+        Args:
+            db_path (str): Путь к файлу базы SQLite
+            table (str): Имя таблицы, например 'rank_history'
+        """
+        self.db_path = db_path
+        self.file_path = db_path
+        self.table = table
+        self._local = threading.local()
+
+    def _connect(self):
+        # Одно соединение на поток: sqlite3 не разрешает использовать соединение из другого потока
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def ensure_exists(self):
+        """Создает таблицу и индекс по времени, если они не существуют"""
+        try:
+            conn = self._connect()
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "timestamp TEXT NOT NULL, "
+                "record TEXT NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_timestamp ON {self.table} (timestamp, id)"
+            )
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to create history table {self.table} in {self.db_path}: {str(e)}")
+
+    def _rows_to_records(self, rows):
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self):
+        """
+        Returns:
+            int: Количество записей в таблице
+        """
+        try:
+            return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        except Exception as e:
+            logger.error(f"Failed to count history in {self.table}: {str(e)}")
+            return 0
+
+    def read_all(self):
+        """
+        Returns:
+            list: Все записи в порядке добавления
+        """
+        try:
+            rows = self._connect().execute(f"SELECT record FROM {self.table} ORDER BY id").fetchall()
+            return self._rows_to_records(rows)
+        except Exception as e:
+            logger.error(f"Failed to load history from {self.table}: {str(e)}")
+            return []
+
+    def append_many(self, records):
+        """
+        Добавляет записи одной транзакцией
+
+        Returns:
+            bool: True если сохранение прошло успешно
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO {self.table} (timestamp, record) VALUES (?, ?)",
+                    [(normalize_timestamp(record.get('timestamp')),
+                      json.dumps(record, default=_datetime_serializer)) for record in records]
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to append history to {self.table}: {str(e)}")
+            return False
+
+    def append(self, record):
+        return self.append_many([record])
+
+    def rewrite(self, records):
+        """
+        Заменяет все записи таблицы одной транзакцией
+
+        Returns:
+            bool: True если сохранение прошло успешно
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(f"DELETE FROM {self.table}")
+                conn.executemany(
+                    f"INSERT INTO {self.table} (timestamp, record) VALUES (?, ?)",
+                    [(normalize_timestamp(record.get('timestamp')),
+                      json.dumps(record, default=_datetime_serializer)) for record in records]
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save history to {self.table}: {str(e)}")
+            return False
+
+    def iter_range(self, start=None, end=None, batch_size=500):
+        """
+        Последовательно читает записи за период по индексу (timestamp, id), старые сначала
+
+        Args:
+            start (str, optional): Начало периода в формате ISO 8601 (включительно)
+            end (str, optional): Конец периода в формате ISO 8601 (не включительно)
+            batch_size (int): Количество строк, читаемых из базы за раз
+
+        Yields:
+            dict: Запись истории
+        """
+        conditions, params = [], []
+        if start:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        cursor = self._connect().execute(
+            f"SELECT record FROM {self.table} {where}ORDER BY timestamp, id", params
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield json.loads(row[0])
+        finally:
+            cursor.close()
+
+    def vacuum(self):
+        """Возвращает освободившиеся страницы базы файловой системе"""
+        try:
+            self._connect().execute("VACUUM")
+        except Exception as e:
+            logger.error(f"Failed to vacuum history database {self.db_path}: {str(e)}")
+
+    def latest(self, limit, offset=0):
+        """
+        Returns:
+            list: Страница записей, отсортированных по времени (новые сначала)
+        """
+        try:
+            rows = self._connect().execute(
+                f"SELECT record FROM {self.table} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+            return self._rows_to_records(rows)
+        except Exception as e:
+            logger.error(f"Failed to read history from {self.table}: {str(e)}")
+            return []
+
+    def page(self, limit, cursor=None):
+        """
+        Keyset-пагинация по индексу (timestamp, id), новые записи сначала
+
+        Args:
+            limit (int): Размер страницы
+            cursor (str, optional): Курсор из предыдущей страницы
+
+        Returns:
+            tuple: (список записей, курсор следующей страницы или None)
+        """
+        try:
+            conn = self._connect()
+            if cursor:
+                timestamp, row_id = decode_cursor(cursor)
+                rows = conn.execute(
+                    f"SELECT record, timestamp, id FROM {self.table} "
+                    "WHERE (timestamp < ?) OR (timestamp = ? AND id < ?) "
+                    "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                    (timestamp, timestamp, row_id, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT record, timestamp, id FROM {self.table} "
+                    "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                    (limit,)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Failed to read history page from {self.table}: {str(e)}")
+            return [], None
+
+        records = self._rows_to_records(rows)
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][2]) if len(rows) == limit else None
+        return records, next_cursor
+
+
+def encode_cursor(timestamp, position):
+    """Формирует курсор keyset-пагинации из timestamp и порядкового номера записи"""
+    return f"{timestamp}_{position}"
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (timestamp, position)
+
+    Raises:
+        ValueError: если курсор имеет неверный формат
+    """
+    timestamp, _, position = cursor.rpartition('_')
+    if not timestamp:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return timestamp, int(position)
+
+
+def create_history_store(backend, data_dir, name, compact_every=500):
+    """
+    Создает хранилище истории выбранного типа
+
+    Args:
+        backend (str): 'jsonl' (по умолчанию), 'json' или 'sqlite'
+        data_dir (str): Директория файлов истории
+        name (str): Базовое имя файла без расширения, например 'rank_history'
+        compact_every (int): Интервал уплотнения для журнального хранилища
+
+    Returns:
+        JsonArrayStore, JsonlAppendStore или SqliteHistoryStore
+    """
+    legacy_path = os.path.join(data_dir, f"{name}.json")
+    if backend == "json":
+        return JsonArrayStore(legacy_path)
+    if backend == "sqlite":
+        from config import HISTORY_DB
+        db_path = HISTORY_DB if os.path.isabs(HISTORY_DB) else os.path.join(data_dir, HISTORY_DB)
+        return SqliteHistoryStore(db_path, name)
+    if backend != "jsonl":
+        logger.warning(f"Unknown history backend '{backend}', using jsonl")
+    return JsonlAppendStore(os.path.join(data_dir, f"{name}.jsonl"), legacy_path=legacy_path,
+                            compact_every=compact_every)
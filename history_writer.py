@@ -0,0 +1,189 @@
+import queue
+import atexit
+import threading
+from logger import logger
+from history_storage import file_lock
+
+
+class HistoryWriter:
+    """
+    Фоновая запись истории (write-behind)
+
+    Вызывающий код ставит запись в очередь и сразу продолжает работу.
+    Один фоновый поток собирает накопившиеся записи в пакеты и дописывает
+    их в хранилище одним вызовом append_many под блокировкой потока и файла,
+    поэтому одновременные записи из планировщика и веб-маршрутов не теряются.
+    Записи, которые не удалось сохранить, остаются в начале очереди и
+    записываются повторно с нарастающей паузой, пока хранилище не восстановится.
+    При завершении процесса очередь дописывается полностью.
+    """
+
+    def __init__(self, flush_interval=0.5, max_batch=500, retry_delay=1.0, max_retry_delay=60.0):
+        """
+        Args:
+            flush_interval (float): Максимальное ожидание новых записей перед записью пакета (сек)
+            max_batch (int): Максимальный размер пакета
+            retry_delay (float): Пауза перед первой повторной записью после ошибки (сек)
+            max_retry_delay (float): Максимальная пауза между повторными записями (сек)
+        """
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._queue = queue.Queue()
+        # Несохраненные записи (в исходном порядке) - записываются раньше новых из очереди
+        self._failed = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запускает фоновый поток записи"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="history-writer")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def submit(self, store, entry, on_written=None):
+        """
+        Ставит запись в очередь
+
+        Args:
+            store: Хранилище истории (JsonlAppendStore, JsonArrayStore, SqliteHistoryStore)
+            entry (dict): Запись истории
+            on_written (callable, optional): Вызывается со списком записей пакета после записи
+        """
+        self.start()
+        self._queue.put((store, entry, on_written))
+
+    def flush(self, timeout=None):
+        """
+        Дожидается записи всех поставленных в очередь записей
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания в секундах (None - без ограничения)
+
+        Returns:
+            bool: True если очередь полностью записана
+        """
+        if not (self._thread and self._thread.is_alive()):
+            # Поток не запущен (или уже остановлен) - записываем оставшееся в текущем потоке
+            self._drain()
+            return not self._failed
+        done = threading.Event()
+        self._queue.put((None, done, None))
+        return done.wait(timeout)
+
+    def stop(self, timeout=10):
+        """Дописывает очередь и останавливает фоновый поток"""
+        if self._thread and self._thread.is_alive():
+            self.flush(timeout)
+            self._stop_event.set()
+            self._thread.join(timeout=1)
+        self._drain()
+
+    def _run(self):
+        delay = self.retry_delay
+        while not self._stop_event.is_set():
+            if self._failed:
+                batch, self._failed = self._failed, []
+            else:
+                try:
+                    batch = [self._queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._failed = self._write_batch(batch)
+            if self._failed:
+                logger.warning(f"Retrying {len(self._failed)} unsaved history entries in {delay:g}s")
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+            else:
+                delay = self.retry_delay
+
+    def _drain(self):
+        batch, self._failed = self._failed, []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._failed = self._write_batch(batch)
+            if self._failed:
+                logger.error(f"{len(self._failed)} history entries are still unsaved")
+
+    def _write_batch(self, batch):
+        """
+        Записывает пакет: одно append_many на хранилище, затем обратные вызовы
+
+        Returns:
+            list: Элементы пакета, которые нужно записать повторно (пустой при успехе);
+                  маркеры flush() повторяются вместе с ними
+        """
+        groups = {}
+        markers = []
+        failed = []
+        for item in batch:
+            store, entry, on_written = item
+            if store is None:
+                markers.append(item)
+                continue
+            group = groups.setdefault(store.file_path, (store, [], []))
+            group[1].append(item)
+            group[2].append(on_written)
+
+        for path, (store, items, handlers) in groups.items():
+            entries = [entry for _, entry, _ in items]
+            try:
+                with file_lock(path):
+                    saved = store.append_many(entries)
+            except Exception as e:
+                logger.error(f"Failed to write {len(entries)} history entries to {path}: {str(e)}")
+                saved = False
+            if not saved:
+                logger.error(f"History batch for {path} was not saved ({len(entries)} entries), will retry")
+                failed.extend(items)
+                continue
+            # Каждый обработчик получает только свои записи
+            callbacks = {}
+            for entry, on_written in zip(entries, handlers):
+                if on_written is not None:
+                    callbacks.setdefault(id(on_written), (on_written, []))[1].append(entry)
+            for callback, written in callbacks.values():
+                try:
+                    callback(written)
+                except Exception as e:
+                    logger.error(f"History write callback failed for {path}: {str(e)}")
+
+        # Маркеры flush() срабатывают после записи всех предыдущих записей
+        if failed:
+            return failed + markers
+        for _, done, _ in markers:
+            done.set()
+        return []
+
+
+_history_writer = None
+_history_writer_lock = threading.Lock()
+
+
+def get_history_writer():
+    """
+    Returns:
+        HistoryWriter: Общий для процесса фоновый писатель истории
+    """
+    global _history_writer
+    with _history_writer_lock:
+        if _history_writer is None:
+            from config import HISTORY_FLUSH_INTERVAL
+            _history_writer = HistoryWriter(flush_interval=HISTORY_FLUSH_INTERVAL)
+            atexit.register(_history_writer.stop)
+        return _history_writer
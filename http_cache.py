@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlencode
+import requests
+from requests.structures import CaseInsensitiveDict
+from logger import logger
+from history_storage import atomic_write
+
+
+class HttpCache:
+    """
+    Общий дисковый кеш GET-запросов к внешним API
+
+    Ответ 200 сохраняется в файл (по одному на URL с параметрами) вместе с
+    ETag и Last-Modified. Пока не истек TTL эндпоинта, ответ отдается из кеша
+    без запроса; после истечения отправляется условный запрос
+    (If-None-Match / If-Modified-Since), и ответ 304 продлевает сохраненный.
+    Кеш в файлах общий для всех процессов (веб-сервер, планировщик, rnk.py).
+    Заголовок запроса Cache-Control учитывается: no-cache (и max-age=0) всегда
+    отправляет условный запрос, no-store обходит кеш полностью.
+    """
+
+    def __init__(self, cache_dir, ttls=None, default_ttl=300):
+        """
+        Args:
+            cache_dir (str): Директория файлов кеша
+            ttls (dict, optional): TTL в секундах по префиксу "хост/путь" (самый длинный совпавший)
+            default_ttl (int): TTL для эндпоинтов без собственного значения
+        """
+        self.cache_dir = cache_dir
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+
+    def ttl_for(self, url):
+        """
+        Returns:
+            int: TTL эндпоинта в секундах
+        """
+        parts = urlsplit(url)
+        target = parts.netloc + parts.path
+        matches = [prefix for prefix in self.ttls if target.startswith(prefix)]
+        return self.ttls[max(matches, key=len)] if matches else self.default_ttl
+
+    def _path(self, url, params, headers):
+        key = json.dumps([url, sorted((params or {}).items()), sorted((headers or {}).items())], default=str)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".json")
+
+    def _load(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, path, url, response):
+        entry = {
+            'url': url,
+            'stored_at': time.time(),
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'encoding': response.encoding,
+            'body': base64.b64encode(response.content).decode('ascii'),
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_write(path, json.dumps(entry))
+        except Exception as e:
+            logger.warning(f"Failed to store HTTP cache entry for {url}: {str(e)}")
+        return entry
+
+    def _touch(self, path, entry):
+        entry['stored_at'] = time.time()
+        try:
+            atomic_write(path, json.dumps(entry))
+        except Exception as e:
+            logger.warning(f"Failed to refresh HTTP cache entry for {entry['url']}: {str(e)}")
+
+    def _response(self, entry, url, params):
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        # Тело хранится уже распакованным
+        response.headers.pop('Content-Encoding', None)
+        response.encoding = entry.get('encoding')
+        response._content = base64.b64decode(entry['body'])
+        response.url = f"{url}?{urlencode(params)}" if params else url
+        response.from_cache = True
+        return response
+
+    def get(self, url, params=None, headers=None, timeout=10, ttl=None, cacheable=None):
+        """
+        GET-запрос через кеш
+
+        Args:
+            url (str): URL без параметров
+            params (dict, optional): Параметры запроса
+            headers (dict, optional): Заголовки запроса
+            timeout (float): Таймаут запроса в секундах
+            ttl (int, optional): TTL для этого вызова (по умолчанию TTL эндпоинта; 0 - всегда проверять;
+                                 Cache-Control: no-cache в headers действует как 0)
+            cacheable (callable, optional): Проверка ответа 200 перед сохранением
+                                            (например, ошибки API, возвращаемые с кодом 200)
+
+        Returns:
+            requests.Response: Ответ; from_cache=True если тело взято из кеша
+
+        Raises:
+            requests.exceptions.RequestException: при ошибке соединения
+        """
+        directives = {
+            directive.strip().lower()
+            for directive in CaseInsensitiveDict(headers or {}).get('Cache-Control', '').split(',')
+        }
+        if 'no-store' in directives:
+            response = self._session.get(url, params=params, headers=headers, timeout=timeout)
+            response.from_cache = False
+            return response
+        if 'no-cache' in directives or 'max-age=0' in directives:
+            ttl = 0
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        path = self._path(url, params, headers)
+        entry = self._load(path)
+
+        if entry and time.time() - entry['stored_at'] < ttl:
+            logger.debug(f"HTTP cache hit: {url}")
+            return self._response(entry, url, params)
+
+        request_headers = dict(headers or {})
+        if entry:
+            cached_headers = CaseInsensitiveDict(entry['headers'])
+            if cached_headers.get('ETag'):
+                request_headers['If-None-Match'] = cached_headers['ETag']
+            if cached_headers.get('Last-Modified'):
+                request_headers['If-Modified-Since'] = cached_headers['Last-Modified']
+
+        response = self._session.get(url, params=params, headers=request_headers, timeout=timeout)
+
+        if response.status_code == 304 and entry:
+            logger.debug(f"HTTP cache revalidated (304): {url}")
+            self._touch(path, entry)
+            return self._response(entry, url, params)
+
+        response.from_cache = False
+        if response.status_code == 200 and (cacheable is None or cacheable(response)):
+            self._store(path, url, response)
+        return response
+
+    def prune(self, max_age=None):
+        """
+        Удаляет записи кеша старше max_age секунд (None - все записи)
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        removed = 0
+        now = time.time()
+        with self._lock:
+            try:
+                names = os.listdir(self.cache_dir)
+            except OSError:
+                return 0
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    if max_age is None or now - os.path.getmtime(path) > max_age:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache():
+    """
+    Returns:
+        HttpCache: Общий для процесса HTTP-кеш с настройками из config.py
+    """
+    global _http_cache
+    with _http_cache_lock:
+        if _http_cache is None:
+            from config import HTTP_CACHE_DIR, HTTP_CACHE_TTLS, HTTP_CACHE_DEFAULT_TTL, HTTP_CACHE_MAX_AGE_DAYS
+            _http_cache = HttpCache(HTTP_CACHE_DIR, ttls=HTTP_CACHE_TTLS, default_ttl=HTTP_CACHE_DEFAULT_TTL)
+            # Записи для URL, которые больше не запрашиваются (например, с датой в параметрах)
+            _http_cache.prune(HTTP_CACHE_MAX_AGE_DAYS * 86400)
+        return _http_cache
+
+
+def cached_get(url, params=None, headers=None, timeout=10, ttl=None, cacheable=None):
+    """
+    GET-запрос через общий HTTP-кеш (при HTTP_CACHE_ENABLED=false - напрямую)
+
+    Аргументы и результат как у HttpCache.get.
+    """
+    from config import HTTP_CACHE_ENABLED
+    if not HTTP_CACHE_ENABLED:
+        response = requests.get(url, params=params, headers=headers, timeout=timeout)
+        response.from_cache = False
+        return response
+    return get_http_cache().get(url, params=params, headers=headers, timeout=timeout, ttl=ttl, cacheable=cacheable)
@@ -0,0 +1,265 @@
+import pickle
+import sqlite3
+import threading
+import time
+
+from logger import logger
+
+
+class JobRunStore:
+    """
+    Долговременное хранилище запусков заданий планировщика на базе SQLite
+
+    Для каждого запуска хранится плановое время, фактическое время старта,
+    результат, ID отправленного сообщения и результаты завершенных этапов.
+    После перезапуска процесса планировщик находит пропущенный или
+    незавершенный запуск и продолжает его с последнего завершенного этапа,
+    повторно используя сохраненные данные вместо новой загрузки.
+    """
+
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): Путь к файлу SQLite
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Создает таблицы запусков и этапов, если они не существуют"""
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS job_runs ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "job_name TEXT NOT NULL, "
+                    "scheduled_for TEXT NOT NULL, "
+                    "started_at REAL, "
+                    "finished_at REAL, "
+                    "status TEXT NOT NULL, "
+                    "attempts INTEGER NOT NULL DEFAULT 0, "
+                    "message_id INTEGER, "
+                    "fencing_token INTEGER, "
+                    "error TEXT, "
+                    "UNIQUE (job_name, scheduled_for))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS job_stages ("
+                    "run_id INTEGER NOT NULL, "
+                    "stage TEXT NOT NULL, "
+                    "finished_at REAL NOT NULL, "
+                    "output BLOB, "
+                    "PRIMARY KEY (run_id, stage))"
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Failed to initialize job state database {self.db_path}: {str(e)}")
+
+    def get_run(self, job_name, scheduled_for):
+        """
+        Args:
+            job_name (str): Имя задания
+            scheduled_for (str): Плановое время запуска в формате ISO
+
+        Returns:
+            dict: Запись запуска или None, если запуска не было
+        """
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT * FROM job_runs WHERE job_name = ? AND scheduled_for = ?",
+                    (job_name, scheduled_for)
+                ).fetchone()
+            finally:
+                conn.close()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Failed to read job run {job_name}@{scheduled_for}: {str(e)}")
+            return None
+
+    def get_latest_runs(self, job_name, limit=10):
+        """
+        Returns:
+            list: Последние запуски задания (новые сначала)
+        """
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT * FROM job_runs WHERE job_name = ? ORDER BY scheduled_for DESC LIMIT ?",
+                    (job_name, limit)
+                ).fetchall()
+            finally:
+                conn.close()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to read job runs for {job_name}: {str(e)}")
+            return []
+
+    def start_run(self, job_name, scheduled_for, fencing_token=None):
+        """
+        Создает запуск или возобновляет существующий незавершенный запуск
+
+        Returns:
+            dict: Запись запуска
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO job_runs (job_name, scheduled_for, status) VALUES (?, ?, ?)",
+                    (job_name, scheduled_for, self.STATUS_RUNNING)
+                )
+                conn.execute(
+                    "UPDATE job_runs SET status = ?, started_at = ?, finished_at = NULL, "
+                    "attempts = attempts + 1, fencing_token = ?, error = NULL "
+                    "WHERE job_name = ? AND scheduled_for = ?",
+                    (self.STATUS_RUNNING, time.time(), fencing_token, job_name, scheduled_for)
+                )
+                conn.commit()
+                row = conn.execute(
+                    "SELECT * FROM job_runs WHERE job_name = ? AND scheduled_for = ?",
+                    (job_name, scheduled_for)
+                ).fetchone()
+            finally:
+                conn.close()
+        run = dict(row)
+        logger.info(f"Job run {job_name}@{scheduled_for} started (attempt {run['attempts']})")
+        return run
+
+    def finish_run(self, run_id, status, error=None):
+        """Фиксирует результат запуска"""
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute(
+                        "UPDATE job_runs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                        (status, time.time(), error, run_id)
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Failed to finish job run {run_id}: {str(e)}")
+
+    def set_message_id(self, run_id, message_id):
+        """Сохраняет ID отправленного сообщения Telegram"""
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute("UPDATE job_runs SET message_id = ? WHERE id = ?", (message_id, run_id))
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Failed to save message id for job run {run_id}: {str(e)}")
+
+    def complete_stage(self, run_id, stage, output=None):
+        """
+        Сохраняет результат завершенного этапа
+
+        Args:
+            run_id (int): ID запуска
+            stage (str): Имя этапа
+            output: Результат этапа (любой объект, поддерживающий pickle)
+        """
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO job_stages (run_id, stage, finished_at, output) VALUES (?, ?, ?, ?)",
+                        (run_id, stage, time.time(), sqlite3.Binary(pickle.dumps(output)))
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Failed to save stage {stage} for job run {run_id}: {str(e)}")
+
+    def discard_stage(self, run_id, stage):
+        """Удаляет сохраненный результат этапа (этап выполнится при следующей попытке)"""
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute("DELETE FROM job_stages WHERE run_id = ? AND stage = ?", (run_id, stage))
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Failed to discard stage {stage} for job run {run_id}: {str(e)}")
+
+    def get_stage_outputs(self, run_id):
+        """
+        Returns:
+            dict: Результаты завершенных этапов запуска {stage: output}
+        """
+        outputs = {}
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT stage, output FROM job_stages WHERE run_id = ?", (run_id,)
+                ).fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                try:
+                    outputs[row["stage"]] = pickle.loads(row["output"])
+                except Exception as e:
+                    logger.warning(f"Cached output of stage {row['stage']} is unreadable, stage will rerun: {str(e)}")
+        except Exception as e:
+            logger.error(f"Failed to read stages for job run {run_id}: {str(e)}")
+        return outputs
+
+    def prune(self, stage_max_age, run_max_age):
+        """
+        Удаляет данные завершенных запусков, которые больше не понадобятся
+
+        Результаты этапов нужны только для продолжения незавершенного запуска,
+        поэтому у завершенных запусков они удаляются через stage_max_age секунд,
+        а сами записи запусков - через run_max_age секунд.
+
+        Returns:
+            tuple: (удалено этапов, удалено запусков)
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    stages = conn.execute(
+                        "DELETE FROM job_stages WHERE run_id IN ("
+                        "SELECT id FROM job_runs WHERE status != ? AND finished_at < ?)",
+                        (self.STATUS_RUNNING, now - stage_max_age)
+                    ).rowcount
+                    runs = conn.execute(
+                        "DELETE FROM job_runs WHERE status != ? AND finished_at < ?",
+                        (self.STATUS_RUNNING, now - run_max_age)
+                    ).rowcount
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Failed to prune job runs in {self.db_path}: {str(e)}")
+                return 0, 0
+        if stages or runs:
+            logger.info(f"Pruned {stages} stage outputs and {runs} job runs from {self.db_path}")
+        return stages, runs
@@ -1,64 +1,313 @@
 import json
 import os
+import bisect
+import threading
 from datetime import datetime
 from logger import logger
 
+
+class RankSeriesReader:
+    """
+    Ряд рейтинга из parsed_ranks.json, хранящийся в памяти
+
+    Файл разбирается и сортируется по дате только при изменении его mtime или
+    размера; между изменениями последний рейтинг, последняя дата, значение
+    на дату и выборка за период отдаются из памяти.
+    """
+
+    def __init__(self, file_path):
+        """
+        Args:
+            file_path (str): Путь к parsed_ranks.json
+        """
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._dates = []
+        self._ranks = []
+        self._positions = {}
+
+    def invalidate(self):
+        """Сбрасывает загруженный ряд, следующее обращение перечитает файл"""
+        with self._lock:
+            self._signature = None
+
+    def _refresh(self):
+        """Перечитывает файл, если он изменился с последней загрузки"""
+        try:
+            st = os.stat(self.file_path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+
+        with self._lock:
+            if signature == self._signature and signature is not None:
+                return
+            if signature is None:
+                if self._signature is not None or self._dates:
+                    logger.warning(f"JSON файл не найден: {self.file_path}")
+                self._signature, self._dates, self._ranks, self._positions = None, [], [], {}
+                return
+
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as file:
+                    data = json.load(file)
+            except Exception as e:
+                logger.error(f"Ошибка при чтении JSON файла {self.file_path}: {str(e)}")
+                return
+            if not isinstance(data, list):
+                logger.warning("JSON файл рейтинга имеет неверный формат")
+                data = []
+
+            # Одна запись на дату (последняя в файле), ряд упорядочен по дате.
+            # Даты без рейтинга (rank = null) сохраняются: если рейтинга нет за
+            # последнюю дату, текущий рейтинг - None, а не значение за более ранний день
+            by_date = {}
+            for entry in data:
+                if isinstance(entry, dict) and entry.get('date'):
+                    by_date[entry['date']] = entry.get('rank')
+            self._dates = sorted(by_date)
+            self._ranks = [by_date[date] for date in self._dates]
+            self._positions = {date: position for position, date in enumerate(self._dates)}
+            self._signature = signature
+
+            logger.info(f"Загружен ряд рейтинга: {len(self._dates)} дат из {self.file_path}")
+            for date, rank in list(zip(self._dates, self._ranks))[-3:][::-1]:
+                logger.info(f"  Дата: {date}, Рейтинг: {rank}")
+
+    def get_latest(self):
+        """
+        Returns:
+            tuple: (рейтинг, дата YYYY-MM-DD) за последнюю дату или (None, None)
+        """
+        self._refresh()
+        with self._lock:
+            if not self._dates:
+                return None, None
+            return self._ranks[-1], self._dates[-1]
+
+    def get_latest_rank(self):
+        return self.get_latest()[0]
+
+    def get_latest_date(self):
+        return self.get_latest()[1]
+
+    def get_rank_on(self, date):
+        """
+        Returns:
+            int или None: Рейтинг на дату YYYY-MM-DD
+        """
+        self._refresh()
+        with self._lock:
+            position = self._positions.get(date)
+            return self._ranks[position] if position is not None else None
+
+    def get_range(self, start=None, end=None):
+        """
+        Возвращает рейтинг за период включительно, старые даты сначала
+
+        Args:
+            start (str, optional): Начальная дата YYYY-MM-DD
+            end (str, optional): Конечная дата YYYY-MM-DD
+
+        Returns:
+            list: Записи {'date', 'rank'}
+        """
+        self._refresh()
+        with self._lock:
+            lo = bisect.bisect_left(self._dates, start) if start else 0
+            hi = bisect.bisect_right(self._dates, end) if end else len(self._dates)
+            return [{'date': date, 'rank': rank} for date, rank in zip(self._dates[lo:hi], self._ranks[lo:hi])]
+
+
+class ManualRankReader:
+    """Ручной рейтинг из manual_rank.txt, перечитываемый только при изменении файла"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._signature = None
+        self._rank = None
+
+    def get_rank(self):
+        """
+        Returns:
+            int или None: Ручной рейтинг, если файл существует и содержит число
+        """
+        try:
+            st = os.stat(self.file_path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            self._signature, self._rank = None, None
+            return None
+        if signature != self._signature:
+            try:
+                with open(self.file_path, 'r') as f:
+                    value = f.read().strip()
+                self._rank = int(value) if value.isdigit() else None
+            except Exception as e:
+                logger.error(f"Ошибка при чтении {self.file_path}: {str(e)}")
+                self._rank = None
+            self._signature = signature
+        return self._rank
+
+
+class CategoryRanksReader:
+    """
+    Колоночное хранилище рядов рейтинга по (категории, типу чарта) из rank_series.json
+
+    Файл заполняется rnk.py из тех же ответов SensorTower, что и parsed_ranks.json,
+    содержит ряды всех приложений корзины и индекс корзины и перечитывается
+    только при изменении.
+    """
+
+    # Приложение, ряды которого показываются по категориям
+    APP_ID = '886427730'
+
+    # Подписи категорий и типов чартов SensorTower
+    CATEGORY_NAMES = {'36': 'Overall', '6015': 'Finance', '0': 'All'}
+    CHART_NAMES = {
+        'topfreeapplications': 'iPhone Free',
+        'topfreeipadapplications': 'iPad Free',
+        'toppaidapplications': 'iPhone Paid',
+    }
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._series = {}
+        self._basket = {}
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.file_path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            with self._lock:
+                self._signature, self._series, self._basket = None, {}, {}
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as file:
+                    store = json.load(file)
+                app = store.get('apps', {}).get(self.APP_ID)
+                # Прежний формат: ряды только основного приложения на верхнем уровне
+                self._series = app.get('series', {}) if app else store.get('series', {})
+                self._basket = store.get('basket', {})
+            except Exception as e:
+                logger.error(f"Ошибка при чтении {self.file_path}: {str(e)}")
+                self._series, self._basket = {}, {}
+            self._signature = signature
+
+    def get_series(self, category, chart):
+        """
+        Returns:
+            dict: Ряд {'category', 'chart', 'dates', 'ranks'} или None
+        """
+        self._refresh()
+        with self._lock:
+            return self._series.get(f"{category}/{chart}")
+
+    def get_basket_index(self):
+        """
+        Returns:
+            dict: Последнее значение индекса корзины {'index', 'date', 'apps'} или None
+        """
+        self._refresh()
+        with self._lock:
+            dates = self._basket.get('dates') or []
+            if not dates:
+                return None
+            return {
+                'index': self._basket['index'][-1],
+                'date': dates[-1],
+                'apps': self._basket['apps'][-1],
+            }
+
+    def get_latest_ranks(self):
+        """
+        Returns:
+            list: Последний рейтинг каждого ряда: {'category', 'chart', 'label', 'rank', 'date'}
+        """
+        self._refresh()
+        with self._lock:
+            result = []
+            for key in sorted(self._series):
+                column = self._series[key]
+                if not column.get('dates'):
+                    continue
+                category, chart = column.get('category'), column.get('chart')
+                label = (f"{self.CATEGORY_NAMES.get(category, category)} "
+                         f"({self.CHART_NAMES.get(chart, chart)})")
+                result.append({
+                    'category': category,
+                    'chart': chart,
+                    'label': label,
+                    'rank': column['ranks'][-1],
+                    'date': column['dates'][-1],
+                })
+            return result
+
+
+_rank_series = RankSeriesReader(os.path.join(os.path.dirname(__file__), 'parsed_ranks.json'))
+_manual_rank = ManualRankReader('manual_rank.txt')
+_category_ranks = CategoryRanksReader(os.path.join(os.path.dirname(__file__), 'rank_series.json'))
+
+
+def get_rank_series():
+    """
+    Returns:
+        RankSeriesReader: Общий для процесса ряд рейтинга из parsed_ranks.json
+    """
+    return _rank_series
+
+
+def get_category_ranks():
+    """
+    Returns:
+        list: Последние рейтинги по всем категориям и типам чартов (Finance, Overall, iPad)
+    """
+    return _category_ranks.get_latest_ranks()
+
+
+def get_basket_index():
+    """
+    Returns:
+        dict: Последнее значение индекса розничного интереса по корзине приложений или None
+    """
+    return _category_ranks.get_basket_index()
+
+
+def get_manual_rank():
+    """
+    Returns:
+        int или None: Ручной рейтинг из manual_rank.txt
+    """
+    return _manual_rank.get_rank()
+
 def get_rank_from_json():
     """
-    ИСПРАВЛЕНО: Принудительно читает самые последние данные рейтинга из JSON файла
+    Возвращает рейтинг за последнюю дату из parsed_ranks.json
+    
+    Файл перечитывается только после его изменения (см. RankSeriesReader).
     
     Returns:
         int или None: Рейтинг Coinbase за последнюю дату или None если данные недоступны
     """
     try:
-        json_file_path = os.path.join(os.path.dirname(__file__), 'parsed_ranks.json')
-        
-        if not os.path.exists(json_file_path):
-            logger.warning(f"ИСПРАВЛЕНИЕ: JSON файл не найден: {json_file_path}")
-            return None
-        
-        # ИСПРАВЛЕНИЕ: Принудительное чтение без кеширования
-        logger.info("ИСПРАВЛЕНИЕ: Принудительно читаем parsed_ranks.json для получения последних данных")
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            
-        if not data or not isinstance(data, list):
-            logger.warning("ИСПРАВЛЕНИЕ: JSON файл пустой или имеет неверный формат")
-            return None
-        
-        # ИСПРАВЛЕНИЕ: Детальная проверка последних записей
-        logger.info(f"ИСПРАВЛЕНИЕ: Загружено {len(data)} записей из JSON файла")
-        
-        # ИСПРАВЛЕНИЕ: Принудительная сортировка по дате (самые новые сначала)
-        sorted_data = sorted(data, key=lambda x: x.get('date', ''), reverse=True)
-        
-        # ИСПРАВЛЕНИЕ: Показываем последние записи для отладки
-        logger.info("ИСПРАВЛЕНИЕ: Последние записи в JSON:")
-        for i, entry in enumerate(sorted_data[:3]):
-            logger.info(f"  {i+1}. Дата: {entry.get('date', 'нет')}, Рейтинг: {entry.get('rank', 'нет')}")
-            
-        # ИСПРАВЛЕНИЕ: Принудительно берем самую последнюю запись
-        latest_entry = sorted_data[0]
-        
-        if latest_entry and 'rank' in latest_entry and 'date' in latest_entry:
-            rank = latest_entry['rank']
-            date = latest_entry['date']
-            logger.info(f"ИСПРАВЛЕНИЕ: Возвращаем ПОСЛЕДНИЙ рейтинг {rank} на дату {date}")
-            return rank
-        else:
-            logger.warning("ИСПРАВЛЕНИЕ: В последней записи JSON файла нет корректных данных")
-            return None
-            
+        return _rank_series.get_latest_rank()
     except Exception as e:
-        logger.error(f"ИСПРАВЛЕНИЕ: Ошибка при чтении JSON файла: {str(e)}")
+        logger.error(f"Ошибка при чтении JSON файла: {str(e)}")
         return None
 
 def clear_rank_cache():
     """
-    Очищает кеш рейтинга (пустая функция, так как JSON файл читается каждый раз)
-    Используется для совместимости с другими модулями
+    Сбрасывает загруженный ряд рейтинга, следующий запрос перечитает parsed_ranks.json
     """
-    logger.info("Кеш JSON файла очищен (файл читается каждый раз)")
+    _rank_series.invalidate()
+    logger.info("Кеш JSON файла рейтинга очищен")
     return True
 
 def get_latest_rank_date():
@@ -69,25 +318,7 @@ def get_latest_rank_date():
         str или None: Дата в формате YYYY-MM-DD или None если данные недоступны
     """
     try:
-        json_file_path = os.path.join(os.path.dirname(__file__), 'parsed_ranks.json')
-        
-        if not os.path.exists(json_file_path):
-            return None
-            
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            
-        if not data or not isinstance(data, list):
-            return None
-            
-        # Находим запись с последней датой
-        latest_entry = max(data, key=lambda x: x.get('date', ''))
-        
-        if latest_entry and 'date' in latest_entry:
-            return latest_entry['date']
-        else:
-            return None
-            
+        return _rank_series.get_latest_date()
     except Exception as e:
         logger.error(f"Ошибка при получении даты из JSON файла: {str(e)}")
-        return None
\ No newline at end of file
+        return None
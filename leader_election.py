@@ -0,0 +1,231 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from logger import logger
+
+
+class LeaderLease:
+    """
+    Аренда лидерства (lease) с heartbeat и fencing-токеном на базе SQLite
+
+    Только процесс, удерживающий аренду, выполняет задания планировщика.
+    Остальные процессы (воркеры gunicorn, второй экземпляр бота) обслуживают
+    веб-запросы и ждут, пока аренда освободится или истечет.
+
+    Каждый новый захват аренды увеличивает fencing-токен, поэтому процесс,
+    потерявший лидерство (например, после долгой паузы), не сможет выполнить
+    побочное действие со старым токеном.
+    """
+
+    def __init__(self, db_path, name="scheduler", ttl=60):
+        """
+        Args:
+            db_path (str): Путь к файлу SQLite с таблицей аренды
+            name (str): Имя аренды (одна аренда на одну роль)
+            ttl (int): Время жизни аренды в секундах без продления
+        """
+        self.db_path = db_path
+        self.name = name
+        self.ttl = ttl
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        """Создает таблицу аренды, если она не существует"""
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS leases ("
+                    "name TEXT PRIMARY KEY, "
+                    "holder TEXT, "
+                    "token INTEGER NOT NULL DEFAULT 0, "
+                    "expires_at REAL NOT NULL DEFAULT 0, "
+                    "heartbeat_at REAL NOT NULL DEFAULT 0)"
+                )
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Failed to initialize lease database {self.db_path}: {str(e)}")
+
+    def try_acquire(self):
+        """
+        Пытается захватить или продлить аренду
+
+        Returns:
+            bool: True если этот процесс является лидером
+        """
+        with self._lock:
+            now = time.time()
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    row = conn.execute(
+                        "SELECT holder, token, expires_at FROM leases WHERE name = ?",
+                        (self.name,)
+                    ).fetchone()
+
+                    if row is None:
+                        token = 1
+                        conn.execute(
+                            "INSERT INTO leases (name, holder, token, expires_at, heartbeat_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (self.name, self.holder_id, token, now + self.ttl, now)
+                        )
+                    else:
+                        holder, current_token, expires_at = row
+                        if holder == self.holder_id and expires_at > now:
+                            token = current_token
+                        elif expires_at <= now:
+                            token = current_token + 1
+                        else:
+                            conn.execute("ROLLBACK")
+                            self._set_lost()
+                            return False
+                        conn.execute(
+                            "UPDATE leases SET holder = ?, token = ?, expires_at = ?, heartbeat_at = ? "
+                            "WHERE name = ?",
+                            (self.holder_id, token, now + self.ttl, now, self.name)
+                        )
+                    conn.execute("COMMIT")
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Lease acquisition failed: {str(e)}")
+                self._set_lost()
+                return False
+
+            if self.token != token:
+                logger.info(f"Leadership acquired by {self.holder_id} (fencing token {token})")
+            self.token = token
+            # Локально считаем аренду действительной чуть меньше TTL, чтобы
+            # не действовать в момент, когда другой процесс уже может ее захватить
+            self._expires_at = now + self.ttl * 0.8
+            return True
+
+    def _set_lost(self):
+        if self.token is not None:
+            logger.warning(f"Leadership lost by {self.holder_id} (fencing token {self.token})")
+        self.token = None
+        self._expires_at = 0.0
+
+    @property
+    def is_leader(self):
+        """True если аренда удерживается и не истекла локально"""
+        return self.token is not None and time.time() < self._expires_at
+
+    def check_token(self, token):
+        """
+        Проверяет fencing-токен по базе перед побочным действием
+
+        Args:
+            token (int): Токен, полученный при захвате аренды
+
+        Returns:
+            bool: True если аренда по-прежнему принадлежит этому процессу с этим токеном
+        """
+        if token is None:
+            return False
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT holder, token, expires_at FROM leases WHERE name = ?",
+                    (self.name,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Fencing token check failed: {str(e)}")
+            return False
+        return (row is not None and row[0] == self.holder_id
+                and row[1] == token and row[2] > time.time())
+
+    def release(self):
+        """Освобождает аренду, чтобы другой процесс мог сразу стать лидером"""
+        with self._lock:
+            if self.token is None:
+                return
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute(
+                        "UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ? AND token = ?",
+                        (self.name, self.holder_id, self.token)
+                    )
+                finally:
+                    conn.close()
+                logger.info(f"Leadership released by {self.holder_id}")
+            except Exception as e:
+                logger.error(f"Lease release failed: {str(e)}")
+            self.token = None
+            self._expires_at = 0.0
+
+    def get_status(self):
+        """
+        Returns:
+            dict: Текущий владелец аренды и состояние этого процесса
+        """
+        status = {
+            "holder_id": self.holder_id,
+            "is_leader": self.is_leader,
+            "fencing_token": self.token,
+            "leader": None,
+            "leader_token": None,
+            "lease_expires_in": None,
+        }
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT holder, token, expires_at FROM leases WHERE name = ?",
+                    (self.name,)
+                ).fetchone()
+            finally:
+                conn.close()
+            if row is not None:
+                status["leader"] = row[0] if row[2] > time.time() else None
+                status["leader_token"] = row[1]
+                status["lease_expires_in"] = round(max(row[2] - time.time(), 0), 1)
+        except Exception as e:
+            logger.error(f"Failed to read lease status: {str(e)}")
+        return status
+
+    def _heartbeat_loop(self):
+        interval = max(self.ttl / 3.0, 1.0)
+        while not self._stop_event.is_set():
+            self.try_acquire()
+            self._stop_event.wait(interval)
+
+    def start(self):
+        """Запускает фоновый heartbeat: продление аренды лидером или ожидание для резервных процессов"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="leader-lease")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает heartbeat и освобождает аренду"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self.release()
@@ -18,7 +18,8 @@ from config import APP_ID, SCHEDULE_HOUR, SCHEDULE_MINUTE, TELEGRAM_BOT_TOKEN, T
 from history_api import HistoryAPI
 from routes.history_routes import history_bp
 from routes.altseason_routes import altseason_bp
-from json_rank_reader import get_rank_from_json, get_latest_rank_date
+from json_rank_reader import get_rank_from_json, get_latest_rank_date, get_manual_rank, get_category_ranks, get_basket_index
+from fear_greed_index import get_fear_greed_series, mark_staleness
 
 # Create Flask app
 app = Flask(__name__)
@@ -74,14 +75,12 @@ market_breadth_cache = {
 def get_current_rank():
     """Get current rank from manual file or JSON file"""
     try:
-        # Check if manual rank file exists
-        if os.path.exists('manual_rank.txt'):
-            with open('manual_rank.txt', 'r') as f:
-                manual_rank = f.read().strip()
-                if manual_rank and manual_rank.isdigit():
-                    return int(manual_rank)
-        
-        # Read from JSON file
+        # Manual rank file (re-read only when it changes)
+        manual_rank = get_manual_rank()
+        if manual_rank is not None:
+            return manual_rank
+        
+        # Read from JSON file (cached rank series)
         json_rank = get_rank_from_json()
         if json_rank is not None:
             return json_rank
@@ -94,6 +93,8 @@ def get_current_rank():
 def start_scheduler_thread():
     """Start the scheduler in a separate thread"""
     global scheduler
+    if scheduler is not None:
+        return True
     scheduler = SensorTowerScheduler()
     success = scheduler.start()
     if not success:
@@ -141,6 +142,17 @@ def index():
     categories = []
     if last_scrape_data and "categories" in last_scrape_data:
         categories = last_scrape_data["categories"]
+    else:
+        # Все ряды из последнего ответа SensorTower (rnk.py) без дополнительных запросов
+        categories = [{"category": item["label"], "rank": item["rank"]} for item in get_category_ranks()]
+        basket = get_basket_index()
+        if basket:
+            categories.append({"category": f"Retail basket index ({basket['apps']} apps)", "rank": basket["index"]})
+    
+    # Fear & Greed из локального ряда: страница не обращается к alternative.me
+    # Флаг stale пересчитывается при каждом показе: сохраненное значение устаревает со сменой суток
+    fear_greed_data = mark_staleness(last_fear_greed_data or get_fear_greed_series().latest())
+    fear_greed_time = last_fear_greed_time or (fear_greed_data['date'] if fear_greed_data else None)
     
     return render_template('index.html', 
                           status=status,
@@ -152,8 +164,8 @@ def index():
                           schedule_time=schedule_time,
                           last_scrape_time=last_scrape_time,
                           categories=categories,
-                          last_fear_greed_data=last_fear_greed_data,
-                          last_fear_greed_time=last_fear_greed_time,
+                          last_fear_greed_data=fear_greed_data,
+                          last_fear_greed_time=fear_greed_time,
                           last_altseason_data=last_altseason_data,
                           last_altseason_time=last_altseason_time,
                           current_rank=get_current_rank())
@@ -2695,7 +2707,9 @@ def check_scheduler_status():
             "next_run_utc": next_run_utc.strftime("%Y-%m-%d %H:%M:%S UTC"),
             "next_run_msk": next_run_msk.strftime("%Y-%m-%d %H:%M:%S MSK"),
             "hours_until_next_run": round((next_run_utc - now_utc).total_seconds() / 3600, 1),
-            "last_sent_rank": getattr(scheduler, 'last_sent_rank', 'Unknown')
+            "last_sent_rank": getattr(scheduler, 'last_sent_rank', 'Unknown'),
+            "leader": scheduler.leader_lease.get_status(),
+            "recent_runs": scheduler.job_store.get_latest_runs(scheduler.DAILY_JOB_NAME, limit=5)
         })
             
     except Exception as e:
@@ -2707,18 +2721,34 @@ def check_scheduler_status():
 # Set up signal handler for graceful shutdown
 signal.signal(signal.SIGINT, signal_handler)
 
-# ИСПРАВЛЕНО: НЕ запускаем планировщик автоматически из Flask приложения
-# Планировщик должен запускаться только из main.py файла когда приложение запущено напрямую
-# или из отдельного systemd сервиса
-logger.info("Flask app initialized without starting scheduler - scheduler should be started externally")
+_scheduler_thread = None
+_scheduler_thread_lock = threading.Lock()
+
+def init_app():
+    """
+    Запускает планировщик в текущем процессе (повторный вызов ничего не делает)
+
+    Вызывается явно: из __main__ и из хука post_worker_init в gunicorn.conf.py.
+    Импорт main (скрипты, инструменты) планировщик не запускает.
+    Задания выполняет только процесс, удерживающий аренду лидерства (см. leader_election.py),
+    остальные используют объект scheduler только для обслуживания веб-запросов.
+
+    Returns:
+        Flask: Приложение
+    """
+    global _scheduler_thread
+    with _scheduler_thread_lock:
+        if _scheduler_thread is None:
+            _scheduler_thread = threading.Thread(target=start_scheduler_thread)
+            _scheduler_thread.daemon = True
+            _scheduler_thread.start()
+            logger.info("Starting scheduler at app initialization (leader election decides which process runs jobs)")
+    return app
 
 if __name__ == "__main__":
-    # ИСПРАВЛЕНО: При запуске напрямую (python main.py) запускаем планировщик
-    # Initialize scheduler at startup - for both direct run and gunicorn
-    scheduler_thread = threading.Thread(target=start_scheduler_thread)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
-    logger.info("Starting scheduler at app initialization")
-    
+    # В режиме debug процесс-наблюдатель перезагрузчика только перезапускает
+    # дочерний процесс - планировщик запускается в дочернем (WERKZEUG_RUN_MAIN)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        init_app()
     # Run the Flask app when called directly
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция истории из JSON-файлов в SQLite
+
+Импортирует rank_history, fear_greed_history, trends_history и altseason_history
+из журналов *.jsonl (или JSON-массивов *.json, если журнала нет) в базу,
+которая используется при HISTORY_BACKEND=sqlite.
+
+Использование:
+    python migrate_history.py [--data-dir DIR] [--db history.db] [--force]
+
+Таблица, в которой уже есть записи, пропускается, если не указан --force
+(в этом случае ее содержимое заменяется данными из файлов).
+"""
+
+import os
+import sys
+import argparse
+
+from history_api import HistoryAPI
+from history_storage import JsonArrayStore, JsonlAppendStore, SqliteHistoryStore
+
+
+def load_file_history(data_dir, name):
+    """
+    Загружает историю из журнала .jsonl, а при его отсутствии - из JSON-массива
+
+    Returns:
+        tuple: (список записей, путь к исходному файлу или None)
+    """
+    jsonl_path = os.path.join(data_dir, f"{name}.jsonl")
+    json_path = os.path.join(data_dir, f"{name}.json")
+    if os.path.exists(jsonl_path):
+        return JsonlAppendStore(jsonl_path).read_all(), jsonl_path
+    if os.path.exists(json_path):
+        return JsonArrayStore(json_path).read_all(), json_path
+    return [], None
+
+
+def main():
+    default_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Import JSON history files into SQLite")
+    parser.add_argument('--data-dir', default=default_dir, help="Directory with history files")
+    parser.add_argument('--db', default=None, help="SQLite database path (default: HISTORY_DB from config.py)")
+    parser.add_argument('--force', action='store_true', help="Replace tables that already contain records")
+    args = parser.parse_args()
+
+    if args.db:
+        db_path = args.db
+    else:
+        from config import HISTORY_DB
+        db_path = HISTORY_DB if os.path.isabs(HISTORY_DB) else os.path.join(args.data_dir, HISTORY_DB)
+
+    print(f"Migrating history from {args.data_dir} into {db_path}")
+    for kind, name in HistoryAPI.HISTORY_KINDS.items():
+        records, source = load_file_history(args.data_dir, name)
+        store = SqliteHistoryStore(db_path, name)
+        store.ensure_exists()
+
+        existing = store.count()
+        if existing and not args.force:
+            print(f"  {name}: table already has {existing} records, skipped (use --force to replace)")
+            continue
+        if source is None:
+            print(f"  {name}: no source file, skipped")
+            continue
+
+        if not store.rewrite(records):
+            print(f"  {name}: FAILED to import from {source}")
+            return 1
+        print(f"  {name}: imported {store.count()} records from {source}")
+
+    print("Done. Set HISTORY_BACKEND=sqlite to use the database.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,159 @@
 import os
 import ccxt
 import logging
+import numpy as np
 import time
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from logger import logger
 
+
+_exchanges = {}
+_exchange_locks = {}
+_exchanges_lock = threading.Lock()
+
+
+def exchange_lock(exchange_id):
+    """
+    Returns:
+        threading.RLock: Блокировка экземпляра биржи exchange_id (общая для процесса)
+    """
+    with _exchanges_lock:
+        return _exchange_locks.setdefault(exchange_id, threading.RLock())
+
+
+def get_exchange(exchange_id, markets_ttl=86400, timeout=None):
+    """
+    Долгоживущий экземпляр биржи ccxt с загруженными рынками
+
+    Экземпляр создается один раз на exchange_id и используется всеми потоками
+    процесса; список рынков загружается при создании и перезагружается после
+    markets_ttl секунд (при ошибке перезагрузки остаются прежние рынки).
+    Синхронный клиент ccxt не потокобезопасен: запросы к экземпляру выполняются
+    под exchange_lock(exchange_id).
+
+    Args:
+        exchange_id (str): Идентификатор биржи CCXT
+        markets_ttl (float): Время жизни списка рынков в секундах
+        timeout (float, optional): Таймаут HTTP-запросов биржи в секундах (при создании экземпляра)
+
+    Returns:
+        ccxt.Exchange: Экземпляр биржи
+
+    Raises:
+        Exception: если биржа не создана или рынки не загружены при первом обращении
+    """
+    with exchange_lock(exchange_id):
+        cached = _exchanges.get(exchange_id)
+        if cached and time.time() - cached[1] < markets_ttl:
+            return cached[0]
+        if cached:
+            exchange = cached[0]
+            try:
+                exchange.load_markets(reload=True)
+            except Exception as e:
+                logger.warning(f"Failed to reload {exchange_id} markets, keeping cached: {str(e)}")
+        else:
+            options = {
+                'enableRateLimit': True,
+            }
+            if timeout:
+                options['timeout'] = int(timeout * 1000)
+            exchange = getattr(ccxt, exchange_id)(options)
+            exchange.load_markets()
+            logger.info(f"Loaded {len(exchange.markets)} {exchange_id} markets")
+        _exchanges[exchange_id] = (exchange, time.time())
+        return exchange
+
+
+def normalize_symbol(exchange, symbol, quotes=()):
+    """
+    Приводит символ к рынку, который есть на бирже
+
+    Принимает единый формат ccxt (BTC/USDT) и идентификатор биржи (BTCUSDT).
+    Если пары с исходной котируемой валютой нет, пробуются котировки из quotes
+    по порядку (например, BTC/USD на биржах без USDT).
+
+    Args:
+        exchange (ccxt.Exchange): Биржа с загруженными рынками
+        symbol (str): Символ рынка
+        quotes (iterable): Альтернативные котируемые валюты
+
+    Returns:
+        str или None: Символ рынка на бирже
+    """
+    symbol = symbol.strip().upper()
+    if symbol in exchange.markets:
+        return symbol
+    if '/' not in symbol:
+        markets = (exchange.markets_by_id or {}).get(symbol)
+        if markets:
+            # В ccxt 4 markets_by_id содержит список рынков для идентификатора
+            return (markets[0] if isinstance(markets, list) else markets)['symbol']
+        # Идентификатор другой биржи: отделяем известную котируемую валюту
+        quote = next((quote for quote in quotes if symbol.endswith(quote) and len(symbol) > len(quote)), None)
+        if quote is None:
+            return None
+        symbol = f"{symbol[:-len(quote)]}/{quote}"
+        if symbol in exchange.markets:
+            return symbol
+    base = symbol.split('/')[0]
+    for quote in quotes:
+        candidate = f"{base}/{quote}"
+        if candidate in exchange.markets:
+            return candidate
+    return None
+
+
+def _levels(levels):
+    """Уровни стакана ccxt как массив (n, 2): цена, объем"""
+    if not levels:
+        return np.empty((0, 2))
+    return np.asarray(levels, dtype=float).reshape(len(levels), -1)[:, :2]
+
+
+def book_band_sums(order_book, bands, decay_scale):
+    """
+    Объемы стакана в полосах вокруг середины спреда за один векторный проход
+
+    Для каждой стороны считаются объемы в котируемой валюте (цена * объем)
+    внутри каждой полосы |цена - mid| / mid <= полоса: без весов и с
+    затуханием exp(-расстояние / decay_scale).
+
+    Args:
+        order_book (dict): Стакан ccxt ('bids', 'asks')
+        bands (sequence): Полосы как доли от mid (например, (0.005, 0.01, 0.02))
+        decay_scale (float): Масштаб затухания как доля от mid
+
+    Returns:
+        dict: {'bid_notional', 'ask_notional', 'depth_notional', 'band_sums'} или None для пустого стакана
+              (объемы сторон в котируемой валюте);
+              band_sums - массив (сторона: 0 bids / 1 asks, вес: 0 notional / 1 decayed, полоса)
+    """
+    bids = _levels(order_book['bids'])
+    asks = _levels(order_book['asks'])
+    if not len(bids) or not len(asks):
+        return None
+    mid = (bids[:, 0].max() + asks[:, 0].min()) / 2
+    bands = np.asarray(bands, dtype=float)
+    band_sums = np.zeros((2, 2, len(bands)))
+    side_notional = [0.0, 0.0]
+    for side, levels in enumerate((bids, asks)):
+        distance = np.abs(levels[:, 0] - mid) / mid
+        notional = levels[:, 0] * levels[:, 1]
+        weights = np.stack((notional, notional * np.exp(-distance / decay_scale)))
+        inside = distance[np.newaxis, :] <= bands[:, np.newaxis]
+        band_sums[side] = weights @ inside.T
+        side_notional[side] = float(notional.sum())
+    return {
+        'bid_notional': side_notional[0],
+        'ask_notional': side_notional[1],
+        'depth_notional': side_notional[0] + side_notional[1],
+        'band_sums': band_sums,
+    }
+
+
 class OrderBookImbalance:
     def __init__(self):
         """
@@ -22,9 +171,18 @@ class OrderBookImbalance:
         # Импортируем конфигурацию из общего файла config.py
         try:
             from config import GBI_EXCHANGE, GBI_MARKETS, GBI_LIMIT, GBI_THRESHOLD_STRONG_BULL, GBI_THRESHOLD_WEAK_BULL, GBI_THRESHOLD_WEAK_BEAR, GBI_THRESHOLD_STRONG_BEAR
+            from config import GBI_MARKETS_TTL_HOURS, GBI_EXCHANGES, GBI_EXCHANGE_TIMEOUT, GBI_MARKETS_TIMEOUT, GBI_QUOTE_FALLBACKS
+            from config import GBI_BANDS, GBI_DECAY_SCALE
+            self.bands = GBI_BANDS
+            self.decay_scale = GBI_DECAY_SCALE
             self.default_exchange_id = GBI_EXCHANGE
+            self.default_exchange_ids = list(GBI_EXCHANGES)
+            self.exchange_timeout = GBI_EXCHANGE_TIMEOUT
+            self.markets_timeout = GBI_MARKETS_TIMEOUT
+            self.quote_fallbacks = GBI_QUOTE_FALLBACKS
             self.default_symbols = GBI_MARKETS.split(',')
             self.default_limit = GBI_LIMIT
+            self.markets_ttl = GBI_MARKETS_TTL_HOURS * 3600
             self.thresholds = {
                 'strong_bull': GBI_THRESHOLD_STRONG_BULL,
                 'weak_bull': GBI_THRESHOLD_WEAK_BULL,
@@ -34,9 +192,17 @@ class OrderBookImbalance:
         except ImportError:
             # Fallback на переменные окружения, если не удалось импортировать config.py
             self.default_exchange_id = os.getenv('GBI_EXCHANGE', 'binance')
+            default_exchanges = 'binance,okx,bybit,coinbase,kraken'
+            self.default_exchange_ids = [e.strip() for e in os.getenv('GBI_EXCHANGES', default_exchanges).split(',') if e.strip()]
+            self.exchange_timeout = float(os.getenv('GBI_EXCHANGE_TIMEOUT', '10'))
+            self.markets_timeout = float(os.getenv('GBI_MARKETS_TIMEOUT', '30'))
+            self.quote_fallbacks = tuple(q.strip() for q in os.getenv('GBI_QUOTE_FALLBACKS', 'USDT,USD,USDC').split(',') if q.strip())
+            self.bands = tuple(float(b) for b in os.getenv('GBI_BANDS', '0.5,1,2').split(',') if b.strip())
+            self.decay_scale = float(os.getenv('GBI_DECAY_SCALE', '1.0'))
             default_markets = 'BTC/USDT,ETH/USDT,SOL/USDT,ADA/USDT,BNB/USDT'
             self.default_symbols = os.getenv('GBI_MARKETS', default_markets).split(',')
             self.default_limit = int(os.getenv('GBI_LIMIT', '100'))
+            self.markets_ttl = float(os.getenv('GBI_MARKETS_TTL_HOURS', '24')) * 3600
             self.thresholds = {
                 'strong_bull': float(os.getenv('GBI_THRESHOLD_STRONG_BULL', '0.50')),
                 'weak_bull': float(os.getenv('GBI_THRESHOLD_WEAK_BULL', '0.20')),
@@ -44,20 +210,198 @@ class OrderBookImbalance:
                 'strong_bear': float(os.getenv('GBI_THRESHOLD_STRONG_BEAR', '-0.50')),
             }
         
+        if self.default_exchange_id not in self.default_exchange_ids:
+            self.default_exchange_ids.insert(0, self.default_exchange_id)
+        
+        # Биржи опрашиваются параллельно (поток на биржу), стаканы одной биржи -
+        # последовательно под блокировкой ее экземпляра ccxt
+        self._venue_executor = ThreadPoolExecutor(max_workers=max(len(self.default_exchange_ids), 1), thread_name_prefix="orderbook-venue")
+        self._pending = {}
+        self._lock = threading.Lock()
+        
+        # Рынки бирж загружаются в фоне при старте, вне ожидания exchange_timeout
+        self.warm_up()
+        
         self.logger.info(f"Initialized Order Book Imbalance module with markets: {self.default_symbols}")
-        self.logger.info(f"Using exchange: {self.default_exchange_id}, depth: {self.default_limit}")
+        self.logger.info(f"Using exchanges: {', '.join(self.default_exchange_ids)}, depth: {self.default_limit}")
+
+    def warm_up(self, exchange_ids=None):
+        """
+        Загружает рынки бирж в фоне (первое обращение к бирже не ждет load_markets)
 
-    def get_order_book_imbalance(self, symbols=None, limit=None, exchange_id=None):
+        Args:
+            exchange_ids (list[str], optional): Биржи (по умолчанию GBI_EXCHANGES)
+        """
+        for exchange_id in exchange_ids or self.default_exchange_ids:
+            self._venue_executor.submit(self._warm_up_exchange, exchange_id)
+
+    def _warm_up_exchange(self, exchange_id):
+        try:
+            get_exchange(exchange_id, self.markets_ttl, self.exchange_timeout)
+        except Exception as e:
+            self.logger.warning(f"Failed to preload {exchange_id} markets: {str(e)}")
+
+    def fetch_order_books(self, symbols, limit, exchange_id):
         """
-        Calculate a single imbalance value across multiple trading pairs.
+        Загружает стаканы по символам с одной биржи (последовательно под блокировкой экземпляра)
+
+        Args:
+            symbols (list[str]): Символы рынков
+            limit (int): Глубина стакана
+            exchange_id (str): Идентификатор биржи CCXT
+
+        Returns:
+            dict: {symbol: order_book} для успешно загруженных символов (ключ - исходный символ)
+        """
+        exchange = get_exchange(exchange_id, self.markets_ttl, self.exchange_timeout)
+        order_books = {}
+        with exchange_lock(exchange_id):
+            for symbol in symbols:
+                market = normalize_symbol(exchange, symbol, self.quote_fallbacks)
+                if market is None:
+                    self.logger.warning(f"{exchange_id}: no market for {symbol}")
+                    continue
+                try:
+                    order_books[symbol] = exchange.fetch_order_book(market, limit)
+                except Exception as e:
+                    self.logger.error(f"Error fetching {exchange_id} order book for {symbol}: {str(e)}")
+        return order_books
+
+    def _venue_volumes(self, exchange_id, symbols, limit, progress=None):
+        """
+        Объемы стаканов одной биржи по всем символам
+
+        Args:
+            progress (dict, optional): Получает 'ready_at' - время, когда рынки биржи
+                загружены и начались запросы стаканов (от него отсчитывается exchange_timeout)
+
+        Returns:
+            dict: {'bid_notional', 'ask_notional', 'depth_notional', 'band_sums', 'markets_processed'}
+        """
+        get_exchange(exchange_id, self.markets_ttl, self.exchange_timeout)
+        if progress is not None:
+            progress['ready_at'] = time.time()
+        order_books = self.fetch_order_books(symbols, limit, exchange_id)
+        bid_notional = ask_notional = depth_notional = 0.0
+        band_sums = np.zeros((2, 2, len(self.bands)))
+        processed = 0
+        for symbol, order_book in order_books.items():
+            # Полосы в процентах от mid переводятся в доли
+            sums = book_band_sums(order_book, [band / 100 for band in self.bands], self.decay_scale / 100)
+            if sums is None:
+                self.logger.warning(f"{exchange_id}: empty order book for {symbol}")
+                continue
+            # Объемы сторон и полос в котируемой валюте суммируются по символам
+            # в одних единицах, без перекоса в сторону дешевых монет
+            bid_notional += sums['bid_notional']
+            ask_notional += sums['ask_notional']
+            # Ликвидность биржи в котируемой валюте - вес биржи в глобальном значении
+            depth_notional += sums['depth_notional']
+            band_sums += sums['band_sums']
+            processed += 1
+            self.logger.info(f"Processed {exchange_id} {symbol}: Bids={sums['bid_notional']:.2f}, Asks={sums['ask_notional']:.2f} (quote)")
+        return {
+            'bid_notional': bid_notional,
+            'ask_notional': ask_notional,
+            'depth_notional': depth_notional,
+            'band_sums': band_sums,
+            'markets_processed': processed,
+        }
+
+    def _band_imbalances(self, band_sums):
+        """
+        Дисбаланс по полосам из сумм book_band_sums
+
+        Returns:
+            dict: {'0.5%': {'notional', 'decayed'}} (None, если в полосе нет заявок)
+        """
+        bids, asks = band_sums
+        total = bids + asks
+        with np.errstate(divide='ignore', invalid='ignore'):
+            imbalance = np.where(total > 0, (bids - asks) / total, np.nan)
+        return {
+            f"{band:g}%": {
+                'notional': None if np.isnan(imbalance[0, i]) else round(float(imbalance[0, i]), 3),
+                'decayed': None if np.isnan(imbalance[1, i]) else round(float(imbalance[1, i]), 3),
+            }
+            for i, band in enumerate(self.bands)
+        }
+
+    def fetch_venues(self, exchange_ids, symbols, limit):
+        """
+        Параллельно загружает объемы стаканов по биржам с ограничением ожидания
+
+        На стаканы каждой биржи отводится exchange_timeout с момента, когда ее задача
+        началась и рынки загружены (время в очереди и load_markets не учитываются);
+        на загрузку рынков при холодном старте - не больше markets_timeout.
+        Биржа, не ответившая вовремя, пропускается в этом расчете; ее запрос
+        продолжается в фоне и не отправляется повторно, пока не завершится.
+
+        Returns:
+            tuple: ({exchange_id: volumes}, {exchange_id: причина ошибки})
+        """
+        key_symbols = tuple(symbols)
+        with self._lock:
+            self._pending = {key: entry for key, entry in self._pending.items() if not entry[0].done()}
+            tasks = {}
+            for exchange_id in exchange_ids:
+                key = (exchange_id, key_symbols, limit)
+                entry = self._pending.get(key)
+                if entry is None or entry[0].done():
+                    progress = {}
+                    future = self._venue_executor.submit(self._venue_volumes, exchange_id, symbols, limit, progress)
+                    entry = self._pending[key] = (future, progress)
+                tasks[exchange_id] = entry
+
+        started = time.time()
+
+        def deadline(progress):
+            ready_at = progress.get('ready_at')
+            if ready_at is None:
+                return started + self.markets_timeout + self.exchange_timeout
+            return ready_at + self.exchange_timeout
+
+        while True:
+            pending = [(future, deadline(progress)) for future, progress in tasks.values() if not future.done()]
+            now = time.time()
+            waiting = [(future, until) for future, until in pending if until > now]
+            if not waiting:
+                break
+            # Опрос не реже раза в 0.5 с: отсчет для биржи начинается, когда загружены ее рынки
+            wait([future for future, _ in waiting], timeout=min(min(until for _, until in waiting) - now, 0.5),
+                 return_when=FIRST_COMPLETED)
+
+        venues, failed = {}, {}
+        for exchange_id, (future, progress) in tasks.items():
+            if not future.done():
+                if progress.get('ready_at') is None:
+                    failed[exchange_id] = f"markets not loaded after {self.markets_timeout}s"
+                else:
+                    failed[exchange_id] = f"timeout after {self.exchange_timeout}s"
+                continue
+            try:
+                venues[exchange_id] = future.result()
+            except Exception as e:
+                failed[exchange_id] = str(e)
+        for exchange_id, reason in failed.items():
+            self.logger.error(f"Order book venue {exchange_id} skipped: {reason}")
+        return venues, failed
+
+    def get_order_book_imbalance(self, symbols=None, limit=None, exchange_id=None, exchange_ids=None):
+        """
+        Calculate a single imbalance value across multiple trading pairs and exchanges.
+
+        Each exchange gets its own imbalance; the global value is their
+        average weighted by order-book depth in quote currency.
 
         Args:
             symbols (list[str], optional): List of market symbols
             limit (int, optional): Depth of order book levels to fetch
-            exchange_id (str, optional): CCXT exchange identifier
+            exchange_id (str, optional): Single CCXT exchange identifier (disables aggregation)
+            exchange_ids (list[str], optional): CCXT exchange identifiers to aggregate
 
         Returns:
-            dict: Imbalance data with value, status, and timestamp or None if error
+            dict: Imbalance data with value, status, timestamp and per-venue breakdown or None if error
         """
         self.logger.info("Запрос данных Order Book Imbalance...")
         
@@ -65,55 +409,48 @@ class OrderBookImbalance:
             # Use default values if not provided
             symbols = symbols or self.default_symbols
             limit = limit or self.default_limit
-            exchange_id = exchange_id or self.default_exchange_id
+            exchange_ids = [exchange_id] if exchange_id else (exchange_ids or self.default_exchange_ids)
 
-            # Initialize exchange
-            exchange_class = getattr(ccxt, exchange_id)
-            exchange = exchange_class({
-                'enableRateLimit': True,
-            })
+            # Fetch all venues concurrently (slow or failing exchanges are skipped)
+            venues, failed = self.fetch_venues(exchange_ids, symbols, limit)
 
-            # Initialize accumulators for bids and asks volumes
-            total_bid_volume = 0.0
-            total_ask_volume = 0.0
-            processed_symbols = 0
-
-            # Process each symbol
-            for symbol in symbols:
-                try:
-                    # Fetch order book
-                    order_book = exchange.fetch_order_book(symbol, limit)
-                    
-                    # Calculate sum of volumes for bids and asks
-                    symbol_bid_volume = sum(bid[1] for bid in order_book['bids'])
-                    symbol_ask_volume = sum(ask[1] for ask in order_book['asks'])
-                    
-                    # Accumulate volumes
-                    total_bid_volume += symbol_bid_volume
-                    total_ask_volume += symbol_ask_volume
-                    processed_symbols += 1
-                    
-                    self.logger.info(f"Processed {symbol}: Bids={symbol_bid_volume:.2f}, Asks={symbol_ask_volume:.2f}")
-                except Exception as e:
-                    self.logger.error(f"Error fetching order book for {symbol}: {str(e)}")
-                    # Продолжаем с другими символами вместо возврата ошибки
-                    continue
-
-            # Check if we have valid volume data (at least один символ успешно обработан)
-            if processed_symbols == 0 or total_bid_volume <= 0 or total_ask_volume <= 0:
-                self.logger.error("Invalid volume data: bid or ask volume is zero")
-                return None  # No fallback data, just return None
-
-            # Calculate global order-book imbalance
+            # Calculate order-book imbalance per venue
             # Normalize to range [-1, 1] where:
             # -1 = 100% asks (extreme sell pressure)
             # 0 = equal bids and asks
             # +1 = 100% bids (extreme buy pressure)
-            total_volume = total_bid_volume + total_ask_volume
-            imbalance = (total_bid_volume - total_ask_volume) / total_volume
+            breakdown = {}
+            for venue_id, volumes in venues.items():
+                # Check if we have valid volume data (at least один символ успешно обработан)
+                if volumes['markets_processed'] == 0 or volumes['bid_notional'] <= 0 or volumes['ask_notional'] <= 0:
+                    failed[venue_id] = "no valid order book data"
+                    continue
+                total_notional = volumes['bid_notional'] + volumes['ask_notional']
+                breakdown[venue_id] = {
+                    'imbalance': (volumes['bid_notional'] - volumes['ask_notional']) / total_notional,
+                    'depth_notional': volumes['depth_notional'],
+                    'markets_processed': volumes['markets_processed'],
+                    'bands': self._band_imbalances(volumes['band_sums']),
+                }
+
+            if not breakdown:
+                self.logger.error("Invalid volume data: bid or ask volume is zero on all exchanges")
+                return None  # No fallback data, just return None
+
+            # Liquidity-weighted global imbalance (equal weights if depth notional is unavailable)
+            total_depth = sum(venue['depth_notional'] for venue in breakdown.values())
+            for venue in breakdown.values():
+                venue['weight'] = venue['depth_notional'] / total_depth if total_depth > 0 else 1.0 / len(breakdown)
+            imbalance = sum(venue['imbalance'] * venue['weight'] for venue in breakdown.values())
+            # Полосы по всем биржам: объемы в котируемой валюте уже взвешены ликвидностью
+            bands = self._band_imbalances(sum(venues[venue_id]['band_sums'] for venue_id in breakdown))
             
             # Round to 2 decimal places for display
             imbalance = round(imbalance, 2)
+            for venue in breakdown.values():
+                venue['imbalance'] = round(venue['imbalance'], 2)
+                venue['weight'] = round(venue['weight'], 3)
+                venue['depth_notional'] = round(venue['depth_notional'], 2)
             
             # Interpret the imbalance
             status, signal, description = self._determine_market_signal(imbalance)
@@ -126,9 +463,12 @@ class OrderBookImbalance:
                 'description': description,
                 'timestamp': int(time.time()),
                 'date': datetime.now().strftime('%Y-%m-%d'),
-                'markets_processed': processed_symbols,
-                'total_markets': len(symbols),
-                'exchange': exchange_id
+                'markets_processed': sum(venue['markets_processed'] for venue in breakdown.values()),
+                'total_markets': len(symbols) * len(exchange_ids),
+                'exchange': ', '.join(breakdown),
+                'bands': bands,
+                'venues': breakdown,
+                'failed_venues': failed
             }
             
             self.logger.info(f"Order Book Imbalance: {imbalance:.2f} ({status}) {signal}")
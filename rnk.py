@@ -1,27 +1,43 @@
-import requests
+import os
+import sys
 import json
+import argparse
+import math
+import requests
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
+from history_storage import atomic_write
+from http_cache import cached_get
 
 class SensorTowerParser:
     """
     Класс для получения и парсинга данных рейтинга приложения из SensorTower API.
 
     Извлекает историю позиций приложения в рейтинге по дням и сохраняет результат в JSON-файл.
+    В инкрементальном режиме запрашиваются только даты начиная с последней сохраненной
+    даты ряда Coinbase (не раньше RANK_MAX_BACKFILL_DAYS дней назад), а результат
+    объединяется с уже сохраненным рядом (одна запись на дату). Приложения корзины
+    без сохраненного ряда запрашиваются отдельно за окно по умолчанию.
     """
-    BASE_URL = (
-        "https://app.sensortower.com/api/ios/category/category_history?"
-        "app_ids%5B%5D=886427730&categories%5B%5D=6015&categories%5B%5D=0&categories%5B%5D=36&"
-        "chart_type_ids%5B%5D=topfreeipadapplications&chart_type_ids%5B%5D=topfreeapplications&"
-        "chart_type_ids%5B%5D=toppaidapplications&countries%5B%5D=US"
-    )
+    APP_ID = "886427730"
+    COUNTRY = "US"
+    CATEGORIES = ("6015", "0", "36")
+    CHART_TYPES = ("topfreeipadapplications", "topfreeapplications", "toppaidapplications")
+    # Ряд, который используется как рейтинг Coinbase (parsed_ranks.json) и индекс корзины
+    PRIMARY_SERIES = ("36", "topfreeapplications")
 
-    def __init__(self, start_date=None, end_date=None):
+    BASE_URL = "https://app.sensortower.com/api/ios/category/category_history"
+
+    def __init__(self, start_date=None, end_date=None, app_ids=None, batch_size=None):
         """
         Инициализация парсера.
 
         :param start_date: (str, optional) Начальная дата в формате YYYY-MM-DD. По умолчанию — месяц назад.
         :param end_date: (str, optional) Конечная дата в формате YYYY-MM-DD. По умолчанию — сегодня.
+        :param app_ids: (dict, optional) Приложения корзины {app_id: название}. По умолчанию — RANK_BASKET_APPS.
+        :param batch_size: (int, optional) Количество приложений в одном запросе. По умолчанию — RANK_BATCH_SIZE.
         """
+        from config import RANK_BASKET_APPS, RANK_BATCH_SIZE, RANK_MAX_BACKFILL_DAYS
         today = datetime.utcnow().strftime("%Y-%m-%d")
         if start_date is None:
             month_ago = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d")
@@ -29,25 +45,93 @@ class SensorTowerParser:
         else:
             self.start_date = start_date
         self.end_date = end_date or today
+        # Основное приложение всегда входит в корзину и запрашивается первым
+        self.apps = {self.APP_ID: "Coinbase"}
+        self.apps.update(app_ids if app_ids is not None else RANK_BASKET_APPS)
+        self.batch_size = max(batch_size or RANK_BATCH_SIZE, 1)
+        self.max_backfill_days = RANK_MAX_BACKFILL_DAYS
         self.url = self._build_url()
 
-    def _build_url(self):
+    def _build_url(self, app_ids=None, start_date=None):
         """
-        Формирует URL с нужными датами.
+        Формирует URL с нужными датами для одного пакета приложений.
+
+        :param app_ids: (list, optional) ID приложений пакета. По умолчанию — только основное приложение.
+        :param start_date: (str, optional) Начальная дата запроса. По умолчанию — self.start_date.
         """
-        return f"{self.BASE_URL}&end_date={self.end_date}&start_date={self.start_date}"
+        query = urlencode({
+            "app_ids[]": list(app_ids or [self.APP_ID]),
+            "categories[]": list(self.CATEGORIES),
+            "chart_type_ids[]": list(self.CHART_TYPES),
+            "countries[]": [self.COUNTRY],
+            "end_date": self.end_date,
+            "start_date": start_date or self.start_date,
+        }, doseq=True)
+        return f"{self.BASE_URL}?{query}"
 
-    def fetch_data(self):
+    def fetch_data(self, url=None):
         """
         Выполняет GET-запрос к API и возвращает ответ в формате JSON.
 
+        :param url: (str, optional) URL запроса. По умолчанию — запрос основного приложения.
         :return: (dict) Данные, полученные из API.
         :raises: requests.HTTPError при ошибке запроса.
         """
-        response = requests.get(self.url)
+        response = cached_get(url or self.url, timeout=30)
         response.raise_for_status()
         return response.json()
 
+    def fetch_apps(self, app_ids=None, start_date=None):
+        """
+        Запрашивает ряды всех приложений пакетами: один запрос на пакет, а не на приложение.
+
+        Ошибка одного пакета не прерывает остальные.
+
+        :param app_ids: (list, optional) ID приложений. По умолчанию — вся корзина.
+        :param start_date: (str, optional) Начальная дата запроса. По умолчанию — self.start_date.
+        :return: (dict) {app_id: {(category, chart): [{'date', 'rank'}, ...]}}
+        """
+        app_ids = list(app_ids or self.apps)
+        result = {}
+        for start in range(0, len(app_ids), self.batch_size):
+            batch = app_ids[start:start + self.batch_size]
+            try:
+                data = self.fetch_data(self._build_url(batch, start_date))
+            except Exception as e:
+                if self.APP_ID in batch:
+                    raise
+                print(f"Failed to fetch ranks for apps {batch}: {e}", file=sys.stderr)
+                continue
+            for app_id in batch:
+                result[app_id] = self.parse_all_series(data, app_id)
+        return result
+
+    def parse_all_series(self, data, app_id=None):
+        """
+        Извлекает за один проход все ряды ответа для приложения: каждую пару (категория, тип чарта).
+
+        :param data: (dict) Исходные данные, полученные из API.
+        :param app_id: (str, optional) ID приложения. По умолчанию — основное приложение.
+        :return: (dict) {(category, chart): [{'date', 'rank'}, ...]} для приложения и страны из запроса.
+        """
+        try:
+            categories = data[app_id or self.APP_ID][self.COUNTRY]
+        except (KeyError, TypeError):
+            return {}
+        series = {}
+        for category, charts in (categories or {}).items():
+            if not isinstance(charts, dict):
+                continue
+            for chart, chart_data in charts.items():
+                graph_data = chart_data.get("graphData") if isinstance(chart_data, dict) else None
+                if not graph_data:
+                    continue
+                series[(category, chart)] = [
+                    {"date": datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d"), "rank": rank}
+                    for timestamp, rank, *_ in graph_data
+                ]
+        return series
+
     def parse_graph_data(self, data):
         """
         Извлекает из данных API историю позиций приложения по дням.
@@ -55,43 +139,203 @@ class SensorTowerParser:
         :param data: (dict) Исходные данные, полученные из API.
         :return: (list of dict) Список словарей с ключами 'date' (строка, YYYY-MM-DD) и 'rank' (int).
         """
+        return self.parse_all_series(data).get(self.PRIMARY_SERIES, [])
+
+    def load_series_store(self, filename="rank_series.json"):
+        """
+        Загружает колоночное хранилище рядов.
+
+        :param filename: (str) Имя файла хранилища.
+        :return: (dict) {'country', 'apps': {app_id: {'name', 'series': {...}}}, 'basket': {...}}
+        """
+        store = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, "r", encoding="utf-8") as f:
+                    store = json.load(f)
+            except (OSError, ValueError):
+                store = {}
+        if not isinstance(store, dict):
+            store = {}
+        apps = store.get("apps", {})
+        # Прежний формат: ряды только основного приложения на верхнем уровне
+        if "series" in store and self.APP_ID not in apps:
+            apps[self.APP_ID] = {"name": self.apps.get(self.APP_ID), "series": store["series"]}
+        return {"country": self.COUNTRY, "apps": apps, "basket": store.get("basket", {})}
+
+    def compute_basket_index(self, apps, series_key=None):
+        """
+        Индекс корзины: среднее геометрическое рейтингов приложений корзины на каждую дату.
+
+        Меньшее значение означает более высокие позиции приложений, то есть больший
+        розничный интерес. Среднее геометрическое не дает одному приложению с
+        рейтингом в сотни позиций перевесить остальные.
+
+        :param apps: (dict) Приложения хранилища {app_id: {'series': {...}}}.
+        :param series_key: (str, optional) Ряд '<category>/<chart>'. По умолчанию — PRIMARY_SERIES.
+        :return: (dict) {'category', 'chart', 'dates', 'index', 'apps'}
+        """
+        series_key = series_key or "/".join(self.PRIMARY_SERIES)
+        logs = {}
+        for app_id in self.apps:
+            column = apps.get(app_id, {}).get("series", {}).get(series_key)
+            if not column:
+                continue
+            for date, rank in zip(column["dates"], column["ranks"]):
+                if rank:
+                    logs.setdefault(date, []).append(math.log(rank))
+        dates = sorted(logs)
+        category, chart = series_key.split("/", 1)
+        return {
+            "category": category,
+            "chart": chart,
+            "dates": dates,
+            "index": [round(math.exp(sum(logs[date]) / len(logs[date])), 2) for date in dates],
+            "apps": [len(logs[date]) for date in dates],
+        }
+
+    def save_series_store(self, series_by_app, filename="rank_series.json"):
+        """
+        Объединяет ряды приложений с колоночным хранилищем, пересчитывает индекс корзины
+        и атомарно сохраняет хранилище.
+
+        Ряд хранится как {'category', 'chart', 'dates': [...], 'ranks': [...]} под ключом
+        '<category>/<chart>', значения по дате заменяются новыми.
+
+        :param series_by_app: (dict) {app_id: результат parse_all_series}.
+        :param filename: (str) Имя файла хранилища.
+        """
+        store = self.load_series_store(filename)
+        for app_id, series in series_by_app.items():
+            app = store["apps"].setdefault(app_id, {"series": {}})
+            app["name"] = self.apps.get(app_id, app.get("name"))
+            columns = app.setdefault("series", {})
+            for (category, chart), entries in series.items():
+                key = f"{category}/{chart}"
+                column = columns.get(key, {})
+                by_date = dict(zip(column.get("dates", []), column.get("ranks", [])))
+                for entry in entries:
+                    by_date[entry["date"]] = entry["rank"]
+                dates = sorted(by_date)
+                columns[key] = {
+                    "category": category,
+                    "chart": chart,
+                    "dates": dates,
+                    "ranks": [by_date[date] for date in dates],
+                }
+
+        store["basket"] = self.compute_basket_index(store["apps"])
+        atomic_write(filename, json.dumps(store, ensure_ascii=False))
+        return store
+
+    def load_series(self, filename="parsed_ranks.json"):
+        """
+        Загружает сохраненный ряд рейтинга.
+
+        :param filename: (str) Имя файла ряда.
+        :return: (list of dict) Записи {'date', 'rank'} или пустой список, если файла нет.
+        """
+        if not os.path.exists(filename):
+            return []
         try:
-            graph_data = (
-                data["886427730"]["US"]["36"]["topfreeapplications"]["graphData"]
-            )
-        except (KeyError, TypeError):
+            with open(filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
             return []
-        result = []
-        for entry in graph_data:
-            timestamp, rank, _ = entry
-            date = datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d")
-            result.append({"date": date, "rank": rank})
-        return result
+        return data if isinstance(data, list) else []
+
+    def merge_series(self, existing, parsed_data):
+        """
+        Объединяет ряды по дате: новые значения заменяют сохраненные на ту же дату.
+
+        :param existing: (list of dict) Сохраненный ряд.
+        :param parsed_data: (list of dict) Новые записи.
+        :return: (list of dict) Ряд, отсортированный по дате.
+        """
+        by_date = {entry["date"]: entry for entry in existing if isinstance(entry, dict) and entry.get("date")}
+        for entry in parsed_data:
+            by_date[entry["date"]] = entry
+        return [by_date[date] for date in sorted(by_date)]
 
     def save_to_json(self, parsed_data, filename="parsed_ranks.json"):
         """
-        Сохраняет распарсенные данные в JSON-файл.
+        Атомарно сохраняет данные в JSON-файл.
 
         :param parsed_data: (list of dict) Список данных для сохранения.
         :param filename: (str) Имя файла для сохранения.
         """
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=2)
+        atomic_write(filename, json.dumps(parsed_data, ensure_ascii=False, indent=2))
+
+    def incremental_start_date(self, existing, stored_apps=None):
+        """
+        Начальная дата инкрементального запроса по ряду основного приложения.
+
+        Берется последняя сохраненная дата Coinbase (она запрашивается повторно, так как
+        данные за текущий день могут обновиться), но не раньше max_backfill_days дней
+        до end_date. Ряды других приложений корзины на дату не влияют: отстающее или
+        новое приложение не расширяет окно запроса.
+
+        :param existing: (list of dict) Сохраненный ряд основного приложения.
+        :param stored_apps: (dict, optional) Приложения из хранилища рядов (запасной источник даты).
+        :return: (str or None) Дата YYYY-MM-DD или None, если ряда основного приложения нет.
+        """
+        dates = [entry.get("date") for entry in existing if isinstance(entry, dict) and entry.get("date")]
+        if not dates and stored_apps:
+            column = stored_apps.get(self.APP_ID, {}).get("series", {}).get("/".join(self.PRIMARY_SERIES), {})
+            dates = column.get("dates", [])
+        if not dates:
+            return None
+        end = datetime.strptime(self.end_date, "%Y-%m-%d")
+        earliest = (end - timedelta(days=self.max_backfill_days)).strftime("%Y-%m-%d")
+        return min(max(max(dates), earliest), self.end_date)
 
-    def run(self, save_path="parsed_ranks.json"):
+    def run(self, save_path="parsed_ranks.json", incremental=True, series_path="rank_series.json"):
         """
-        Основной метод: получает данные, парсит их и сохраняет в файл.
+        Основной метод: получает данные всех приложений корзины, парсит их и объединяет
+        с сохраненными рядами.
 
-        :param save_path: (str) Имя файла для сохранения результата.
-        :return: (list of dict) Список распарсенных данных.
+        :param save_path: (str) Имя файла для сохранения ряда основного приложения.
+        :param incremental: (bool) Запрашивать только даты начиная с последней сохраненной
+                            (она запрашивается повторно, так как данные за текущий день могут обновиться).
+        :param series_path: (str) Колоночное хранилище всех рядов ответа (приложение, категория, тип чарта).
+        :return: (list of dict) Список полученных записей основного приложения.
         """
-        data = self.fetch_data()
-        parsed = self.parse_graph_data(data)
-        self.save_to_json(parsed, save_path)
+        existing = self.load_series(save_path)
+        default_start = self.start_date
+        app_ids = list(self.apps) if series_path else [self.APP_ID]
+        new_apps = []
+        if incremental:
+            stored_apps = self.load_series_store(series_path)["apps"] if series_path else {}
+            start_date = self.incremental_start_date(existing, stored_apps)
+            if start_date:
+                self.start_date = start_date
+                self.url = self._build_url()
+                # Приложения корзины без сохраненного ряда запрашиваются отдельно за окно по умолчанию
+                primary_key = "/".join(self.PRIMARY_SERIES)
+                new_apps = [
+                    app_id for app_id in app_ids
+                    if app_id != self.APP_ID
+                    and not stored_apps.get(app_id, {}).get("series", {}).get(primary_key, {}).get("dates")
+                ]
+
+        series_by_app = self.fetch_apps([app_id for app_id in app_ids if app_id not in new_apps])
+        if new_apps:
+            series_by_app.update(self.fetch_apps(new_apps, start_date=default_start))
+        parsed = series_by_app.get(self.APP_ID, {}).get(self.PRIMARY_SERIES, [])
+        self.save_to_json(self.merge_series(existing, parsed), save_path)
+        if series_path:
+            self.save_series_store(series_by_app, series_path)
         return parsed
 
 
 if __name__ == "__main__":
-    parser = SensorTowerParser()
-    parsed = parser.run()
-    print(json.dumps(parsed, indent=2, ensure_ascii=False))
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Fetch Coinbase rank history from SensorTower")
+    arg_parser.add_argument("--full", action="store_true",
+                            help="Request the whole window (default 30 days) instead of dates after the last stored one")
+    arg_parser.add_argument("--start-date", default=None, help="Window start date for --full, YYYY-MM-DD")
+    args = arg_parser.parse_args()
+
+    parser = SensorTowerParser(start_date=args.start_date)
+    parsed = parser.run(incremental=not args.full)
+    print(json.dumps(parsed, indent=2, ensure_ascii=False))
+    sys.exit(0)
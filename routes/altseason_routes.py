@@ -4,10 +4,18 @@
 from flask import Blueprint, render_template, jsonify, request, redirect, url_for
 from altcoin_season_index import AltcoinSeasonIndex
 from history_api import HistoryAPI
+from altseason_series import get_altseason_series
+from altseason_snapshot import get_altseason_snapshot
 
 altseason_bp = Blueprint('altseason', __name__)
 altcoin_season_index = AltcoinSeasonIndex()
 history_api = HistoryAPI()
+# Снимок индекса, который обновляет лидер планировщика: страница и API не обращаются к CoinGecko
+altseason_snapshot = get_altseason_snapshot(altcoin_season_index, history_api)
+
+def _freshness(snapshot):
+    """Метаданные свежести снимка для ответов API"""
+    return {key: snapshot[key] for key in ('refreshed_at', 'age_seconds', 'stale', 'last_error')}
 
 @altseason_bp.route('/altseason')
 def altseason_page():
@@ -17,8 +25,9 @@ def altseason_page():
     # Получаем историю данных для графика
     history = history_api.get_altseason_index_history(limit=100)
     
-    # Получаем текущие данные
-    current_data = altcoin_season_index.get_altseason_index()
+    # Текущие данные из снимка
+    snapshot = altseason_snapshot.get()
+    current_data = snapshot['data']
     
     # Форматируем данные для отображения
     formatted_history = []
@@ -32,18 +41,35 @@ def altseason_page():
             'btc_performance': record.get('btc_performance', 0.0)
         })
     
+    # Дневной ряд индекса по окнам из сохраненного расчета (без запросов к API)
+    series = get_altseason_series()
+    altseason_series = {window: series.get(window) for window in series.windows()}
+    
     return render_template('altseason_index.html', 
                           altseason_data=current_data,
-                          altseason_history=formatted_history)
+                          altseason_history=formatted_history,
+                          altseason_series=altseason_series,
+                          altseason_snapshot=snapshot)
 
 @altseason_bp.route('/api/altseason/refresh', methods=['POST'])
 def refresh_altseason():
     """
     API для принудительного обновления данных Altcoin Season Index
+    
+    Обновление разрешено не чаще ASI_MIN_REFRESH_INTERVAL; более частые
+    запросы получают 429 с заголовком Retry-After.
     """
     try:
-        # Принудительно получаем новые данные
-        data = altcoin_season_index.get_altseason_index()
+        # Принудительно обновляем снимок
+        data, retry_after = altseason_snapshot.request_refresh()
+        if retry_after:
+            response = jsonify({
+                'status': 'error',
+                'message': f'Refresh is rate limited, retry in {retry_after}s',
+                'retry_after': retry_after
+            })
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
         
         # Проверяем, что данные получены успешно
         if data is None:
@@ -67,7 +93,8 @@ def refresh_altseason():
             
         return jsonify({
             'status': 'success', 
-            'data': data
+            'data': data,
+            'freshness': _freshness(altseason_snapshot.get())
         })
     except Exception as e:
         altcoin_season_index.logger.error(f"Error in refresh_altseason API: {str(e)}")
@@ -79,11 +106,11 @@ def refresh_altseason():
 @altseason_bp.route('/api/altseason/data')
 def get_altseason_data():
     """
-    API для получения текущих данных Altcoin Season Index
+    API для получения текущих данных Altcoin Season Index (из снимка)
     """
     try:
-        # Получаем данные
-        data = altcoin_season_index.get_altseason_index()
+        snapshot = altseason_snapshot.get()
+        data = snapshot['data']
         
         if data is None:
             return jsonify({
@@ -93,10 +120,40 @@ def get_altseason_data():
             
         return jsonify({
             'status': 'success', 
-            'data': data
+            'data': data,
+            'freshness': _freshness(snapshot)
         })
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@altseason_bp.route('/api/altseason/series')
+def get_altseason_series_data():
+    """
+    API для получения дневного ряда Altcoin Season Index
+    
+    Параметры: window (дней, по умолчанию 30), start и end (YYYY-MM-DD).
+    """
+    series = get_altseason_series()
+    try:
+        window = int(request.args.get('window', 30))
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid window'
+        }), 400
+    if window not in series.windows():
+        return jsonify({
+            'status': 'error',
+            'message': f'Unknown window: {window}. Available: {series.windows()}'
+        }), 404
+    
+    points = series.get(window, request.args.get('start'), request.args.get('end'))
+    return jsonify({
+        'status': 'success',
+        'window': window,
+        'count': len(points),
+        'data': points
+    })
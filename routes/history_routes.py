@@ -1,5 +1,9 @@
-from flask import Blueprint, jsonify, render_template, request
+import io
+import csv
+import json
+from flask import Blueprint, Response, jsonify, render_template, request, stream_with_context
 from history_api import HistoryAPI
+from fear_greed_index import get_fear_greed_series
 from datetime import datetime
 
 # Создаем Blueprint для маршрутов истории
@@ -33,59 +37,174 @@ def history_page():
         altseason_history=altseason_history
     )
 
-@history_bp.route('/api/history/rank')
-def api_rank_history():
-    """API-эндпоинт для получения истории рейтинга"""
+def history_api_response(kind, legacy_getter):
+    """
+    Формирует ответ API истории
+    
+    По умолчанию используется keyset-пагинация: параметр cursor берется из
+    next_cursor предыдущего ответа. Если передан offset, используется прежняя
+    пагинация по смещению. Параметр resolution=day|week возвращает дневные или
+    недельные агрегаты вместо исходных записей.
+    """
     limit = int(request.args.get('limit', 100))
-    offset = int(request.args.get('offset', 0))
+    resolution = request.args.get('resolution', 'raw')
+    next_cursor = None
     
-    rank_history = history_api.get_rank_history(limit=limit, offset=offset)
+    if resolution != 'raw':
+        try:
+            history = history_api.get_rollup_history(kind, resolution, limit=limit)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+    elif 'offset' in request.args:
+        offset = int(request.args.get('offset', 0))
+        history = legacy_getter(limit=limit, offset=offset)
+    else:
+        try:
+            history, next_cursor = history_api.get_history_page(kind, limit=limit, cursor=request.args.get('cursor'))
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid cursor'
+            }), 400
     
     # Форматируем timestamp для API
-    for entry in rank_history:
+    for entry in history:
         if 'timestamp' in entry:
             entry['timestamp'] = format_timestamp(entry['timestamp'])
     
     return jsonify({
         'status': 'success',
-        'count': len(rank_history),
-        'data': rank_history
+        'resolution': resolution,
+        'count': len(history),
+        'data': history,
+        'next_cursor': next_cursor
     })
 
+@history_bp.route('/api/history/rank')
+def api_rank_history():
+    """API-эндпоинт для получения истории рейтинга"""
+    return history_api_response('rank', history_api.get_rank_history)
+
 @history_bp.route('/api/history/fear-greed')
 def api_fear_greed_history():
     """API-эндпоинт для получения истории индекса страха и жадности"""
-    limit = int(request.args.get('limit', 100))
-    offset = int(request.args.get('offset', 0))
+    return history_api_response('fear_greed', history_api.get_fear_greed_history)
+
+@history_bp.route('/api/history/fear-greed/daily')
+def api_fear_greed_daily():
+    """
+    Дневной ряд индекса страха и жадности из локального ряда (без запросов к alternative.me)
     
-    fear_greed_history = history_api.get_fear_greed_history(limit=limit, offset=offset)
-    
-    # Форматируем timestamp для API
-    for entry in fear_greed_history:
-        if 'timestamp' in entry:
-            entry['timestamp'] = format_timestamp(entry['timestamp'])
+    Параметры start и end (YYYY-MM-DD) ограничивают период включительно.
+    Для последнего значения возвращается процентиль за выбранный период.
+    """
+    start = request.args.get('start')
+    end = request.args.get('end')
+    for value in (start, end):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Invalid date: {value}'
+                }), 400
     
+    series = get_fear_greed_series()
+    points = series.get_range(start, end)
+    latest = points[-1] if points else None
     return jsonify({
         'status': 'success',
-        'count': len(fear_greed_history),
-        'data': fear_greed_history
+        'count': len(points),
+        'data': points,
+        'latest_percentile': series.percentile(latest['value'], start, end) if latest else None
     })
 
 @history_bp.route('/api/history/altseason')
 def api_altseason_history():
     """API-эндпоинт для получения истории данных Altcoin Season Index"""
-    limit = int(request.args.get('limit', 100))
-    offset = int(request.args.get('offset', 0))
+    return history_api_response('altseason', history_api.get_altseason_index_history)
+
+# Количество записей, отправляемых клиенту одним блоком при экспорте
+EXPORT_CHUNK_SIZE = 500
+
+def _export_value(value):
+    """Значение поля для экспорта: datetime в формате ISO 8601"""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _export_ndjson(records):
+    """Генератор блоков NDJSON: одна запись на строку"""
+    chunk = []
+    for entry in records:
+        chunk.append(json.dumps({key: _export_value(value) for key, value in entry.items()}, ensure_ascii=False))
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+def _export_csv(records, fields):
+    """Генератор блоков CSV с фиксированным набором столбцов вида истории"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for entry in records:
+        writer.writerow({key: _export_value(value) for key, value in entry.items()})
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@history_bp.route('/api/history/<kind>/export')
+def api_history_export(kind):
+    """
+    Потоковая выгрузка истории: /api/history/<kind>/export?format=csv|ndjson&from=&to=
     
-    altseason_history = history_api.get_altseason_index_history(limit=limit, offset=offset)
+    Записи отдаются генератором (chunked transfer) в хронологическом порядке,
+    поэтому память не зависит от размера истории. Период [from, to) задается
+    датой или timestamp ISO 8601 и ищется по индексу хранилища.
+    """
+    kind = kind.replace('-', '_')
+    if kind not in history_api.stores:
+        return jsonify({
+            'status': 'error',
+            'message': f"Unknown history kind: {kind}"
+        }), 404
     
-    # Форматируем timestamp для API
-    for entry in altseason_history:
-        if 'timestamp' in entry:
-            entry['timestamp'] = format_timestamp(entry['timestamp'])
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({
+            'status': 'error',
+            'message': "format must be csv or ndjson"
+        }), 400
     
-    return jsonify({
-        'status': 'success',
-        'count': len(altseason_history),
-        'data': altseason_history
-    })
\ No newline at end of file
+    start = request.args.get('from')
+    end = request.args.get('to')
+    for value in (start, end):
+        if value:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                return jsonify({
+                    'status': 'error',
+                    'message': f"Invalid date: {value}"
+                }), 400
+    
+    records = history_api.iter_history(kind, start=start, end=end)
+    if export_format == 'csv':
+        body, mimetype = _export_csv(records, history_api.HISTORY_FIELDS[kind]), 'text/csv'
+    else:
+        body, mimetype = _export_ndjson(records), 'application/x-ndjson'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{kind}_history.{export_format}"'}
+    )
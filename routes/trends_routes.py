@@ -13,7 +13,7 @@ def trends_page():
     Отображает страницу с данными Google Trends Pulse и историей
     """
     # Получаем историю трендов для графика
-    history = trends_pulse.history_data
+    history = trends_pulse.get_history()
     
     # Получаем текущие данные
     current_data = trends_pulse.get_trends_data()
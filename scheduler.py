@@ -11,8 +11,15 @@ from telegram_bot_sync import TelegramBotSync
 from fear_greed_index import FearGreedIndexTracker
 from altcoin_season_index import AltcoinSeasonIndex
 from market_breadth_indicator import MarketBreadthIndicator
+from leader_election import LeaderLease
+from job_state import JobRunStore
 
 class SensorTowerScheduler:
+    # Имя ежедневного задания в JobRunStore
+    DAILY_JOB_NAME = "daily_message"
+    # Имя ежедневного уплотнения истории в JobRunStore
+    COMPACTION_JOB_NAME = "history_compaction"
+
     def __init__(self):
         # Instead of using APScheduler, create a simple threading-based scheduler
         self.running = False
@@ -48,7 +55,24 @@ class SensorTowerScheduler:
             logger.error(f"Ошибка при чтении файла истории рейтинга: {str(e)}")
             self.last_sent_rank = None
             
-        self.lockfile = None  # Для блокировки файла (предотвращения запуска нескольких экземпляров)
+        # Аренда лидерства вместо файла блокировки: задания выполняет только лидер,
+        # остальные процессы (воркеры gunicorn) обслуживают веб-запросы
+        from config import LEADER_LEASE_DB, LEADER_LEASE_TTL
+        self.leader_lease = LeaderLease(LEADER_LEASE_DB, name="scheduler", ttl=LEADER_LEASE_TTL)
+        
+        # Запуски заданий сохраняются на диск, чтобы после перезапуска догнать
+        # пропущенный запуск или продолжить незавершенный с последнего этапа
+        from config import JOB_STATE_DB, JOB_CATCHUP_WINDOW_HOURS, JOB_MAX_ATTEMPTS, JOB_RUNS_RETENTION_DAYS
+        self.job_store = JobRunStore(JOB_STATE_DB)
+        self.catchup_window = timedelta(hours=JOB_CATCHUP_WINDOW_HOURS)
+        self.max_attempts = JOB_MAX_ATTEMPTS
+        self.runs_retention = timedelta(days=JOB_RUNS_RETENTION_DAYS)
+        
+        from config import HISTORY_COMPACTION_HOUR
+        self.compaction_hour = HISTORY_COMPACTION_HOUR
+        # Google Trends (фоновая выборка запускается в start)
+        self.trends_pulse = None
+        self.altseason_snapshot = None
     
     def run_rnk_script(self):
         """
@@ -76,17 +100,102 @@ class SensorTowerScheduler:
         except Exception as e:
             logger.error(f"Ошибка при запуске rnk.py: {str(e)}")
     
+    def _get_due_slot(self, now):
+        """
+        Возвращает последнее наступившее плановое время запуска (08:01 UTC = 11:01 MSK)
+        
+        Запуск считается наступившим за 60 секунд до планового времени, как и раньше.
+        """
+        slot = now.replace(hour=8, minute=1, second=0, microsecond=0)
+        if now + timedelta(seconds=60) < slot:
+            slot -= timedelta(days=1)
+        return slot
+
+    def _run_due_job(self, slot, now):
+        """
+        Запускает плановое задание для слота, если оно еще не выполнено успешно:
+        вовремя, как догоняющий запуск после перезапуска или как продолжение незавершенного
+        
+        Returns:
+            bool: True если задание запускалось
+        """
+        if now - slot > self.catchup_window:
+            return False
+        
+        scheduled_for = slot.isoformat()
+        run = self.job_store.get_run(self.DAILY_JOB_NAME, scheduled_for)
+        
+        if run is None:
+            if now - slot > timedelta(seconds=60) and not self.job_store.get_latest_runs(self.DAILY_JOB_NAME, 1):
+                # Хранилище запусков пустое (первый запуск с этой версией) - не знаем, было ли
+                # сообщение отправлено до обновления, поэтому ждем следующего слота
+                logger.info(f"Нет сохраненных запусков, догоняющий запуск для {scheduled_for} не выполняется")
+                return False
+            if now - slot > timedelta(seconds=60):
+                logger.info(f"Обнаружен пропущенный запуск {scheduled_for}, выполняем догоняющий запуск")
+            else:
+                logger.info(f"ВРЕМЯ ОТПРАВКИ: Запуск полного сбора данных и отправки в {now}")
+        elif run['status'] == JobRunStore.STATUS_SUCCEEDED:
+            return False
+        elif run['attempts'] >= self.max_attempts:
+            logger.warning(f"Запуск {scheduled_for} не выполнен за {run['attempts']} попыток, повторов больше не будет")
+            return False
+        else:
+            logger.info(f"Продолжаем незавершенный запуск {scheduled_for} (статус {run['status']}, попыток: {run['attempts']})")
+        
+        token = self.leader_lease.token
+        job_run = self.job_store.start_run(self.DAILY_JOB_NAME, scheduled_for, fencing_token=token)
+        try:
+            result = self.run_scraping_job(fencing_token=token, job_run=job_run)
+            if result:
+                self.job_store.finish_run(job_run['id'], JobRunStore.STATUS_SUCCEEDED)
+                logger.info(f"Данные успешно собраны и отправлены: {datetime.now()}")
+            else:
+                self.job_store.finish_run(job_run['id'], JobRunStore.STATUS_FAILED, error="Message was not sent")
+        except Exception as e:
+            self.job_store.finish_run(job_run['id'], JobRunStore.STATUS_FAILED, error=str(e))
+            logger.error(f"Ошибка при отправке данных: {str(e)}")
+        return True
+
+    def _run_due_compaction(self, now):
+        """
+        Раз в сутки после HISTORY_COMPACTION_HOUR уплотняет файлы истории
+        
+        Returns:
+            bool: True если уплотнение запускалось
+        """
+        slot = now.replace(hour=self.compaction_hour, minute=0, second=0, microsecond=0)
+        if now < slot:
+            return False
+        
+        scheduled_for = slot.isoformat()
+        run = self.job_store.get_run(self.COMPACTION_JOB_NAME, scheduled_for)
+        if run is not None and (run['status'] == JobRunStore.STATUS_SUCCEEDED or run['attempts'] >= self.max_attempts):
+            return False
+        
+        job_run = self.job_store.start_run(self.COMPACTION_JOB_NAME, scheduled_for, fencing_token=self.leader_lease.token)
+        try:
+            from history_api import HistoryAPI
+            from history_compaction import compact_history
+            report = compact_history(HistoryAPI(self.data_dir))
+            self.job_store.complete_stage(job_run['id'], 'report', report)
+            self.job_store.finish_run(job_run['id'], JobRunStore.STATUS_SUCCEEDED)
+        except Exception as e:
+            self.job_store.finish_run(job_run['id'], JobRunStore.STATUS_FAILED, error=str(e))
+            logger.error(f"Ошибка при уплотнении истории: {str(e)}")
+        # Вместе с историей раз в сутки очищаем старые запуски и результаты этапов
+        self.job_store.prune(self.catchup_window.total_seconds(), self.runs_retention.total_seconds())
+        return True
+
     def _scheduler_loop(self):
         """
         The main scheduler loop that runs in a background thread.
         - ИСПРАВЛЕНО: Собирает ВСЕ данные включая рейтинг НЕПОСРЕДСТВЕННО в момент отправки в 8:01 UTC
         - Данные рейтинга загружаются через rnk.py прямо перед отправкой для максимальной актуальности
         - Все данные собираются за один раз и отправляются одним сообщением
+        - Состояние запусков хранится в JobRunStore: после перезапуска лидер догоняет
+          пропущенный запуск или продолжает незавершенный с последнего этапа
         """
-        # Переменные для отслеживания, когда последний раз обновлялись данные
-        self.last_rank_update_date = None
-        self.last_rnk_update_date = None
-        
         # При запуске не будем загружать данные Google Trends - получим их вместе с общим обновлением
         logger.info("ИСПРАВЛЕНО: Планировщик запущен, ПОЛНЫЙ сбор данных + отправка в 11:01 MSK (без предварительного сбора в 10:59)")
         
@@ -94,36 +203,24 @@ class SensorTowerScheduler:
             try:
                 # Текущее время и дата
                 now = datetime.now()
-                today = now.date()
-                
-                # Вычисляем время до следующего запуска (08:01 UTC = 11:01 MSK)
-                target_hour = 8
-                target_minute = 1
-                
-                # Создаем целевое время на сегодня
-                target_time = now.replace(hour=target_hour, minute=target_minute, second=0, microsecond=0)
                 
-                # Если целевое время уже прошло сегодня, планируем на завтра
-                if now >= target_time:
-                    target_time = target_time.replace(day=target_time.day + 1)
+                # Последний наступивший плановый запуск и следующий за ним
+                due_slot = self._get_due_slot(now)
+                target_time = due_slot + timedelta(days=1)
                 
                 # Вычисляем количество секунд до целевого времени
                 time_diff = (target_time - now).total_seconds()
                 
                 logger.info(f"Следующий запуск запланирован на: {target_time} (через {int(time_diff/3600)} часов {int((time_diff%3600)/60)} минут)")
                 
-                # Проверяем, не пора ли уже отправлять (если время подошло в течение последней минуты)
-                if time_diff <= 60 and (self.last_rank_update_date is None or self.last_rank_update_date < today):
-                    logger.info(f"ВРЕМЯ ОТПРАВКИ: Запуск полного сбора данных и отправки в {now}")
-                    try:
-                        self.run_scraping_job()
-                        self.last_rank_update_date = today
-                        logger.info(f"Данные успешно собраны и отправлены: {now}")
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке данных: {str(e)}")
-                    
-                    # После отправки спим до следующего дня
-                    time_diff = 24 * 60 * 60  # 24 часа
+                if self.leader_lease.is_leader:
+                    # Выполняем задание, если слот наступил и еще не обработан.
+                    # Неудачный запуск повторяется на следующей итерации (не чаще раза в час)
+                    self._run_due_job(due_slot, now)
+                    self._run_due_compaction(datetime.now())
+                elif now - due_slot <= timedelta(seconds=60):
+                    # Задание выполняет другой процесс, удерживающий аренду
+                    logger.info(f"ВРЕМЯ ОТПРАВКИ: Этот процесс не лидер ({self.leader_lease.holder_id}), задание выполнит лидер")
                 
                 # ИСПРАВЛЕНО: В критический период проверяем каждые 30 секунд
                 if time_diff <= 300:  # Если до запуска меньше 5 минут
@@ -148,26 +245,6 @@ class SensorTowerScheduler:
     def start(self):
         """Start the scheduler"""
         try:
-            # Проверка на наличие уже запущенного экземпляра
-            import fcntl
-            import os
-            
-            # Перемещаем файл блокировки также в директорию данных
-            lockfile_path = os.path.join(self.data_dir, "coinbasebot.lock")
-            logger.info(f"Файл блокировки будет храниться по пути: {lockfile_path}")
-            
-            # Если файл блокировки существует, но стар (> 30 минут), удаляем его
-            if os.path.exists(lockfile_path):
-                try:
-                    file_time = os.path.getmtime(lockfile_path)
-                    current_time = time.time()
-                    # Если файл старше 30 минут
-                    if current_time - file_time > 30 * 60:
-                        os.remove(lockfile_path)
-                        logger.info(f"Удален устаревший файл блокировки (возраст: {(current_time - file_time)/60:.1f} минут)")
-                except Exception as e:
-                    logger.warning(f"Ошибка при проверке старого файла блокировки: {str(e)}")
-                    
             # Проверяем и удаляем старый файл блокировки ручной операции
             manual_lock_file = os.path.join(self.data_dir, "manual_operation.lock")
             if os.path.exists(manual_lock_file):
@@ -182,19 +259,36 @@ class SensorTowerScheduler:
                         logger.warning(f"При запуске обнаружен недавний файл блокировки ручной операции (возраст: {(current_time - file_time)/60:.1f} минут)")
                 except Exception as e:
                     logger.warning(f"Ошибка при проверке файла блокировки ручной операции: {str(e)}")
-            
-            try:
-                self.lockfile = open(lockfile_path, "w")
-                fcntl.lockf(self.lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
-                logger.info("Получена блокировка файла. Этот экземпляр бота будет единственным запущенным.")
-            except IOError:
-                logger.error("Другой экземпляр бота уже запущен. Завершение работы.")
-                self.lockfile = None
-                return False
                 
             if self.running:
                 logger.warning("Scheduler is already running")
                 return True
+            
+            # Запускаем heartbeat аренды: лидер продлевает ее, резервные процессы ждут освобождения.
+            # Все процессы запускают цикл планировщика, но задания выполняет только лидер.
+            if self.leader_lease.try_acquire():
+                logger.info(f"Этот процесс стал лидером планировщика (fencing token {self.leader_lease.token})")
+            else:
+                logger.info("Лидер планировщика уже существует. Этот процесс работает в резервном режиме и обслуживает веб-запросы")
+            self.leader_lease.start()
+            
+            # Фоновая выборка Google Trends (весь мир и регионы): запросы распределяются
+            # по суткам в пределах бюджета и выполняются только лидером
+            try:
+                from google_trends_pulse import GoogleTrendsPulse
+                self.trends_pulse = GoogleTrendsPulse()
+                self.trends_pulse.start_sampling(should_run=lambda: self.leader_lease.is_leader)
+            except Exception as e:
+                logger.warning(f"Фоновая выборка Google Trends не запущена: {str(e)}")
+            
+            # Снимок Altcoin Season Index для страницы и API обновляет только лидер,
+            # остальные воркеры читают сохраненный им файл снимка
+            try:
+                from altseason_snapshot import get_altseason_snapshot
+                self.altseason_snapshot = get_altseason_snapshot()
+                self.altseason_snapshot.start(should_run=lambda: self.leader_lease.is_leader)
+            except Exception as e:
+                logger.warning(f"Фоновое обновление снимка Altcoin Season Index не запущено: {str(e)}")
                 
             self.running = True
             self.stop_event.clear()
@@ -227,18 +321,27 @@ class SensorTowerScheduler:
             self.stop_event.set()
             if self.thread:
                 self.thread.join(timeout=1)
-            # Освобождаем блокировку файла при остановке
-            if hasattr(self, 'lockfile') and self.lockfile is not None:
-                import fcntl
-                try:
-                    fcntl.lockf(self.lockfile, fcntl.LOCK_UN)
-                    self.lockfile.close()
-                    logger.info("Блокировка файла освобождена")
-                except Exception as e:
-                    logger.error(f"Ошибка при освобождении блокировки файла: {str(e)}")
+            try:
+                if self.trends_pulse:
+                    self.trends_pulse.stop_sampling()
+            except Exception as e:
+                logger.error(f"Ошибка при остановке выборки Google Trends: {str(e)}")
+            if self.altseason_snapshot:
+                self.altseason_snapshot.stop()
+            # Дописываем историю, ожидающую фоновой записи
+            try:
+                from history_writer import get_history_writer
+                get_history_writer().flush(timeout=10)
+            except Exception as e:
+                logger.error(f"Ошибка при записи очереди истории: {str(e)}")
+            # Освобождаем аренду, чтобы резервный процесс мог сразу стать лидером
+            try:
+                self.leader_lease.stop()
+            except Exception as e:
+                logger.error(f"Ошибка при освобождении аренды лидерства: {str(e)}")
             logger.info("Scheduler stopped")
     
-    def _send_combined_message(self, rankings_data, fear_greed_data=None, altseason_data=None, market_breadth_data=None, chart_data=None):
+    def _send_combined_message(self, rankings_data, fear_greed_data=None, altseason_data=None, market_breadth_data=None, chart_data=None, fencing_token=None):
         """
         Отправляет комбинированное сообщение с данными о рейтинге, индексе страха и жадности,
         Altcoin Season Index и ширине рынка в упрощенном формате
@@ -248,6 +351,8 @@ class SensorTowerScheduler:
             fear_greed_data (dict, optional): Данные индекса страха и жадности
             altseason_data (dict, optional): Данные индекса сезона альткоинов
             market_breadth_data (dict, optional): Данные индикатора ширины рынка
+            fencing_token (int, optional): Токен аренды лидерства; если указан, сообщение
+                                           отправляется только пока аренда принадлежит этому процессу
             
         Returns:
             bool: True если сообщение успешно отправлено, False в противном случае
@@ -324,6 +429,12 @@ class SensorTowerScheduler:
             else:
                 logger.info("Altcoin Season Index данные недоступны")
             
+            # Проверяем fencing-токен непосредственно перед отправкой: если за время сбора
+            # данных аренду захватил другой процесс, не отправляем дубликат
+            if fencing_token is not None and not self.leader_lease.check_token(fencing_token):
+                logger.error(f"Аренда лидерства потеряна (fencing token {fencing_token}). Сообщение не отправлено.")
+                return False
+            
             # Отправляем основное сообщение (теперь включает встроенную ссылку на график)
             if not self.telegram_bot.send_message(combined_message):
                 logger.error("Не удалось отправить комбинированное сообщение в Telegram.")
@@ -343,246 +454,403 @@ class SensorTowerScheduler:
                 pass
             return False
     
-    def run_scraping_job(self, force_refresh=False):
+    def _stage(self, job_run, stage_outputs, stage, func, persist=None):
         """
-        Выполняет задание по скрапингу: получает данные SensorTower, Fear & Greed Index, 
-        Altcoin Season Index и отправляет в Telegram КАЖДЫЙ ДЕНЬ независимо от изменения рейтинга
+        Выполняет этап задания или возвращает его сохраненный результат
+
+        Args:
+            job_run (dict): Запись запуска из JobRunStore или None для ручного запуска
+            stage_outputs (dict): Результаты уже завершенных этапов этого запуска
+            stage (str): Имя этапа
+            func (callable): Функция, выполняющая этап
+            persist (callable, optional): Отбирает из результата то, что сохраняется
+                в JobRunStore (по умолчанию сохраняется весь результат)
+
+        Returns:
+            Результат этапа
+        """
+        if stage in stage_outputs:
+            logger.info(f"Этап '{stage}' уже выполнен в запуске {job_run['scheduled_for']}, используем сохраненный результат")
+            return stage_outputs[stage]
+        output = func()
+        # Пустой результат не сохраняем, чтобы при повторной попытке этап выполнился снова
+        if job_run is not None and output is not None:
+            self.job_store.complete_stage(job_run['id'], stage, persist(output) if persist else output)
+        return output
+
+    def _collect_rank_data(self):
+        """
+        Запускает rnk.py и читает свежий рейтинг из JSON файла
+        
+        Returns:
+            dict: {'rank': int или None, 'date': str или None}
+        """
+        # ИСПРАВЛЕНИЕ: Собираем СВЕЖИЕ данные рейтинга НЕПОСРЕДСТВЕННО в момент отправки
+        logger.info("ИСПРАВЛЕНИЕ: Собираем СВЕЖИЕ данные рейтинга через rnk.py прямо сейчас")
+        
+        # Сначала запускаем rnk.py для получения свежих данных
+        try:
+            logger.info("Запуск rnk.py для получения актуальных данных...")
+            self.run_rnk_script()
+            logger.info("rnk.py выполнен успешно, данные обновлены")
+            
+            # Небольшая пауза чтобы данные успели записаться
+            time.sleep(2)
+            
+        except Exception as e:
+            logger.error(f"Ошибка при запуске rnk.py: {str(e)}")
+        
+        # Теперь читаем свежие данные из JSON файла
+        from json_rank_reader import get_rank_from_json, get_latest_rank_date
+        
+        current_rank = get_rank_from_json()
+        current_date = get_latest_rank_date()
         
+        logger.info(f"ИСПРАВЛЕНИЕ: Получен СВЕЖИЙ рейтинг {current_rank} на дату {current_date}")
+        return {'rank': current_rank, 'date': current_date}
+
+    def _collect_fear_greed_data(self):
+        """
+        Returns:
+            dict: Данные Fear & Greed Index или None
+        """
+        try:
+            fear_greed_data = self.fear_greed_tracker.get_fear_greed_index()
+            if fear_greed_data:
+                logger.info(f"Успешно получены данные Fear & Greed Index: {fear_greed_data['value']} ({fear_greed_data['classification']})")
+            else:
+                logger.warning("Не удалось получить данные Fear & Greed Index")
+            return fear_greed_data
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных Fear & Greed Index: {str(e)}")
+            return None
+
+    def _collect_altseason_data(self, chart_data=None):
+        """
         Args:
-            force_refresh (bool): Параметр больше не используется, сообщения отправляются всегда
+            chart_data (dict, optional): Данные Market Breadth; если есть historical_data,
+                                         индекс считается по той же матрице цен без запроса к CoinGecko
+        
+        Returns:
+            dict: Данные Altcoin Season Index или None
         """
-        logger.info(f"Выполняется запланированное задание скрапинга в {datetime.now()}")
+        # Это всегда происходит при отправке сообщения, чтобы данные были актуальными
+        try:
+            logger.info("Получение данных Altcoin Season Index для комбинированного сообщения")
+            prices = None
+            if chart_data and chart_data.get('historical_data'):
+                from crypto_analyzer_cryptocompare import CryptoAnalyzer
+                prices = CryptoAnalyzer.build_price_matrix(chart_data['historical_data'])
+                # Исторический ряд индекса (7/30/90 дней) по той же матрице одним расчетом
+                try:
+                    from config import ASI_SERIES_WINDOWS
+                    from altseason_series import get_altseason_series
+                    get_altseason_series().update(prices, ASI_SERIES_WINDOWS)
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении ряда Altcoin Season Index: {str(e)}")
+            altseason_data = self.altcoin_season_index.get_altseason_index(prices)
+            if altseason_data:
+                logger.info(f"Успешно получены данные Altcoin Season Index: {altseason_data['signal']} - {altseason_data['status']} (Индекс: {altseason_data['index']})")
+            else:
+                logger.warning("Не удалось получить данные Altcoin Season Index")
+            return altseason_data
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных Altcoin Season Index: {str(e)}")
+            return None
+
+    def _collect_market_breadth_data(self):
+        """
+        Загружает исторические данные ОДИН РАЗ и рассчитывает Market Breadth
         
+        Returns:
+            dict: {'market_breadth_data': dict, 'chart_data': dict} или None
+        """
         try:
-            # Проверяем соединение с Telegram
-            if not self.telegram_bot.test_connection():
-                logger.error("Ошибка соединения с Telegram. Задание прервано.")
-                return False
+            logger.info("ИСПРАВЛЕНИЕ: Загружаем свежие данные ОДИН РАЗ для Market Breadth и графика")
+            from crypto_analyzer_cryptocompare import CryptoAnalyzer
             
-            # ИСПРАВЛЕНИЕ: Собираем СВЕЖИЕ данные рейтинга НЕПОСРЕДСТВЕННО в момент отправки
-            logger.info("ИСПРАВЛЕНИЕ: Собираем СВЕЖИЕ данные рейтинга через rnk.py прямо сейчас")
+            analyzer = CryptoAnalyzer(cache=None)
+            top_coins = analyzer.get_top_coins(50)
             
-            # Сначала запускаем rnk.py для получения свежих данных
-            try:
-                logger.info("Запуск rnk.py для получения актуальных данных...")
-                self.run_rnk_script()
-                logger.info("rnk.py выполнен успешно, данные обновлены")
-                
-                # Небольшая пауза чтобы данные успели записаться
-                import time
-                time.sleep(2)
-                
-            except Exception as e:
-                logger.error(f"Ошибка при запуске rnk.py: {str(e)}")
+            if not top_coins:
+                logger.warning("ИСПРАВЛЕНИЕ: Не удалось получить топ монет")
+                return None
+            
+            stablecoins = ['USDT', 'USDC', 'DAI']
+            filtered_coins = [coin for coin in top_coins if coin['symbol'] not in stablecoins]
+            
+            # Загружаем исторические данные ОДИН РАЗ
+            historical_data = analyzer.load_historical_data(filtered_coins, 1400)
+            
+            if not historical_data:
+                logger.warning("ИСПРАВЛЕНИЕ: Не удалось загрузить исторические данные")
+                return None
             
-            # Теперь читаем свежие данные из JSON файла
-            from json_rank_reader import get_rank_from_json, get_latest_rank_date
+            # Рассчитываем индикатор ОДИН РАЗ
+            indicator_data = analyzer.calculate_market_breadth(historical_data, 200, 1095)
             
-            current_rank = get_rank_from_json()
-            current_date = get_latest_rank_date()
+            if indicator_data.empty:
+                logger.warning("ИСПРАВЛЕНИЕ: Пустые данные индикатора")
+                return None
             
-            logger.info(f"ИСПРАВЛЕНИЕ: Получен СВЕЖИЙ рейтинг {current_rank} на дату {current_date}")
+            latest_percentage = indicator_data['percentage'].iloc[-1]
             
-            # Создаем структуру данных совместимую с остальным кодом
-            rankings_data = {
-                "app_name": "Coinbase",
-                "app_id": "886427730",
-                "date": current_date or time.strftime("%Y-%m-%d"),
-                "categories": [
-                    {"category": "US - iPhone - Top Free", "rank": str(current_rank) if current_rank is not None else "None"}
-                ],
-                "trend": {"direction": "same", "previous": None}
+            # Определяем сигнал и условие
+            if latest_percentage >= 80:
+                signal = "🔴"
+                condition = "Overbought"
+            elif latest_percentage <= 20:
+                signal = "🟢"  
+                condition = "Oversold"
+            else:
+                signal = "🟡"
+                condition = "Neutral"
+            
+            market_breadth_data = {
+                'signal': signal,
+                'condition': condition,
+                'current_value': latest_percentage,
+                'percentage': round(latest_percentage, 1)
             }
             
-            logger.info(f"ИСПРАВЛЕНИЕ: Текущий рейтинг из JSON: {current_rank} на дату {current_date}")
+            # Сохраняем данные для создания графика БЕЗ ПОВТОРНОЙ ЗАГРУЗКИ
+            chart_data = {
+                'historical_data': historical_data,
+                'indicator_data': indicator_data
+            }
             
-            # Получаем данные индекса страха и жадности
-            fear_greed_data = None
-            try:
-                fear_greed_data = self.fear_greed_tracker.get_fear_greed_index()
-                if fear_greed_data:
-                    logger.info(f"Успешно получены данные Fear & Greed Index: {fear_greed_data['value']} ({fear_greed_data['classification']})")
-                else:
-                    logger.warning("Не удалось получить данные Fear & Greed Index")
-            except Exception as e:
-                logger.error(f"Ошибка при получении данных Fear & Greed Index: {str(e)}")
-                
-            # Получаем свежие данные Altcoin Season Index
-            # Это всегда происходит при отправке сообщения, чтобы данные были актуальными
-            altseason_data = None
-            try:
-                logger.info("Получение данных Altcoin Season Index для комбинированного сообщения")
-                altseason_data = self.altcoin_season_index.get_altseason_index()
-                if altseason_data:
-                    logger.info(f"Успешно получены данные Altcoin Season Index: {altseason_data['signal']} - {altseason_data['status']} (Индекс: {altseason_data['index']})")
+            logger.info(f"ИСПРАВЛЕНИЕ: Market Breadth рассчитан ОДИН РАЗ: {signal} - {condition} ({latest_percentage:.1f}%)")
+            return {'market_breadth_data': market_breadth_data, 'chart_data': chart_data}
+                    
+        except Exception as e:
+            logger.error(f"ИСПРАВЛЕНИЕ: Ошибка загрузки данных: {str(e)}")
+            return None
+
+    def _build_rankings_data(self, current_rank, current_date):
+        """
+        Создает структуру данных рейтинга с трендом относительно последнего отправленного рейтинга
+        
+        Returns:
+            dict: Данные рейтинга, совместимые с format_rankings_message
+        """
+        rankings_data = {
+            "app_name": "Coinbase",
+            "app_id": "886427730",
+            "date": current_date or time.strftime("%Y-%m-%d"),
+            "categories": [
+                {"category": "US - iPhone - Top Free", "rank": str(current_rank) if current_rank is not None else "None"}
+            ],
+            "trend": {"direction": "same", "previous": None}
+        }
+        
+        # ИЗМЕНЕНО: Отправляем сообщение каждый день независимо от изменения рейтинга
+        if self.last_sent_rank is None:
+            logger.info(f"Первый запуск, предыдущее значение отсутствует. Текущий рейтинг: {current_rank}")
+            # Для тестирования добавляем искусственный тренд, если есть числовое значение
+            if current_rank is not None:
+                rankings_data["trend"] = {"direction": "up", "previous": current_rank + 5}
+                logger.info(f"Добавлен искусственный тренд для тестирования отображения индикаторов: {current_rank + 5} → {current_rank}")
+            else:
+                rankings_data["trend"] = {"direction": "same", "previous": None}
+        elif current_rank != self.last_sent_rank:
+            logger.info(f"Обнаружено изменение рейтинга: {current_rank} (предыдущий: {self.last_sent_rank})")
+            # Добавляем префикс для понимания, улучшение или ухудшение (только для числовых значений)
+            if current_rank is not None and self.last_sent_rank is not None:
+                if current_rank < self.last_sent_rank:
+                    logger.info(f"Улучшение рейтинга: {self.last_sent_rank} → {current_rank}")
+                    rankings_data["trend"] = {"direction": "up", "previous": self.last_sent_rank}
                 else:
-                    logger.warning("Не удалось получить данные Altcoin Season Index")
-            except Exception as e:
-                logger.error(f"Ошибка при получении данных Altcoin Season Index: {str(e)}")
+                    logger.info(f"Ухудшение рейтинга: {self.last_sent_rank} → {current_rank}")
+                    rankings_data["trend"] = {"direction": "down", "previous": self.last_sent_rank}
+            else:
+                # Если один из рейтингов None, просто показываем изменение
+                rankings_data["trend"] = {"direction": "same", "previous": self.last_sent_rank}
+        else:
+            logger.info(f"Рейтинг не изменился ({current_rank} = {self.last_sent_rank}), но сообщение будет отправлено согласно ежедневному расписанию.")
+            # Сохраняем последний рейтинг для показа тренда
+            rankings_data["trend"] = {"direction": "same", "previous": self.last_sent_rank}
+        
+        return rankings_data
+
+    def _save_job_history(self, current_rank, previous_rank, fear_greed_data, altseason_data):
+        """
+        Сохраняет последний отправленный рейтинг в файл и данные в JSON-историю
+        
+        Returns:
+            bool: True после попытки сохранения (ошибки только логируются)
+        """
+        # Сохраняем рейтинг в файл для восстановления при перезапуске
+        # Делаем это синхронно с обновлением переменной, чтобы избежать рассинхронизации
+        try:
+            with open(self.rank_history_file, "w") as f:
+                f.write(str(current_rank) if current_rank is not None else "None")
+            logger.info(f"Рейтинг {current_rank} сохранен в файл {self.rank_history_file}")
             
-            # ИСПРАВЛЕНИЕ: Загружаем данные ОДИН РАЗ и используем для расчета и графика
-            market_breadth_data = None
-            chart_data = None
+            # Проверка записи в файл
+            if os.path.exists(self.rank_history_file):
+                with open(self.rank_history_file, "r") as check_file:
+                    saved_value = check_file.read().strip()
+                    if saved_value != str(current_rank):
+                        logger.error(f"Ошибка записи: в файле {saved_value}, должно быть {current_rank}")
+                        
+            # Дополнительно, сохраняем в JSON-историю через HistoryAPI
             try:
-                logger.info("ИСПРАВЛЕНИЕ: Загружаем свежие данные ОДИН РАЗ для Market Breadth и графика")
-                from crypto_analyzer_cryptocompare import CryptoAnalyzer
+                # Импортируем API истории
+                from history_api import HistoryAPI
                 
-                analyzer = CryptoAnalyzer(cache=None)
-                top_coins = analyzer.get_top_coins(50)
+                # Создаем экземпляр API и сохраняем данные
+                history_api = HistoryAPI(self.data_dir)
                 
-                if top_coins:
-                    stablecoins = ['USDT', 'USDC', 'DAI']
-                    filtered_coins = [coin for coin in top_coins if coin['symbol'] not in stablecoins]
+                # Сохраняем рейтинг в историю с предыдущим значением для подсчета изменения
+                history_api.save_rank_history(
+                    rank=current_rank, 
+                    previous_rank=previous_rank
+                )
+                
+                # Если доступны данные индекса страха и жадности, сохраняем и их
+                if fear_greed_data and 'value' in fear_greed_data and 'classification' in fear_greed_data:
+                    history_api.save_fear_greed_history(
+                        value=int(fear_greed_data['value']), 
+                        classification=fear_greed_data['classification']
+                    )
                     
-                    # Загружаем исторические данные ОДИН РАЗ
-                    historical_data = analyzer.load_historical_data(filtered_coins, 1400)
+                # Если доступны данные Altcoin Season Index, сохраняем их
+                if (altseason_data and 
+                    'signal' in altseason_data and 
+                    'description' in altseason_data and 
+                    'status' in altseason_data and 
+                    'index' in altseason_data and 
+                    'btc_performance' in altseason_data and
+                    altseason_data['signal'] is not None):
+                    # Сохраняем данные Altcoin Season Index в историю
+                    try:
+                        history_api.save_altseason_index_history(
+                            signal=altseason_data['signal'],
+                            description=altseason_data['description'],
+                            status=altseason_data['status'],
+                            index=altseason_data['index'],
+                            btc_performance=altseason_data['btc_performance']
+                        )
+                        logger.info(f"Сохранены данные Altcoin Season Index в историю: {altseason_data['signal']} - {altseason_data['status']}")
+                    except Exception as e:
+                        logger.warning(f"Ошибка при сохранении Altcoin Season Index в историю: {str(e)}")
                     
-                    if historical_data:
-                        # Рассчитываем индикатор ОДИН РАЗ
-                        indicator_data = analyzer.calculate_market_breadth(historical_data, 200, 1095)
-                        
-                        if not indicator_data.empty:
-                            latest_percentage = indicator_data['percentage'].iloc[-1]
-                            
-                            # Определяем сигнал и условие
-                            if latest_percentage >= 80:
-                                signal = "🔴"
-                                condition = "Overbought"
-                            elif latest_percentage <= 20:
-                                signal = "🟢"  
-                                condition = "Oversold"
-                            else:
-                                signal = "🟡"
-                                condition = "Neutral"
-                            
-                            market_breadth_data = {
-                                'signal': signal,
-                                'condition': condition,
-                                'current_value': latest_percentage,
-                                'percentage': round(latest_percentage, 1)
-                            }
-                            
-                            # Сохраняем данные для создания графика БЕЗ ПОВТОРНОЙ ЗАГРУЗКИ
-                            chart_data = {
-                                'historical_data': historical_data,
-                                'indicator_data': indicator_data
-                            }
-                            
-                            logger.info(f"ИСПРАВЛЕНИЕ: Market Breadth рассчитан ОДИН РАЗ: {signal} - {condition} ({latest_percentage:.1f}%)")
-                        else:
-                            logger.warning("ИСПРАВЛЕНИЕ: Пустые данные индикатора")
-                    else:
-                        logger.warning("ИСПРАВЛЕНИЕ: Не удалось загрузить исторические данные")
-                else:
-                    logger.warning("ИСПРАВЛЕНИЕ: Не удалось получить топ монет")
-                        
-            except Exception as e:
-                logger.error(f"ИСПРАВЛЕНИЕ: Ошибка загрузки данных: {str(e)}")
-            
-            # ИЗМЕНЕНО: Отправляем сообщение каждый день независимо от изменения рейтинга
-            if self.last_sent_rank is None:
-                logger.info(f"Первый запуск, предыдущее значение отсутствует. Текущий рейтинг: {current_rank}")
-                # Для тестирования добавляем искусственный тренд, если есть числовое значение
-                if current_rank is not None:
-                    rankings_data["trend"] = {"direction": "up", "previous": current_rank + 5}
-                    logger.info(f"Добавлен искусственный тренд для тестирования отображения индикаторов: {current_rank + 5} → {current_rank}")
-                else:
-                    rankings_data["trend"] = {"direction": "same", "previous": None}
-            elif current_rank != self.last_sent_rank:
-                logger.info(f"Обнаружено изменение рейтинга: {current_rank} (предыдущий: {self.last_sent_rank})")
-                # Добавляем префикс для понимания, улучшение или ухудшение (только для числовых значений)
-                if current_rank is not None and self.last_sent_rank is not None:
-                    if current_rank < self.last_sent_rank:
-                        logger.info(f"Улучшение рейтинга: {self.last_sent_rank} → {current_rank}")
-                        rankings_data["trend"] = {"direction": "up", "previous": self.last_sent_rank}
-                    else:
-                        logger.info(f"Ухудшение рейтинга: {self.last_sent_rank} → {current_rank}")
-                        rankings_data["trend"] = {"direction": "down", "previous": self.last_sent_rank}
-                else:
-                    # Если один из рейтингов None, просто показываем изменение
-                    rankings_data["trend"] = {"direction": "same", "previous": self.last_sent_rank}
-            else:
-                logger.info(f"Рейтинг не изменился ({current_rank} = {self.last_sent_rank}), но сообщение будет отправлено согласно ежедневному расписанию.")
-                # Сохраняем последний рейтинг для показа тренда
-                rankings_data["trend"] = {"direction": "same", "previous": self.last_sent_rank}
+                logger.info(f"История данных успешно сохранена в JSON-файлы")
+            except ImportError:
+                # API истории недоступен, пропускаем сохранение в историю
+                logger.debug("API истории недоступен. История рейтинга сохранена только в файл.")
+            except Exception as history_error:
+                logger.error(f"Ошибка при сохранении истории в JSON-файлы: {str(history_error)}")
+                
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении рейтинга в файл: {str(e)}")
+        
+        return True
+
+    def run_scraping_job(self, force_refresh=False, fencing_token=None, job_run=None):
+        """
+        Выполняет задание по скрапингу: получает данные SensorTower, Fear & Greed Index, 
+        Altcoin Season Index и отправляет в Telegram КАЖДЫЙ ДЕНЬ независимо от изменения рейтинга
+        
+        Задание разбито на этапы (rank, fear_greed, altseason, market_breadth, send, history).
+        Для плановых запусков результат каждого этапа сохраняется в JobRunStore, и повторная
+        попытка того же запуска продолжает работу с первого незавершенного этапа.
+        
+        Args:
+            force_refresh (bool): Параметр больше не используется, сообщения отправляются всегда
+            fencing_token (int, optional): Токен аренды лидерства для плановых запусков.
+                                           Ручные запуски выполняются без проверки аренды.
+            job_run (dict, optional): Запись планового запуска из JobRunStore
+        """
+        logger.info(f"Выполняется запланированное задание скрапинга в {datetime.now()}")
+        
+        try:
+            stage_outputs = self.job_store.get_stage_outputs(job_run['id']) if job_run else {}
+            
+            # Сообщение уже отправлено в этом запуске - повторно не отправляем,
+            # а только завершаем оставшиеся этапы
+            sent = stage_outputs.get('send')
+            if sent is None and 'sending' in stage_outputs:
+                # Процесс остановился во время отправки: сообщение могло уйти, а подтверждение -
+                # не сохраниться. Повторная отправка дала бы дубль в канале, поэтому отправка
+                # считается выполненной без message_id
+                logger.warning(f"Запуск {job_run['scheduled_for']} прерван во время отправки, повторная отправка пропущена")
+                sent = dict(stage_outputs['sending'], message_id=None, result=True)
+                self.job_store.complete_stage(job_run['id'], 'send', sent)
             
-            # ИЗМЕНЕНО: Отправляем сообщение ВСЕГДА (каждый день в назначенное время)
-            logger.info("ИЗМЕНЕНО: Отправляем ежедневное сообщение независимо от изменения рейтинга")
+            # Проверяем соединение с Telegram
+            if sent is None and not self.telegram_bot.test_connection():
+                logger.error("Ошибка соединения с Telegram. Задание прервано.")
+                return False
             
-            # ИЗМЕНЕНО: Отправляем ежедневное сообщение независимо от изменения рейтинга
-            result = self._send_combined_message(rankings_data, fear_greed_data, altseason_data, market_breadth_data, chart_data)
+            rank_data = self._stage(job_run, stage_outputs, 'rank', self._collect_rank_data)
+            current_rank = rank_data['rank']
+            current_date = rank_data['date']
             
-            # Обновляем последний отправленный рейтинг независимо от результата отправки
-            # Это поможет избежать множественных сообщений при сбоях отправки
-            previous_rank = self.last_sent_rank
-            self.last_sent_rank = current_rank
-            logger.info(f"Обновлен последний отправленный рейтинг: {previous_rank} → {self.last_sent_rank}")
+            logger.info(f"ИСПРАВЛЕНИЕ: Текущий рейтинг из JSON: {current_rank} на дату {current_date}")
             
-            # Сохраняем рейтинг в файл для восстановления при перезапуске
-            # Делаем это синхронно с обновлением переменной, чтобы избежать рассинхронизации
-            try:
-                with open(self.rank_history_file, "w") as f:
-                    f.write(str(current_rank) if current_rank is not None else "None")
-                logger.info(f"Рейтинг {current_rank} сохранен в файл {self.rank_history_file}")
+            # Получаем данные индекса страха и жадности
+            fear_greed_data = self._stage(job_run, stage_outputs, 'fear_greed', self._collect_fear_greed_data)
                 
-                # Проверка записи в файл
-                if os.path.exists(self.rank_history_file):
-                    with open(self.rank_history_file, "r") as check_file:
-                        saved_value = check_file.read().strip()
-                        if saved_value != str(current_rank):
-                            logger.error(f"Ошибка записи: в файле {saved_value}, должно быть {current_rank}")
-                            
-                # Дополнительно, сохраняем в JSON-историю через HistoryAPI
-                try:
-                    # Импортируем API истории
-                    from history_api import HistoryAPI
-                    
-                    # Создаем экземпляр API и сохраняем данные
-                    history_api = HistoryAPI(self.data_dir)
-                    
-                    # Сохраняем рейтинг в историю с предыдущим значением для подсчета изменения
-                    history_api.save_rank_history(
-                        rank=current_rank, 
-                        previous_rank=previous_rank
-                    )
-                    
-                    # Если доступны данные индекса страха и жадности, сохраняем и их
-                    if fear_greed_data and 'value' in fear_greed_data and 'classification' in fear_greed_data:
-                        history_api.save_fear_greed_history(
-                            value=int(fear_greed_data['value']), 
-                            classification=fear_greed_data['classification']
-                        )
-                        
-                    # Если доступны данные Altcoin Season Index, сохраняем их
-                    if (altseason_data and 
-                        'signal' in altseason_data and 
-                        'description' in altseason_data and 
-                        'status' in altseason_data and 
-                        'index' in altseason_data and 
-                        'btc_performance' in altseason_data and
-                        altseason_data['signal'] is not None):
-                        # Сохраняем данные Altcoin Season Index в историю
-                        try:
-                            history_api.save_altseason_index_history(
-                                signal=altseason_data['signal'],
-                                description=altseason_data['description'],
-                                status=altseason_data['status'],
-                                index=altseason_data['index'],
-                                btc_performance=altseason_data['btc_performance']
-                            )
-                            logger.info(f"Сохранены данные Altcoin Season Index в историю: {altseason_data['signal']} - {altseason_data['status']}")
-                        except Exception as e:
-                            logger.warning(f"Ошибка при сохранении Altcoin Season Index в историю: {str(e)}")
-                        
-                    logger.info(f"История данных успешно сохранена в JSON-файлы")
-                except ImportError:
-                    # API истории недоступен, пропускаем сохранение в историю
-                    logger.debug("API истории недоступен. История рейтинга сохранена только в файл.")
-                except Exception as history_error:
-                    logger.error(f"Ошибка при сохранении истории в JSON-файлы: {str(history_error)}")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при сохранении рейтинга в файл: {str(e)}")
+            breadth = {}
+            if sent is None:
+                # ИСПРАВЛЕНИЕ: Загружаем данные ОДИН РАЗ и используем для расчета и графика
+                # Исторические цены (chart_data) нужны только в этом запуске и не сохраняются:
+                # после перезапуска график строится без них, а индекс альтсезона - через CoinGecko
+                breadth = self._stage(job_run, stage_outputs, 'market_breadth', self._collect_market_breadth_data,
+                                      persist=lambda output: {'market_breadth_data': output.get('market_breadth_data')}) or {}
+            
+            # Altcoin Season Index по той же матрице цен, что и Market Breadth
+            # (без отдельного запроса к CoinGecko, если данные загружены)
+            altseason_data = self._stage(job_run, stage_outputs, 'altseason',
+                                         lambda: self._collect_altseason_data(breadth.get('chart_data')))
+            
+            if sent is None:
+                market_breadth_data = breadth.get('market_breadth_data')
+                chart_data = breadth.get('chart_data')
+                
+                rankings_data = self._build_rankings_data(current_rank, current_date)
+                
+                # ИЗМЕНЕНО: Отправляем сообщение ВСЕГДА (каждый день в назначенное время)
+                logger.info("ИЗМЕНЕНО: Отправляем ежедневное сообщение независимо от изменения рейтинга")
+                
+                # Отметка "отправляется" фиксируется до отправки, чтобы после сбоя не отправить дубль
+                if job_run is not None:
+                    self.job_store.complete_stage(job_run['id'], 'sending', {'previous_rank': self.last_sent_rank})
+                
+                # ИЗМЕНЕНО: Отправляем ежедневное сообщение независимо от изменения рейтинга
+                result = self._send_combined_message(rankings_data, fear_greed_data, altseason_data, market_breadth_data, chart_data,
+                                                     fencing_token=fencing_token)
+                
+                if not result and fencing_token is not None and not self.leader_lease.check_token(fencing_token):
+                    # Лидерство перешло к другому процессу - историю и последний рейтинг не трогаем
+                    return False
+                
+                sent = {
+                    'previous_rank': self.last_sent_rank,
+                    'message_id': getattr(self.telegram_bot, 'last_message_id', None) if result else None,
+                    'result': result
+                }
+                if job_run is not None and result:
+                    self.job_store.complete_stage(job_run['id'], 'send', sent)
+                    self.job_store.set_message_id(job_run['id'], sent['message_id'])
+                elif job_run is not None:
+                    # Отправка не удалась - следующая попытка отправит сообщение снова
+                    self.job_store.discard_stage(job_run['id'], 'sending')
+            else:
+                logger.info(f"Сообщение уже отправлено в этом запуске (message_id={sent.get('message_id')}), повторная отправка пропущена")
+            
+            result = sent['result']
+            
+            # Последний отправленный рейтинг обновляется только после успешной отправки,
+            # иначе повторная попытка показала бы тренд относительно неотправленного значения
+            previous_rank = sent['previous_rank']
+            if result:
+                self.last_sent_rank = current_rank
+                logger.info(f"Обновлен последний отправленный рейтинг: {previous_rank} → {self.last_sent_rank}")
+            
+            self._stage(job_run, stage_outputs, 'history',
+                        lambda: self._save_job_history(current_rank, previous_rank, fear_greed_data, altseason_data))
             
             return result
                 
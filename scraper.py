@@ -7,6 +7,7 @@ from datetime import datetime
 
 from config import APP_ID, TELEGRAM_SOURCE_CHANNEL
 from logger import logger
+from http_cache import cached_get
 from sensortower_api import SensorTowerParser
 from json_rank_reader import get_rank_from_json, get_latest_rank_date
 
@@ -55,7 +56,7 @@ class SensorTowerScraper:
             
             try:
                 # New request with additional headers to prevent caching
-                response = requests.get(url, headers=headers, timeout=10)
+                response = cached_get(url, headers=headers, timeout=10)
                 
                 if response.status_code != 200:
                     logger.error(f"Failed to fetch channel web page: HTTP {response.status_code}")
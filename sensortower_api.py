@@ -2,6 +2,7 @@ import requests
 import json
 import logging
 from datetime import datetime
+from http_cache import cached_get
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +53,7 @@ class SensorTowerParser:
                 'Pragma': 'no-cache'
             }
             
-            response = requests.get(self.url, headers=headers, timeout=30)
+            response = cached_get(self.url, headers=headers, timeout=30)
             response.raise_for_status()
             data = response.json()
             logger.info("Successfully fetched data from SensorTower API")
@@ -51,6 +51,10 @@ else
     [ -f "$TARGET_DIR/trends_history.json" ] && cp "$TARGET_DIR/trends_history.json" "$BACKUP_DIR/"
     [ -f "$TARGET_DIR/fear_greed_history.json" ] && cp "$TARGET_DIR/fear_greed_history.json" "$BACKUP_DIR/"
     [ -f "$TARGET_DIR/rank_history.txt" ] && cp "$TARGET_DIR/rank_history.txt" "$BACKUP_DIR/"
+    # История HISTORY_BACKEND=jsonl/sqlite, агрегаты и архивы уплотнения
+    for f in "$TARGET_DIR"/*_history.jsonl "$TARGET_DIR"/*_rollups.json "$TARGET_DIR"/*_archive.jsonl.gz "$TARGET_DIR"/history.db*; do
+        [ -f "$f" ] && cp "$f" "$BACKUP_DIR/"
+    done
     
     # Бэкап логов
     [ -f "$TARGET_DIR/sensortower_bot.log" ] && cp "$TARGET_DIR/sensortower_bot.log" "$BACKUP_DIR/"
@@ -84,7 +88,7 @@ EOL
     # Сброс всех локальных изменений, сохраняя неотслеживаемые файлы, указанные в .gitignore
     echo "Resetting Git repository state..."
     git reset --hard
-    git clean -fd -e .env -e venv/ -e requirements.txt -e "*.log" -e "*.json" -e "rank_history.txt" -e manual_operation.lock -e coinbasebot.lock
+    git clean -fd -e .env -e venv/ -e requirements.txt -e "*.log" -e "*.json" -e "*.jsonl" -e "*.jsonl.gz" -e "*.db*" -e "rank_history.txt" -e manual_operation.lock -e coinbasebot.lock
     
     # Переключаемся на нужную ветку
     git checkout "$BRANCH"
@@ -106,6 +110,9 @@ EOL
     [ -f "$BACKUP_DIR/trends_history.json" ] && cp "$BACKUP_DIR/trends_history.json" "$TARGET_DIR/"
     [ -f "$BACKUP_DIR/fear_greed_history.json" ] && cp "$BACKUP_DIR/fear_greed_history.json" "$TARGET_DIR/"
     [ -f "$BACKUP_DIR/rank_history.txt" ] && cp "$BACKUP_DIR/rank_history.txt" "$TARGET_DIR/"
+    for f in "$BACKUP_DIR"/*_history.jsonl "$BACKUP_DIR"/*_rollups.json "$BACKUP_DIR"/*_archive.jsonl.gz "$BACKUP_DIR"/history.db*; do
+        [ -f "$f" ] && cp "$f" "$TARGET_DIR/"
+    done
     [ -f "$BACKUP_DIR/sensortower_bot.log" ] && cp "$BACKUP_DIR/sensortower_bot.log" "$TARGET_DIR/"
     [ -f "$BACKUP_DIR/google_trends_debug.log" ] && cp "$BACKUP_DIR/google_trends_debug.log" "$TARGET_DIR/"
     
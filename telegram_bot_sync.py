@@ -12,6 +12,8 @@ class TelegramBotSync:
         self.token = token
         self.channel_id = channel_id
         self.api_url = f"https://api.telegram.org/bot{token}"
+        # ID последнего успешно отправленного сообщения
+        self.last_message_id = None
         
     def send_message(self, message):
         """
@@ -37,7 +39,11 @@ class TelegramBotSync:
             response = requests.post(url, data=data, timeout=30)
             
             if response.status_code == 200:
-                logger.info("ИСПРАВЛЕНИЕ: Сообщение отправлено в Telegram (sync)")
+                try:
+                    self.last_message_id = response.json().get('result', {}).get('message_id')
+                except ValueError:
+                    self.last_message_id = None
+                logger.info(f"ИСПРАВЛЕНИЕ: Сообщение отправлено в Telegram (sync), message_id={self.last_message_id}")
                 return True
             else:
                 logger.error(f"ИСПРАВЛЕНИЕ: Ошибка HTTP {response.status_code}: {response.text}")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Тест фоновой записи истории (HistoryWriter) при временных ошибках хранилища
+
+Хранилище подменяется: первые попытки записи завершаются ошибкой, затем
+запись проходит. Проверяется, что записи не теряются, сохраняют порядок
+и записываются один раз после восстановления хранилища.
+"""
+
+import os
+import tempfile
+import logging
+from history_writer import HistoryWriter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FlakyStore:
+    """Хранилище, которое не сохраняет первые `failures` пакетов"""
+
+    def __init__(self, file_path, failures, raise_error=False):
+        self.file_path = file_path
+        self.failures = failures
+        self.raise_error = raise_error
+        self.attempts = 0
+        self.records = []
+
+    def append_many(self, records):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            if self.raise_error:
+                raise OSError("disk unavailable")
+            return False
+        self.records.extend(records)
+        return True
+
+
+def _write(store, count):
+    writer = HistoryWriter(flush_interval=0.05, retry_delay=0.01, max_retry_delay=0.05)
+    written = []
+    try:
+        for i in range(count):
+            writer.submit(store, {"i": i}, on_written=written.extend)
+        assert writer.flush(timeout=5)
+    finally:
+        writer.stop()
+    return written
+
+
+def test_entries_are_written_after_store_recovers():
+    """Несохраненный пакет повторяется, пока хранилище не восстановится"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = FlakyStore(os.path.join(directory, "rank_history.jsonl"), failures=3)
+        written = _write(store, 5)
+
+    logger.info(f"Попыток записи: {store.attempts}")
+    assert store.attempts > 3
+    assert store.records == [{"i": i} for i in range(5)]
+    assert written == store.records
+
+
+def test_store_exception_does_not_drop_entries():
+    """Исключение хранилища не теряет записи и не останавливает поток записи"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = FlakyStore(os.path.join(directory, "fear_greed_history.jsonl"), failures=2, raise_error=True)
+        _write(store, 3)
+
+    assert store.records == [{"i": i} for i in range(3)]
+
+
+if __name__ == "__main__":
+    test_entries_are_written_after_store_recovers()
+    test_store_exception_does_not_drop_entries()
+    logger.info("Все проверки пройдены")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Тест ряда рейтинга из parsed_ranks.json (RankSeriesReader)
+
+Проверяется, что дата без рейтинга (rank = null) остается в ряду:
+текущий рейтинг за такую дату - None, а не значение за предыдущий день.
+"""
+
+import os
+import json
+import tempfile
+import logging
+from json_rank_reader import RankSeriesReader
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _reader(directory, entries):
+    path = os.path.join(directory, "parsed_ranks.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    return RankSeriesReader(path)
+
+
+def test_null_rank_on_latest_date():
+    """Последняя дата без рейтинга возвращается как (None, дата)"""
+    with tempfile.TemporaryDirectory() as directory:
+        reader = _reader(directory, [
+            {"date": "2025-05-01", "rank": 120},
+            {"date": "2025-05-02", "rank": None},
+        ])
+        assert reader.get_latest() == (None, "2025-05-02")
+        assert reader.get_rank_on("2025-05-01") == 120
+        assert reader.get_rank_on("2025-05-02") is None
+        assert reader.get_range("2025-05-01", "2025-05-02") == [
+            {"date": "2025-05-01", "rank": 120},
+            {"date": "2025-05-02", "rank": None},
+        ]
+
+
+def test_last_entry_per_date_wins():
+    """Из нескольких записей за дату используется последняя в файле"""
+    with tempfile.TemporaryDirectory() as directory:
+        reader = _reader(directory, [
+            {"date": "2025-05-02", "rank": None},
+            {"date": "2025-05-01", "rank": 120},
+            {"date": "2025-05-02", "rank": 115},
+        ])
+        assert reader.get_latest() == (115, "2025-05-02")
+
+
+if __name__ == "__main__":
+    test_null_rank_on_latest_date()
+    test_last_entry_per_date_wins()
+    logger.info("Все проверки пройдены")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Тест инкрементального режима rnk.py - окно запроса определяется рядом Coinbase
+
+Запросы к SensorTower подменяются: проверяется, с какой даты запрашивается
+каждый пакет приложений, когда одно приложение корзины еще без ряда,
+а другое давно не обновлялось.
+"""
+
+import os
+import json
+import tempfile
+import logging
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, timedelta
+from rnk import SensorTowerParser
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COINBASE = SensorTowerParser.APP_ID
+STALE_APP = "1436799971"
+NEW_APP = "1481947260"
+PRIMARY_KEY = "/".join(SensorTowerParser.PRIMARY_SERIES)
+
+
+def _day(days_ago):
+    return (datetime.utcnow() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+
+
+def _column(dates):
+    category, chart = SensorTowerParser.PRIMARY_SERIES
+    return {"category": category, "chart": chart, "dates": dates, "ranks": [100] * len(dates)}
+
+
+def _run_parser(directory, existing, stored_apps):
+    """Запускает run() с подмененными запросами и возвращает {app_ids пакета: start_date}"""
+    save_path = os.path.join(directory, "parsed_ranks.json")
+    series_path = os.path.join(directory, "rank_series.json")
+    with open(save_path, "w", encoding="utf-8") as f:
+        json.dump(existing, f)
+    with open(series_path, "w", encoding="utf-8") as f:
+        json.dump({"country": "US", "apps": stored_apps}, f)
+
+    parser = SensorTowerParser(app_ids={STALE_APP: "Binance", NEW_APP: "Kraken"})
+    requested = {}
+
+    def fake_fetch_data(url=None):
+        query = parse_qs(urlsplit(url).query)
+        requested[tuple(query["app_ids[]"])] = query["start_date"][0]
+        return {}
+
+    parser.fetch_data = fake_fetch_data
+    parser.run(save_path=save_path, series_path=series_path)
+    return requested
+
+
+def test_missing_and_stale_apps():
+    """Новое приложение запрашивается за окно по умолчанию, отстающее не расширяет окно"""
+    last_coinbase = _day(2)
+    existing = [{"date": _day(3), "rank": 120}, {"date": last_coinbase, "rank": 110}]
+    stored_apps = {
+        COINBASE: {"name": "Coinbase", "series": {PRIMARY_KEY: _column([_day(3), last_coinbase])}},
+        STALE_APP: {"name": "Binance", "series": {PRIMARY_KEY: _column([_day(400)])}},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        requested = _run_parser(directory, existing, stored_apps)
+
+    logger.info(f"Запрошенные пакеты: {requested}")
+    assert requested[(COINBASE, STALE_APP)] == last_coinbase
+    assert requested[(NEW_APP,)] == _day(30)
+
+
+def test_backfill_window_is_capped():
+    """После долгого перерыва окно ограничено RANK_MAX_BACKFILL_DAYS"""
+    existing = [{"date": _day(1000), "rank": 120}]
+    stored_apps = {STALE_APP: {"series": {PRIMARY_KEY: _column([_day(1000)])}},
+                   NEW_APP: {"series": {PRIMARY_KEY: _column([_day(5)])}}}
+    with tempfile.TemporaryDirectory() as directory:
+        requested = _run_parser(directory, existing, stored_apps)
+
+    from config import RANK_MAX_BACKFILL_DAYS
+    logger.info(f"Запрошенные пакеты: {requested}")
+    assert requested == {(COINBASE, STALE_APP, NEW_APP): _day(RANK_MAX_BACKFILL_DAYS)}
+
+
+if __name__ == "__main__":
+    test_missing_and_stale_apps()
+    test_backfill_window_is_capped()
+    logger.info("Все проверки пройдены")
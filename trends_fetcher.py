@@ -0,0 +1,132 @@
+import time
+import threading
+from datetime import datetime, timedelta
+from pytrends.request import TrendReq
+from pytrends.exceptions import TooManyRequestsError
+from logger import logger
+
+
+class TrendsFetcher:
+    """
+    Запросы к Google Trends через одну переиспользуемую сессию pytrends
+
+    Слова группируются до пяти в запрос с опорным словом (первое в списке).
+    Google Trends нормирует все слова запроса на общую шкалу (максимум по всем
+    словам = 100) и округляет значения до целых, поэтому в один запрос стоит
+    объединять слова близкой популярности (например, "buy crypto" и
+    "crypto crash"): рядом с популярным словом ("bitcoin") редкие слова
+    превращаются в 0-1.
+
+    Для каждого слова возвращается relative - среднее относительно собственного
+    пика (=100), на котором настроены пороги сигналов; от общей шкалы оно не
+    зависит. shared - среднее на шкале опорного слова первого запроса.
+    """
+
+    MAX_KEYWORDS = 5
+
+    def __init__(self, locale='en-US', geo='', timeframe_days=30, retries=3, initial_delay=10, timeout=(10, 25)):
+        """
+        Args:
+            locale (str): Локаль интерфейса Google Trends (hl)
+            geo (str): Регион ('' - весь мир, 'US', 'KR', ...)
+            timeframe_days (int): Длина периода в днях
+            retries (int): Количество попыток запроса при 429 Too Many Requests
+            initial_delay (int): Начальная задержка между попытками в секундах
+            timeout (tuple): Таймауты соединения и чтения HTTP-запроса в секундах
+        """
+        self.locale = locale
+        self.geo = geo
+        self.timeframe_days = timeframe_days
+        self.retries = retries
+        self.initial_delay = initial_delay
+        self.timeout = timeout
+        self._pytrends = None
+        self._lock = threading.Lock()
+
+    def _session(self):
+        """Одна сессия pytrends (cookies и токены) на все запросы этого экземпляра"""
+        if self._pytrends is None:
+            self._pytrends = TrendReq(hl=self.locale, tz=0, timeout=self.timeout)
+        return self._pytrends
+
+    def _timeframe(self):
+        today = datetime.utcnow().date()
+        start = today - timedelta(days=self.timeframe_days)
+        return f"{start} {today}"
+
+    def plan_payloads(self, keywords):
+        """
+        Делит ключевые слова на минимальное число запросов
+
+        Args:
+            keywords (list): Ключевые слова (первое используется как опорное)
+
+        Returns:
+            list: Списки ключевых слов для каждого запроса
+        """
+        keywords = list(dict.fromkeys(keywords))
+        if len(keywords) <= self.MAX_KEYWORDS:
+            return [keywords]
+        anchor, rest = keywords[0], keywords[1:]
+        size = self.MAX_KEYWORDS - 1
+        return [[anchor] + rest[i:i + size] for i in range(0, len(rest), size)]
+
+    def _interest_over_time(self, payload):
+        """Выполняет один запрос; при 429 повторяет с удвоением задержки"""
+        delay = self.initial_delay
+        pytrends = self._session()
+        for attempt in range(1, self.retries + 1):
+            try:
+                pytrends.build_payload(payload, cat=0, timeframe=self._timeframe(), geo=self.geo)
+                return pytrends.interest_over_time()
+            except TooManyRequestsError:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Google Trends 429 for {payload} (attempt {attempt}/{self.retries}), retry in {delay}s")
+                time.sleep(delay)
+                delay *= 2
+        return None
+
+    def fetch(self, keywords):
+        """
+        Получает интерес к ключевым словам минимальным числом запросов
+
+        Args:
+            keywords (list): Ключевые слова близкой популярности (первое - опорное)
+
+        Returns:
+            dict: {слово: {'relative': float, 'shared': float}}
+
+        Raises:
+            TooManyRequestsError: если Google Trends ограничил запросы после всех попыток
+            ValueError: если Google Trends вернул пустой ответ
+        """
+        payloads = self.plan_payloads(keywords)
+        scores = {}
+        anchor_reference = None
+        with self._lock:
+            for payload in payloads:
+                data = self._interest_over_time(payload)
+                if data is None or data.empty:
+                    raise ValueError(f"Empty Google Trends response for {payload}")
+                # Отфильтровываем строку за текущий (неполный) день
+                if 'isPartial' in data.columns:
+                    data = data[~data['isPartial'].astype(bool)]
+
+                # Приведение к шкале первого запроса по опорному слову
+                anchor_mean = data[payload[0]].mean()
+                if anchor_reference is None:
+                    anchor_reference = anchor_mean
+                factor = anchor_reference / anchor_mean if anchor_mean else 1.0
+
+                for term in payload:
+                    if term in scores:
+                        continue
+                    series = data[term]
+                    peak = series.max()
+                    scores[term] = {
+                        'relative': float(series.mean() / peak * 100) if peak else 0.0,
+                        'shared': float(series.mean() * factor),
+                    }
+        logger.info(f"Google Trends: {len(keywords)} keywords fetched in {len(payloads)} request(s)")
+        return scores
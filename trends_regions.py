@@ -0,0 +1,201 @@
+import json
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from logger import logger
+from history_storage import atomic_write
+from trends_sampler import get_trends_sampler
+
+
+class RegionalTrendsPulse:
+    """
+    FOMO/страх Google Trends по регионам и взвешенный глобальный пульс
+
+    Каждый регион опрашивается своим сэмплером (общий кеш, суточный бюджет
+    и выключатель после 429). Выборка по регионам выполняется параллельно;
+    медленный регион не задерживает остальные: его запрос продолжается в фоне,
+    а до завершения используются последние успешные значения из кеша.
+    Ряды FOMO/страха по регионам сохраняются в файл истории.
+    """
+
+    MAX_POINTS = 500
+
+    def __init__(self, fomo_term, fear_term, regions=None, history_file=None, timeout=None):
+        """
+        Args:
+            fomo_term (str): Ключевое слово FOMO
+            fear_term (str): Ключевое слово страха
+            regions (dict, optional): Веса регионов {geo: вес} (по умолчанию TRENDS_REGIONS из config.py)
+            history_file (str, optional): Файл рядов по регионам (по умолчанию TRENDS_REGIONS_HISTORY_FILE)
+            timeout (float, optional): Ожидание одного цикла выборки в секундах (по умолчанию TRENDS_REGION_TIMEOUT)
+        """
+        from config import TRENDS_REGIONS, TRENDS_REGIONS_HISTORY_FILE, TRENDS_REGION_TIMEOUT
+        self.fomo_term = fomo_term
+        self.fear_term = fear_term
+        self.regions = dict(regions or TRENDS_REGIONS)
+        self.history_file = history_file or TRENDS_REGIONS_HISTORY_FILE
+        self.timeout = TRENDS_REGION_TIMEOUT if timeout is None else timeout
+        self.samplers = {geo: get_trends_sampler(geo) for geo in self.regions}
+        for sampler in self.samplers.values():
+            sampler.track([fomo_term, fear_term])
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.regions), 1), thread_name_prefix="trends-region")
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def sample_due(self):
+        """
+        Параллельно обновляет устаревшие значения регионов
+
+        Регион, чей предыдущий запрос еще выполняется, пропускается.
+        Ожидание ограничено timeout; незавершенные запросы продолжаются в фоне.
+
+        Returns:
+            list: Регионы, запросы которых не завершились за timeout
+        """
+        with self._lock:
+            for geo, sampler in self.samplers.items():
+                future = self._pending.get(geo)
+                if future is None or future.done():
+                    self._pending[geo] = self._executor.submit(sampler.sample_once)
+            futures = dict(self._pending)
+
+        _, not_done = wait(futures.values(), timeout=self.timeout)
+        slow = [geo for geo, future in futures.items() if future in not_done]
+        if slow:
+            logger.warning(f"Google Trends regions still pending after {self.timeout}s: {', '.join(slow)}")
+        self.record_series()
+        return slow
+
+    def get_regions(self):
+        """
+        Последние значения по регионам из кеша (без запросов к Google)
+
+        Returns:
+            dict: {geo: {'fomo_score', 'fear_score', 'fomo_to_fear_ratio', 'fetched_at', 'stale'}}
+        """
+        regions = {}
+        for geo, sampler in self.samplers.items():
+            cached = sampler.get_cached([self.fomo_term, self.fear_term])
+            if self.fomo_term not in cached or self.fear_term not in cached:
+                continue
+            fomo = cached[self.fomo_term]
+            fear = cached[self.fear_term]
+            regions[geo] = {
+                'fomo_score': round(fomo['relative'], 2),
+                'fear_score': round(fear['relative'], 2),
+                'fomo_to_fear_ratio': round(fomo['relative'] / max(fear['relative'], 1), 3),
+                'fetched_at': min(fomo['fetched_at'], fear['fetched_at']),
+                'stale': fomo['stale'] or fear['stale'],
+            }
+        return regions
+
+    def get_pulse(self):
+        """
+        Взвешенный глобальный пульс по регионам с данными
+
+        Веса нормируются на регионы, для которых есть значения; coverage - доля
+        суммарного веса, покрытая данными.
+
+        Returns:
+            dict: {'fomo_score', 'fear_score', 'fomo_to_fear_ratio', 'coverage', 'regions'} или None
+        """
+        regions = self.get_regions()
+        weights = {geo: self.regions[geo] for geo in regions if self.regions[geo] > 0}
+        total = sum(weights.values())
+        if not total:
+            return None
+        fomo = sum(regions[geo]['fomo_score'] * weight for geo, weight in weights.items()) / total
+        fear = sum(regions[geo]['fear_score'] * weight for geo, weight in weights.items()) / total
+        return {
+            'fomo_score': round(fomo, 2),
+            'fear_score': round(fear, 2),
+            'fomo_to_fear_ratio': round(fomo / max(fear, 1), 3),
+            'coverage': round(total / sum(self.regions.values()), 3),
+            'regions': regions,
+        }
+
+    def load_series(self):
+        """
+        Returns:
+            dict: {geo: [{'timestamp', 'fomo_score', 'fear_score', 'fomo_to_fear_ratio'}]}
+        """
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record_series(self):
+        """
+        Дописывает в ряды регионов новые значения (по одной точке на выборку)
+
+        Returns:
+            int: Количество добавленных точек
+        """
+        series = self.load_series()
+        added = 0
+        for geo, values in self.get_regions().items():
+            timestamp = datetime.utcfromtimestamp(values['fetched_at']).strftime("%Y-%m-%d %H:%M:%S")
+            points = series.setdefault(geo, [])
+            if points and points[-1]['timestamp'] >= timestamp:
+                continue
+            points.append({
+                'timestamp': timestamp,
+                'fomo_score': values['fomo_score'],
+                'fear_score': values['fear_score'],
+                'fomo_to_fear_ratio': values['fomo_to_fear_ratio'],
+            })
+            del points[:-self.MAX_POINTS]
+            added += 1
+        if added:
+            atomic_write(self.history_file, json.dumps(series, indent=2))
+        return added
+
+    def _loop(self, should_run, interval):
+        while not self._stop_event.is_set():
+            try:
+                if should_run is None or should_run():
+                    self.sample_due()
+            except Exception as e:
+                logger.error(f"Google Trends regional sampler error: {str(e)}")
+            self._stop_event.wait(interval)
+
+    def start(self, should_run=None):
+        """
+        Запускает фоновую выборку по регионам
+
+        Args:
+            should_run (callable, optional): Проверка перед каждой выборкой (например, лидерство процесса)
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        # Интервал выборки как у сэмплеров: суточный бюджет распределяется равномерно
+        sampler = next(iter(self.samplers.values()), None)
+        interval = max(86400.0 / max(sampler.daily_budget, 1), 60.0) if sampler else 3600.0
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, args=(should_run, interval), name="trends-regions")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+
+_regional_pulses = {}
+_regional_pulses_lock = threading.Lock()
+
+
+def get_regional_trends(fomo_term, fear_term):
+    """
+    Returns:
+        RegionalTrendsPulse: Общий для процесса региональный пульс для пары ключевых слов
+    """
+    with _regional_pulses_lock:
+        key = (fomo_term, fear_term)
+        if key not in _regional_pulses:
+            _regional_pulses[key] = RegionalTrendsPulse(fomo_term, fear_term)
+        return _regional_pulses[key]
@@ -0,0 +1,275 @@
+import json
+import time
+import threading
+from datetime import datetime
+from pytrends.exceptions import TooManyRequestsError
+from logger import logger
+from history_storage import atomic_write, file_lock
+from trends_fetcher import TrendsFetcher
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель запросов к Google Trends
+
+    После ответа 429 выключатель размыкается на cooldown секунд; каждое
+    следующее срабатывание подряд удваивает паузу (не больше max_cooldown).
+    По истечении паузы разрешается одна пробная попытка: успех замыкает
+    выключатель, новый 429 снова размыкает его.
+    """
+
+    def __init__(self, cooldown=1800, max_cooldown=6 * 3600, state=None):
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        state = state or {}
+        self.open_until = state.get('open_until', 0.0)
+        self.failures = state.get('failures', 0)
+
+    @property
+    def is_open(self):
+        return time.time() < self.open_until
+
+    def record_failure(self):
+        self.failures += 1
+        pause = min(self.cooldown * 2 ** (self.failures - 1), self.max_cooldown)
+        self.open_until = time.time() + pause
+        logger.warning(f"Google Trends circuit breaker opened for {int(pause)}s (failures in a row: {self.failures})")
+
+    def record_success(self):
+        if self.failures:
+            logger.info("Google Trends circuit breaker closed")
+        self.failures = 0
+        self.open_until = 0.0
+
+    def to_dict(self):
+        return {'open_until': self.open_until, 'failures': self.failures}
+
+
+class TrendsSampler:
+    """
+    Фоновая выборка Google Trends в пределах суточного бюджета запросов
+
+    Отслеживаемые слова (близкой популярности, например термины FOMO и страха)
+    запрашиваются общими запросами до пяти слов равномерно в течение суток
+    (не больше daily_budget запросов). Результаты кешируются по каждому слову
+    с TTL в файле кеша. Ежедневное задание и веб-страницы читают последние
+    успешные значения из кеша и не ждут Google. Состояние бюджета и выключателя
+    хранится в том же файле, поэтому переживает перезапуск.
+    """
+
+    def __init__(self, cache_path, daily_budget=24, ttl_hours=12, cooldown=1800, fetcher=None):
+        """
+        Args:
+            cache_path (str): Файл кеша значений, бюджета и состояния выключателя
+            daily_budget (int): Максимум запросов к Google Trends в сутки
+            ttl_hours (float): Время актуальности значения слова
+            cooldown (int): Начальная пауза после 429 в секундах
+            fetcher (TrendsFetcher, optional): Клиент Google Trends (по умолчанию без повторов)
+        """
+        self.cache_path = cache_path
+        self.daily_budget = daily_budget
+        self.ttl = ttl_hours * 3600
+        self.cooldown = cooldown
+        self.fetcher = fetcher or TrendsFetcher(retries=1)
+        self.keywords = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def track(self, keywords):
+        """Добавляет ключевые слова в фоновую выборку"""
+        with self._lock:
+            for keyword in keywords:
+                if keyword not in self.keywords:
+                    self.keywords.append(keyword)
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        # Значения прежнего формата без relative (общая шкала с "bitcoin") неточны для редких слов
+        state['terms'] = {key: entry for key, entry in state.get('terms', {}).items() if 'relative' in entry}
+        state.setdefault('budget', {})
+        state.setdefault('breaker', {})
+        return state
+
+    def _save(self, state):
+        atomic_write(self.cache_path, json.dumps(state, ensure_ascii=False, indent=2))
+
+    def _term_key(self, term):
+        return f"{self.fetcher.geo or 'world'}:{term}"
+
+    def get_cached(self, terms):
+        """
+        Возвращает последние успешные значения слов из кеша, независимо от TTL
+
+        Returns:
+            dict: {слово: {'relative', 'shared', 'fetched_at', 'stale'}} для слов, которые есть в кеше
+        """
+        state = self._load()
+        now = time.time()
+        result = {}
+        for term in terms:
+            entry = state['terms'].get(self._term_key(term))
+            if entry:
+                result[term] = dict(entry, stale=now - entry['fetched_at'] > self.ttl)
+        return result
+
+    def get_status(self):
+        """
+        Returns:
+            dict: Использование бюджета, состояние выключателя и возраст значений
+        """
+        state = self._load()
+        breaker = CircuitBreaker(self.cooldown, state=state['breaker'])
+        now = time.time()
+        return {
+            'budget_date': state['budget'].get('date'),
+            'requests_used': state['budget'].get('used', 0),
+            'daily_budget': self.daily_budget,
+            'breaker_open': breaker.is_open,
+            'breaker_open_for': round(max(breaker.open_until - now, 0)),
+            'terms': {key: round(now - entry['fetched_at']) for key, entry in state['terms'].items()},
+        }
+
+    def fetch_now(self, terms):
+        """
+        Запросы к Google Trends для слов (общими запросами до пяти слов, см.
+        TrendsFetcher.plan_payloads), если выключатель замкнут и бюджет не исчерпан
+
+        Без ожиданий и повторов: при 429 выключатель размыкается, оставшиеся запросы
+        не выполняются. Если бюджета хватает не на все запросы, выполняются первые.
+
+        Args:
+            terms (list): Ключевые слова близкой популярности (первое - опорное)
+
+        Returns:
+            dict: Значения полученных слов (как get_cached) или None, если ни одно не получено
+        """
+        payloads = self.fetcher.plan_payloads(terms)
+        # Бюджет резервируется под блокировкой, сами запросы выполняются без нее
+        with file_lock(self.cache_path):
+            state = self._load()
+            breaker = CircuitBreaker(self.cooldown, state=state['breaker'])
+            today = datetime.utcnow().strftime('%Y-%m-%d')
+            if state['budget'].get('date') != today:
+                state['budget'] = {'date': today, 'used': 0}
+            if breaker.is_open:
+                logger.info("Google Trends circuit breaker is open, request skipped")
+                return None
+            remaining = self.daily_budget - state['budget']['used']
+            if remaining <= 0:
+                logger.info(f"Google Trends daily budget ({self.daily_budget}) is used up, request skipped")
+                return None
+            payloads = payloads[:remaining]
+            state['budget']['used'] += len(payloads)
+            self._save(state)
+
+        scores = {}
+        rate_limited = False
+        for payload in payloads:
+            try:
+                scores.update(self.fetcher.fetch(payload))
+            except TooManyRequestsError:
+                rate_limited = True
+                break
+            except Exception as e:
+                logger.error(f"Google Trends sampling failed for {payload}: {str(e)}")
+
+        now = time.time()
+        with file_lock(self.cache_path):
+            state = self._load()
+            breaker = CircuitBreaker(self.cooldown, state=state['breaker'])
+            if rate_limited:
+                breaker.record_failure()
+            elif scores:
+                breaker.record_success()
+            for term, score in scores.items():
+                state['terms'][self._term_key(term)] = dict(score, fetched_at=now)
+            state['breaker'] = breaker.to_dict()
+            self._save(state)
+
+        if not scores:
+            return None
+        return {term: dict(score, fetched_at=now, stale=False) for term, score in scores.items()}
+
+    def sample_once(self):
+        """
+        Обновляет устаревшие слова одним общим запросом
+
+        Returns:
+            bool: True если запрос выполнялся
+        """
+        with self._lock:
+            keywords = list(self.keywords)
+        if not keywords:
+            return False
+        state = self._load()
+        now = time.time()
+        ages = {
+            term: now - state['terms'].get(self._term_key(term), {}).get('fetched_at', 0)
+            for term in keywords
+        }
+        if not any(age > self.ttl for age in ages.values()):
+            return False
+        # Все отслеживаемые слова запрашиваются вместе в исходном порядке (опорное - первое),
+        # чтобы значения shared оставались на одной шкале
+        return self.fetch_now(keywords) is not None
+
+    def _loop(self, should_run):
+        # Запросы распределяются равномерно по суткам в пределах бюджета
+        interval = max(86400.0 / max(self.daily_budget, 1), 60.0)
+        while not self._stop_event.is_set():
+            try:
+                if should_run is None or should_run():
+                    self.sample_once()
+            except Exception as e:
+                logger.error(f"Google Trends sampler error: {str(e)}")
+            self._stop_event.wait(interval)
+
+    def start(self, should_run=None):
+        """
+        Запускает фоновую выборку
+
+        Args:
+            should_run (callable, optional): Проверка перед каждой выборкой (например, лидерство процесса)
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, args=(should_run,), name="trends-sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+
+_trends_samplers = {}
+_trends_sampler_lock = threading.Lock()
+
+
+def get_trends_sampler(geo=''):
+    """
+    Args:
+        geo (str): Регион Google Trends ('' - весь мир)
+
+    Returns:
+        TrendsSampler: Общий для процесса сэмплер региона с настройками из config.py
+                       (все регионы используют один файл кеша, бюджет и выключатель)
+    """
+    with _trends_sampler_lock:
+        if geo not in _trends_samplers:
+            from config import TRENDS_CACHE_FILE, TRENDS_DAILY_BUDGET, TRENDS_TERM_TTL_HOURS, TRENDS_BREAKER_COOLDOWN
+            _trends_samplers[geo] = TrendsSampler(
+                TRENDS_CACHE_FILE,
+                daily_budget=TRENDS_DAILY_BUDGET,
+                ttl_hours=TRENDS_TERM_TTL_HOURS,
+                cooldown=TRENDS_BREAKER_COOLDOWN,
+                fetcher=TrendsFetcher(geo=geo, retries=1),
+            )
+        return _trends_samplers[geo]